@@ -0,0 +1,486 @@
+"""Static cycle counts, basic blocks and loop bounds for assembled programs"""
+
+import math
+
+try:
+    from optimizer import instruction_cycles, is_instruction, is_jump, writes_flags
+except ModuleNotFoundError:
+    from assembler.optimizer import instruction_cycles, is_instruction, is_jump, writes_flags
+
+
+# Instructions that replace the contents of A
+A_WRITERS = ('LDA', 'LDI', 'ADI', 'SBI', 'ADD', 'SUB')
+
+# Successor standing for code outside the program (running into the variables)
+UNKNOWN = 'unknown'
+
+# Unreachable and unbounded costs, as (lo, hi)
+UNREACHABLE = (math.inf, -math.inf)
+UNBOUNDED = (math.inf, math.inf)
+
+
+def finite(value: 'float') -> 'int|None':
+    return int(value) if math.isfinite(value) else None
+
+
+class Block:
+
+    def __init__(self, index: 'int'):
+        self.index = index
+        self.labels: 'list[str]' = []
+        self.instructions: 'list' = []
+        self.successors: 'list[int|str]' = []
+
+    @property
+    def name(self) -> 'str':
+        return self.labels[0] if self.labels else f'block{self.index}'
+
+    @property
+    def cycles(self) -> 'int':
+        """Clocks through the block when its closing jump, if any, is taken"""
+        return sum(instruction_cycles(i.machine) for i in self.instructions)
+
+    def edge_cycles(self, successors: 'list') -> 'tuple[int, int]':
+        """
+        (lo, hi) clocks through the block when leaving it for one of the
+        given successors. A conditional jump costs less when it falls
+        through to the following block (its second successor).
+        """
+        machine = self.last.machine
+        if machine.flag is None or not is_jump(machine):
+            return self.cycles, self.cycles
+        not_taken = self.cycles - instruction_cycles(machine) + instruction_cycles(machine, taken=False)
+        costs = []
+        for successor in successors:
+            if successor == self.successors[0]:
+                costs.append(self.cycles)
+            if successor == self.successors[1]:
+                costs.append(not_taken)
+        return (min(costs), max(costs)) if costs else (self.cycles, self.cycles)
+
+    @property
+    def last(self):
+        return self.instructions[-1]
+
+
+class Loop:
+
+    def __init__(self, header: 'int', blocks: 'set[int]'):
+        self.header = header
+        self.blocks = blocks
+        self.parent: 'Loop|None' = None
+        self.exiting: 'list[int]' = []
+        self.counter: 'str|None' = None
+        # None when unknown, math.inf when the counter never reaches its exit
+        self.trips: 'int|float|None' = None
+        self.iteration = UNBOUNDED
+        self.cost = UNBOUNDED
+
+
+class Analyzer:
+    """
+    Splits a parsed program (Visitor.statements) into basic blocks at labels
+    and jumps, finds its natural loops and bounds their trip counts where the
+    exit branch tests a counter variable with a compile time initializer.
+    """
+
+    def __init__(self, statements: 'list', labels: 'dict', variables: 'dict'):
+        self.statements = statements
+        self.labels = labels
+        self.variables = variables
+
+        self.blocks: 'list[Block]' = []
+        self.loops: 'list[Loop]' = []
+
+        self.build_blocks()
+        self.dominators = self.find_dominators()
+        self.find_loops()
+        for loop in self.loops:
+            self.bound_loop(loop)
+
+    def build_blocks(self):
+        label_block: 'dict[str, int]' = {}
+        block = Block(0)
+        for statement in self.statements:
+            if not is_instruction(statement):
+                if block.instructions:
+                    self.blocks.append(block)
+                    block = Block(len(self.blocks))
+                block.labels.append(statement.identifier)
+                label_block[statement.identifier] = block.index
+                continue
+
+            block.instructions.append(statement)
+            if is_jump(statement.machine) or statement.machine.mnemonic == 'HLT':
+                self.blocks.append(block)
+                block = Block(len(self.blocks))
+
+        if block.instructions:
+            self.blocks.append(block)
+
+        count = len(self.blocks)
+        for block in self.blocks:
+            following = block.index + 1 if block.index + 1 < count else UNKNOWN
+            machine = block.last.machine
+            if machine.mnemonic == 'HLT':
+                continue
+            if not is_jump(machine):
+                block.successors = [following]
+                continue
+
+            target = block.last.args[0].identifier if block.last.args else None
+            taken = label_block.get(target, UNKNOWN) if target in self.labels else UNKNOWN
+            if taken != UNKNOWN and taken >= count:
+                taken = UNKNOWN
+            block.successors = [taken] if machine.flag is None else [taken, following]
+
+    def predecessors(self, index: 'int') -> 'list[int]':
+        return [b.index for b in self.blocks if index in b.successors]
+
+    def find_dominators(self) -> 'list[set[int]]':
+        everything = set(range(len(self.blocks)))
+        dominators = [everything.copy() for _ in self.blocks]
+        if not self.blocks:
+            return dominators
+        dominators[0] = {0}
+
+        changed = True
+        while changed:
+            changed = False
+            for block in self.blocks[1:]:
+                preds = self.predecessors(block.index)
+                new = set.intersection(*[dominators[p] for p in preds]) if preds else set()
+                new = new | {block.index}
+                if new != dominators[block.index]:
+                    dominators[block.index] = new
+                    changed = True
+        return dominators
+
+    def find_loops(self):
+        loops: 'dict[int, Loop]' = {}
+        for block in self.blocks:
+            for successor in block.successors:
+                if successor == UNKNOWN or successor not in self.dominators[block.index]:
+                    continue
+                # Back edge: collect everything that reaches the latch without passing the header
+                body = {successor, block.index}
+                work = [block.index] if block.index != successor else []
+                while work:
+                    for p in self.predecessors(work.pop()):
+                        if p not in body:
+                            body.add(p)
+                            work.append(p)
+                if successor in loops:
+                    loops[successor].blocks |= body
+                else:
+                    loops[successor] = Loop(successor, body)
+
+        self.loops = sorted(loops.values(), key=lambda l: len(l.blocks))
+        for i, loop in enumerate(self.loops):
+            for outer in self.loops[i + 1:]:
+                if loop.header in outer.blocks:
+                    loop.parent = outer
+                    break
+            loop.exiting = sorted(
+                b for b in loop.blocks
+                if any(s == UNKNOWN or s not in loop.blocks for s in self.blocks[b].successors)
+            )
+
+    def stores(self, identifier: 'str') -> 'list':
+        return [
+            s for s in self.statements
+            if is_instruction(s) and s.mnemonic.upper() == 'STA' and s.args and s.args[0].identifier == identifier
+        ]
+
+    def constant(self, identifier: 'str') -> 'int|None':
+        """Compile time value of a variable that nothing stores to"""
+        variable = self.variables.get(identifier)
+        if variable is None or self.stores(identifier):
+            return None
+        return variable.initializer if variable.initializer is not None else 0
+
+    def trip_count(self, loop: 'Loop') -> 'int|float|None':
+        """
+        Number of times the exit branch runs, for loops shaped like
+        `lda v; (adi|sbi|add|sub) x; sta v; ...; jcc` where v is only ever
+        stored by that sta and x is a compile time value.
+        """
+        if loop.parent is not None or len(loop.exiting) != 1:
+            return None
+
+        block = self.blocks[loop.exiting[0]]
+        branch = block.last.machine
+        if branch.flag is None:
+            return None
+        latches = [b for b in loop.blocks if loop.header in self.blocks[b].successors]
+        if any(block.index not in self.dominators[b] for b in latches):
+            return None
+
+        body = block.instructions[:-1]
+        writers = [i for i, instr in enumerate(body) if writes_flags(instr.machine)]
+        if not writers:
+            return None
+        alu = body[writers[-1]]
+
+        load = None
+        for instr in reversed(body[:writers[-1]]):
+            if instr.mnemonic.upper() in A_WRITERS:
+                load = instr
+                break
+        if load is None or load.mnemonic.upper() != 'LDA' or not load.args:
+            return None
+        counter = load.args[0].identifier
+
+        stored = False
+        for instr in body[writers[-1] + 1:]:
+            if instr.mnemonic.upper() == 'STA' and instr.args and instr.args[0].identifier == counter:
+                stored = True
+                break
+            if instr.mnemonic.upper() in A_WRITERS:
+                break
+        variable = self.variables.get(counter)
+        if not stored or variable is None or variable.const or len(self.stores(counter)) != 1:
+            return None
+
+        mnemonic = alu.mnemonic.upper()
+        if mnemonic in ('ADI', 'SBI'):
+            try:
+                operand = alu.args[0].getValue(self.variables)
+            except (ValueError, IndexError):
+                return None
+        elif mnemonic in ('ADD', 'SUB') and alu.args and alu.args[0].identifier != counter:
+            operand = self.constant(alu.args[0].identifier)
+            if operand is None:
+                return None
+        else:
+            return None
+
+        taken_inside = block.successors[0] in loop.blocks
+        value = variable.initializer if variable.initializer is not None else 0
+        loop.counter = counter
+
+        seen = set()
+        trips = 0
+        while value not in seen:
+            seen.add(value)
+            trips += 1
+            total = (value - operand) & 0x1FF if mnemonic in ('SBI', 'SUB') else value + operand
+            value = total & 0xFF
+            flags = ((value == 0) << 1) | (total >> 8)
+            taken = (branch.flag.flag & flags) > 0
+            if branch.invert_flag:
+                taken = not taken
+            if taken != taken_inside:
+                return trips
+        return math.inf
+
+    def bounds(self, start, successors, cost, stop) -> 'tuple':
+        """
+        (lo, hi) cycles from entering start until an edge satisfying stop is
+        taken, where cost(node, target) is the (lo, hi) cost of leaving node
+        for target.
+        """
+        memo = {}
+
+        def visit(node, active):
+            if node in memo:
+                return memo[node]
+            if node in active:
+                return UNBOUNDED, True
+
+            active.add(node)
+            lo, hi = UNREACHABLE
+            cyclic = False
+            for target in successors(node):
+                node_lo, node_hi = cost(node, target)
+                if stop(target):
+                    sub_lo, sub_hi = 0, 0
+                else:
+                    (sub_lo, sub_hi), sub_cyclic = visit(target, active)
+                    cyclic |= sub_cyclic
+                lo = min(lo, node_lo + sub_lo)
+                hi = max(hi, node_hi + sub_hi)
+            active.discard(node)
+
+            if not cyclic:
+                memo[node] = ((lo, hi), False)
+            return (lo, hi), cyclic
+
+        return visit(start, set())[0]
+
+    def bound_loop(self, loop: 'Loop'):
+        exit_sentinel = ('exit',)
+
+        def block_cost(b, target):
+            block = self.blocks[b]
+            if target == exit_sentinel:
+                return block.edge_cycles([s for s in block.successors if s not in loop.blocks])
+            return block.edge_cycles([target])
+
+        # One full trip around the loop, header to header
+        loop.iteration = self.bounds(
+            loop.header,
+            lambda b: [s for s in self.blocks[b].successors if s in loop.blocks],
+            block_cost,
+            lambda t: t == loop.header,
+        )
+
+        # The last trip, from the header out through an exiting block
+        final = self.bounds(
+            loop.header,
+            lambda b: [s for s in self.blocks[b].successors if s in loop.blocks and s != loop.header]
+                      + ([exit_sentinel] if b in loop.exiting else []),
+            block_cost,
+            lambda t: t == exit_sentinel,
+        )
+
+        if not loop.exiting:
+            loop.trips = math.inf
+        else:
+            loop.trips = self.trip_count(loop)
+
+        if loop.trips == math.inf:
+            loop.cost = UNBOUNDED
+        elif loop.trips is None:
+            loop.cost = (final[0], math.inf)
+        else:
+            loop.cost = (
+                (loop.trips - 1) * loop.iteration[0] + final[0],
+                (loop.trips - 1) * loop.iteration[1] + final[1],
+            )
+
+    def outermost(self, index: 'int') -> 'Loop|None':
+        found = None
+        for loop in self.loops:
+            if index in loop.blocks:
+                found = loop
+        return found
+
+    def program_bounds(self, ends: 'tuple'=(None, UNKNOWN)) -> 'tuple':
+        """
+        (best, worst) cycles until the program ends, with loops collapsed into
+        single nodes. ends picks what counts as the end: None for HLT and
+        UNKNOWN for running off the last instruction into the variables.
+        """
+        if not self.blocks:
+            return 0, 0
+
+        def node(index):
+            if index == UNKNOWN:
+                return UNKNOWN
+            loop = self.outermost(index)
+            return ('loop', loop.header) if loop is not None else index
+
+        def members(n):
+            return self.outermost(n[1]).blocks if isinstance(n, tuple) else {n}
+
+        def successors(n):
+            if isinstance(n, tuple) and self.outermost(n[1]).trips == math.inf:
+                return []
+            targets = []
+            for b in members(n):
+                block = self.blocks[b]
+                if block.last.machine.mnemonic == 'HLT':
+                    targets.append(None)
+                for s in block.successors:
+                    if s == UNKNOWN or s not in members(n):
+                        targets.append(node(s))
+            return [t for t in targets if t in ends or t not in (None, UNKNOWN)]
+
+        def cost(n, target):
+            if isinstance(n, tuple):
+                return self.outermost(n[1]).cost
+            block = self.blocks[n]
+            return block.edge_cycles([s for s in block.successors if node(s) == target])
+
+        return self.bounds(node(0), successors, cost, lambda t: t in ends)
+
+    def report(self) -> 'dict':
+        # Running into the variables counts as an end for best and worst, so
+        # the bounds cover the program itself, but only HLT counts as halting
+        best, worst = self.program_bounds()
+        halts = math.isfinite(self.program_bounds((None,))[0])
+        falls_through = math.isfinite(self.program_bounds((UNKNOWN,))[0])
+        name = lambda s: s if s == UNKNOWN else self.blocks[s].name
+        return {
+            'blocks': [
+                {
+                    'name': block.name,
+                    'instructions': len(block.instructions),
+                    'cycles': block.cycles,
+                    'successors': [name(s) for s in block.successors],
+                }
+                for block in self.blocks
+            ],
+            'loops': [
+                {
+                    'header': self.blocks[loop.header].name,
+                    'blocks': [self.blocks[b].name for b in sorted(loop.blocks)],
+                    'counter': loop.counter,
+                    'trips': finite(loop.trips) if loop.trips is not None else None,
+                    'infinite': loop.trips == math.inf,
+                    'iteration': [finite(loop.iteration[0]), finite(loop.iteration[1])],
+                    'cycles': [finite(loop.cost[0]), finite(loop.cost[1])],
+                }
+                for loop in self.loops
+            ],
+            'best': finite(best),
+            'worst': finite(worst),
+            'halts': halts,
+            'falls_through': falls_through,
+        }
+
+
+def format_report(report: 'dict') -> 'str':
+    show = lambda v: '-' if v is None else str(v)
+    lines = [f'{"block":<16}{"instrs":>8}{"cycles":>8}  successors']
+    for block in report['blocks']:
+        lines.append(f'{block["name"]:<16}{block["instructions"]:>8}{block["cycles"]:>8}  {", ".join(block["successors"]) or "halt"}')
+
+    if report['loops']:
+        lines.append('')
+        lines.append(f'{"loop":<16}{"counter":<12}{"trips":>8}{"iteration":>14}{"cycles":>16}')
+        for loop in report['loops']:
+            trips = 'inf' if loop['infinite'] else show(loop['trips'])
+            iteration = '..'.join(show(v) for v in loop['iteration'])
+            cycles = '..'.join(show(v) for v in loop['cycles'])
+            lines.append(f'{loop["header"]:<16}{show(loop["counter"]):<12}{trips:>8}{iteration:>14}{cycles:>16}')
+
+    lines.append('')
+    if report['best'] is None:
+        lines.append('never halts')
+    else:
+        lines.append(f'best {report["best"]} cycles, worst {show(report["worst"])} cycles')
+        if report['falls_through']:
+            lines.append(('may run' if report['halts'] else 'never halts, runs') + ' off the end into the variables')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    try:
+        from assembler import Visitor
+    except ImportError:
+        from assembler.assembler import Visitor
+
+    parser = argparse.ArgumentParser(description='Static cycle count analysis of Eater programs')
+    parser.add_argument('file', type=str, help='assembly file')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='parser frontend')
+    parser.add_argument('-O', '--optimize', action='store_true', help='analyze the peephole optimized program')
+    parser.add_argument('-j', '--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('-b', '--budget', type=int, help='fail if the worst case exceeds this many cycles')
+
+    args = parser.parse_args()
+
+    visitor = Visitor()
+    visitor.parse(args.file, 16, frontend=args.frontend, optimize=args.optimize)
+
+    report = Analyzer(visitor.statements, visitor.labels, visitor.variables).report()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+    if args.budget is not None and (report['worst'] is None or report['worst'] > args.budget):
+        print(f'worst case exceeds budget of {args.budget} cycles', file=sys.stderr)
+        sys.exit(1)
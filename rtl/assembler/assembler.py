@@ -1,16 +1,32 @@
-from math import ceil
-from antlr4 import FileStream, CommonTokenStream
-
 try:
-    from build.eaterLexer import eaterLexer
-    from build.eaterParser import eaterParser
-    from build.eaterVisitor import eaterVisitor
     from machine import MachineCode, machine_dict
+    from frontend import Parser
+    from isa import IsaProfile, PROFILES
+    from optimizer import optimize
 except ModuleNotFoundError:
-    from assembler.build.eaterLexer import eaterLexer
-    from assembler.build.eaterParser import eaterParser
-    from assembler.build.eaterVisitor import eaterVisitor
     from assembler.machine import MachineCode, machine_dict
+    from assembler.frontend import Parser
+    from assembler.isa import IsaProfile, PROFILES
+    from assembler.optimizer import optimize
+
+# The ANTLR frontend is optional, since the hand-written one in frontend.py
+# accepts the same grammar without any dependencies
+try:
+    from antlr4 import InputStream, CommonTokenStream
+    from antlr4.error.ErrorListener import ErrorListener
+    try:
+        from build.eaterLexer import eaterLexer
+        from build.eaterParser import eaterParser
+        from build.eaterVisitor import eaterVisitor
+    except ModuleNotFoundError:
+        from assembler.build.eaterLexer import eaterLexer
+        from assembler.build.eaterParser import eaterParser
+        from assembler.build.eaterVisitor import eaterVisitor
+except ModuleNotFoundError:
+    eaterLexer = None
+    eaterParser = None
+    eaterVisitor = object
+    ErrorListener = object
 
 
 class Variable:
@@ -28,7 +44,7 @@ class Variable:
     def getAddress(self):
         return self.address
 
-    def getSize(self):
+    def getSize(self, isa: 'IsaProfile|None'=None):
         """Return the number of bytes this variable occupies"""
         return 1
 
@@ -50,7 +66,7 @@ class Label:
     def getAddress(self):
         return self.address
 
-    def getSize(self):
+    def getSize(self, isa: 'IsaProfile|None'=None):
         return 0
 
 
@@ -93,7 +109,7 @@ class Argument:
             return f'& {self.identifier}'
         elif self.identifier:
             return f'{self.identifier}'
-        elif self.number:
+        elif self.number is not None:
             return str(self.number)
         else:
             return '??'
@@ -106,15 +122,16 @@ class Instruction:
         self.args = args
 
         self.address = None
+        self.line: 'int|None' = None
+
+        # Resolved once here rather than on every size query and assembly pass
+        self.machine: 'MachineCode|None' = machine_dict.get(mnemonic.upper())
 
-    def getSize(self):
+    def getSize(self, isa: 'IsaProfile|None'=None):
         """Return the number of bytes this instruction occupies"""
-        try:
-            machine = machine_dict[self.mnemonic.upper()]
-            arg_bits = machine.arg_bits if machine.arg_bits is not None else 0
-            return ceil((4 + arg_bits) / 8) 
-        except KeyError:
+        if self.machine is None:
             raise NameError(f'Unknown mnemonic "{self.mnemonic}"')
+        return (isa or PROFILES['eater16']).instruction_size(self.machine)
     
     def setAddress(self, address: 'int'):
         self.address = address
@@ -126,45 +143,51 @@ class Error:
         pass
 
 
-def assemble_machine(instruction: 'Instruction', labels: 'dict[str: Label]', variables: 'dict[str: Variable]') -> 'list[int]':
-    try:
-        machine = machine_dict[instruction.mnemonic.upper()]
+class RaisingErrorListener(ErrorListener):
+    """Turn ANTLR syntax errors into SyntaxError, worded like frontend.py's"""
 
-        machine_bytes = [(machine.opcode & (2**MachineCode.OPCODE_BITS - 1)) << 4]
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        raise SyntaxError(f'line {line}:{column} {msg}')
 
-        if instruction.args:
-            if machine.arg_type is not None and len(instruction.args) != len(machine.arg_type):
-                raise ValueError(f'Instruction "{instruction.mnemonic}" does not match expected arguments')
 
-            args = []
-            
-            for arg, arg_type in zip(instruction.args, machine.arg_type):
-                if arg_type == MachineCode.LITERAL:
-                    try:
-                        value = arg.getValue(variables)
-                        args.append(value)
-                    except ValueError as e:
-                        raise e
-                elif arg_type == MachineCode.ADDRESS:
-                    try:
-                        address = arg.getAddress(variables, labels)
-                        args.append(address)
-                    except ValueError as e:
-                        raise e
-
-            machine_bytes[0] |= args[0] & 0xF
-
-            for arg in args[1:]:
-                machine_bytes.append(arg & 0xFF)
-        
-        return machine_bytes
-    except KeyError:
+def assemble_machine(instruction: 'Instruction', labels: 'dict[str: Label]', variables: 'dict[str: Variable]', isa: 'IsaProfile|None'=None) -> 'list[int]':
+    machine = instruction.machine
+    if machine is None:
         raise ValueError(f'Unkown mnemonic "{instruction.mnemonic}"')
 
+    args = []
+
+    if instruction.args:
+        if machine.arg_type is None or len(instruction.args) != len(machine.arg_type):
+            raise ValueError(f'Instruction "{instruction.mnemonic}" does not match expected arguments')
+
+        for arg, arg_type in zip(instruction.args, machine.arg_type):
+            if arg_type == MachineCode.LITERAL:
+                args.append(arg.getValue(variables))
+            elif arg_type == MachineCode.ADDRESS:
+                args.append(arg.getAddress(variables, labels))
+
+    return (isa or PROFILES['eater16']).encode(machine, args)
+
 
 class Visitor(eaterVisitor):
 
-    def parse(self, path, ram_size: 'int'):
+    FRONTENDS = ['antlr', 'fast']
+
+    def parse(self, path, ram_size: 'int|IsaProfile', frontend: 'str'='antlr', optimize: 'bool'=False):
+        with open(path, 'r', encoding='utf-8') as file:
+            self.parse_source(file.read(), ram_size, frontend, optimize)
+
+    def parse_source(self, source: 'str|bytes', ram_size: 'int|IsaProfile', frontend: 'str'='antlr', optimize: 'bool'=False):
+        """
+        Assemble source held in memory. The generated ANTLR parser keeps its
+        DFA cache on the class, so a long-lived process only pays for
+        building it on the first call.
+        """
+        if isinstance(source, bytes):
+            source = source.decode('utf-8')
+
+        self.isa = ram_size if isinstance(ram_size, IsaProfile) else IsaProfile.for_ram_size(ram_size)
 
         self.statements: 'list[Instruction|Label]' = []
         self.variables: 'dict[str: Variable]' = {}
@@ -172,17 +195,31 @@ class Visitor(eaterVisitor):
 
         self.statements_bytes: 'int' = 0
         self.variables_bytes: 'int' = 0
+        self.optimization: 'dict|None' = None
+
+        if frontend == 'antlr':
+            if eaterParser is None:
+                raise ModuleNotFoundError('The ANTLR frontend requires antlr4 and the generated build/ modules')
+            lexer = eaterLexer(InputStream(source))
+            lexer.removeErrorListeners()
+            lexer.addErrorListener(RaisingErrorListener())
+            parser = eaterParser(CommonTokenStream(lexer))
+            parser.removeErrorListeners()
+            parser.addErrorListener(RaisingErrorListener())
+            tree = parser.parse()
+
+            self.visitParse(tree)
+        elif frontend == 'fast':
+            parser = Parser(source)
+            self.visitStatements(parser.parse(), parser.lines)
+        else:
+            raise ValueError(f'Unknown frontend "{frontend}" (expected one of {Visitor.FRONTENDS})')
 
-        input_stream = FileStream(path)
-        lexer = eaterLexer(input_stream)
-        stream = CommonTokenStream(lexer)
-        parser = eaterParser(stream)
-        tree = parser.parse()
-        
-        self.visitParse(tree)
         self.resolveIdentifiers()
-        self.assignAddresses(ram_size)
-        self.program = self.assemble(ram_size)
+        if optimize:
+            self.optimize()
+        self.assignAddresses(self.isa.ram_size)
+        self.program = self.assemble(self.isa.ram_size)
 
     def get_program(self):
         return self.program, self.statements_bytes + self.variables_bytes
@@ -191,15 +228,19 @@ class Visitor(eaterVisitor):
         address = self.statements_bytes
         self.variables_bytes = 0
         for _, var in self.variables.items():
-            self.variables_bytes += var.getSize()
+            self.variables_bytes += var.getSize(self.isa)
             var.setAddress(address)
-            address += var.getSize()
+            address += var.getSize(self.isa)
 
     def assignStatementAddresses(self, ram_size):
         address = 0
         for statement in self.statements:
             statement.setAddress(address)
-            address += statement.getSize()
+            try:
+                address += statement.getSize(self.isa)
+            except NameError as e:
+                e.line = statement.line
+                raise
 
         self.statements_bytes = address
 
@@ -227,93 +268,170 @@ class Visitor(eaterVisitor):
             s = "s" if len(clashing_identifiers) > 1 else ""
             raise NameError(f'{clashing_identifiers} identifier{s} cannot be both variable{s} and label{s}')
 
-    def assemble(self, ram_size):
-        ram = [0 for _ in range(ram_size)]
-        address = 0
-
-        for statement in filter(lambda s: type(s) == Instruction, self.statements):
-            machine_bytes = assemble_machine(statement, self.labels, self.variables)
-            for byte in machine_bytes:
-                ram[address] = byte
-                address += 1
+    def optimize(self):
+        """Apply the peephole rules in optimizer.py before any addresses are assigned"""
+        self.optimization = optimize(self.statements, self.labels, self.variables, self.isa)
+        self.resolveIdentifiers()
 
-        for variable in filter(lambda v: not v.const, self.variables.values()):
-            ram[variable.getAddress()] = variable.initializer if variable.initializer is not None else 0
+    def assemble(self, ram_size):
+        # Instructions and then variables are laid out back to back from
+        # address 0, so the image can be built by appending in order
+        ram = bytearray()
 
+        for statement in self.statements:
+            if type(statement) == Instruction:
+                try:
+                    ram.extend(assemble_machine(statement, self.labels, self.variables, self.isa))
+                except ValueError as e:
+                    # Lets callers point at the offending source line
+                    e.line = statement.line
+                    raise
+
+        for variable in self.variables.values():
+            value = variable.initializer if variable.initializer is not None and not variable.const else 0
+            if not 0 <= value <= 0xFF:
+                raise ValueError(f'Initializer of "{variable.identifier}" ({value}) does not fit in a byte')
+            ram.append(value)
+
+        ram.extend(bytes(ram_size - len(ram)))
         return ram
 
-    def visitConstVar(self, ctx: eaterParser.ConstVarContext):
-        var = Variable(str(ctx.IDENTIFIER()), self.visitNumber(ctx), const=True)
+    def addVariable(self, var: 'Variable'):
         if var.identifier in self.variables:
             raise KeyError(f'Variable "{var.identifier}" appears more than once')
         self.variables[var.identifier] = var
+
+    def addLabel(self, label: 'Label'):
+        if label.identifier in self.labels:
+            raise KeyError(f'Label "{label.identifier}" appears more than once')
+        self.labels[label.identifier] = label
+        self.statements.append(label)
+
+    def visitStatements(self, statements: 'list[tuple]', lines: 'list[int]|None'=None):
+        """Build the program from the statement tuples produced by frontend.parse_source"""
+        for i, (kind, identifier, value) in enumerate(statements):
+            if kind == 'let':
+                self.addVariable(Variable(identifier, value, const=False))
+            elif kind == 'const':
+                self.addVariable(Variable(identifier, value, const=True))
+            elif kind == 'label':
+                self.addLabel(Label(identifier))
+            else:
+                args = []
+                for arg_kind, arg_value in value:
+                    if arg_kind == 'number':
+                        args.append(Argument(number=arg_value))
+                    else:
+                        args.append(Argument(identifier=arg_value, address=arg_kind == 'address'))
+                instr = Instruction(identifier, args)
+                instr.line = lines[i] if lines is not None else None
+                self.statements.append(instr)
+
+    def visitConstVar(self, ctx: 'eaterParser.ConstVarContext'):
+        self.addVariable(Variable(str(ctx.IDENTIFIER()), self.visitNumber(ctx), const=True))
     
-    def visitLet(self, ctx: eaterParser.LetContext):
-        var = Variable(str(ctx.IDENTIFIER()), self.visitNumber(ctx), const=False)
-        if var.identifier in self.variables:
-            raise KeyError(f'Variable "{var.identifier}" appears more than once')
-        self.variables[var.identifier] = var
+    def visitLet(self, ctx: 'eaterParser.LetContext'):
+        self.addVariable(Variable(str(ctx.IDENTIFIER()), self.visitNumber(ctx), const=False))
 
-    def visitNumberBin(self, ctx: eaterParser.NumberBinContext):
+    def visitNumberBin(self, ctx: 'eaterParser.NumberBinContext'):
         return int(str(ctx.BIN()).replace('_', ''), 2)
     
-    def visitNumberHex(self, ctx: eaterParser.NumberHexContext):
+    def visitNumberHex(self, ctx: 'eaterParser.NumberHexContext'):
         return int(str(ctx.HEX()).replace('_', ''), 16)
 
-    def visitNumberDec(self, ctx: eaterParser.NumberDecContext):
+    def visitNumberDec(self, ctx: 'eaterParser.NumberDecContext'):
         return int(str(ctx.DEC()), 10)
     
-    def visitInstrNoargs(self, ctx: eaterParser.InstrNoargsContext):
+    def visitInstrNoargs(self, ctx: 'eaterParser.InstrNoargsContext'):
         instr = Instruction(str(ctx.IDENTIFIER()), [])
+        instr.line = ctx.start.line
         self.statements.append(instr)
     
-    def visitInstrArgs(self, ctx: eaterParser.InstrArgsContext):
-        args = self.visitChildren(ctx)
-        if type(args) != list:
-            args = [args]
+    def visitInstrArgs(self, ctx: 'eaterParser.InstrArgsContext'):
+        args = [self.visit(arg) for arg in ctx.argument()]
         instr = Instruction(str(ctx.IDENTIFIER()), args)
+        instr.line = ctx.start.line
         self.statements.append(instr)
 
-    def visitArgNumber(self, ctx: eaterParser.ArgNumberContext):
+    def visitArgNumber(self, ctx: 'eaterParser.ArgNumberContext'):
         return Argument(number=self.visitChildren(ctx))
 
-    def visitArgIdentifier(self, ctx: eaterParser.ArgIdentifierContext):
+    def visitArgIdentifier(self, ctx: 'eaterParser.ArgIdentifierContext'):
         return Argument(identifier=str(ctx.IDENTIFIER()))
 
-    def visitArgAddress(self, ctx: eaterParser.ArgAddressContext):
+    def visitArgAddress(self, ctx: 'eaterParser.ArgAddressContext'):
         return Argument(identifier=str(ctx.IDENTIFIER()), address=True)
 
-    def visitLabel(self, ctx: eaterParser.LabelContext):
-        label = Label(str(ctx.IDENTIFIER()))
-        if label.identifier in self.labels:
-            raise KeyError(f'Label "{label.identifier}" appears more than once')
-        self.labels[label.identifier] = label
-        self.statements.append(label)
+    def visitLabel(self, ctx: 'eaterParser.LabelContext'):
+        self.addLabel(Label(str(ctx.IDENTIFIER())))
 
 if __name__ == '__main__':
     import argparse
-    from formatter import format_bytes
+    import sys
+    from formatter import format_bytes, write_if_changed
 
     parser = argparse.ArgumentParser(description='Simple Eater 8-bit Assembler')
     parser.add_argument('file', type=str, help='input file')
     parser.add_argument('-o', type=str, help='output hex file')
     parser.add_argument('-b', '--binary', action='store_true', help='format data in binary')
     parser.add_argument('-a', '--addresses', action='store_true', help='display addresses for each byte')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='parser frontend')
+    parser.add_argument('-i', '--isa', type=str, default='eater16', choices=list(PROFILES), help='target ISA profile')
+    parser.add_argument('-O', '--optimize', action='store_true', help='apply peephole optimizations')
+    parser.add_argument('-w', '--watch', action='store_true', help='stay running and reassemble whenever the file or machine.py changes')
+    parser.add_argument('--interval', type=float, default=0.01, help='watch polling interval in seconds')
 
     args = parser.parse_args()
 
-    visitor = Visitor()
-    visitor.parse(args.file, 16)
+    if args.o and (args.binary or args.addresses):
+        raise ValueError('--binary or --addresses are mutually exclusive with -o')
+
+    isa = PROFILES[args.isa]
+
+    def assemble_file(visitor_type: 'type'=Visitor) -> 'str':
+        visitor = visitor_type()
+        visitor.parse(args.file, isa, frontend=args.frontend, optimize=args.optimize)
+
+        if visitor.optimization is not None:
+            for rule, instruction in visitor.optimization['removed']:
+                print(f'{rule}: removed "{instruction}"', file=sys.stderr)
+            print(f'saved {visitor.optimization["bytes"]} bytes, ~{visitor.optimization["cycles"]} cycles', file=sys.stderr)
+
+        program, size = visitor.get_program()
+        if args.addresses:
+            program = program[:size]
 
-    program, size = visitor.get_program()
-    if args.addresses:
-        program = program[:size]
+        return format_bytes(program, 1, binary=args.binary, addresses=args.addresses, address_width=max(isa.address_bits, 4))
+
+    if args.watch:
+        import importlib
+        from watch import MACHINE_PATH, Watcher, reload_machine
+
+        if not args.o:
+            parser.error('--watch needs an output file (-o)')
+
+        # A module copy of this file, so it can be rebuilt against a reloaded machine.py
+        module = importlib.import_module('assembler')
+
+        def reassemble(changed: 'set[str]') -> 'str':
+            global module, isa
+            if MACHINE_PATH in changed:
+                reload_machine()
+                module = sys.modules['assembler']
+                isa = module.PROFILES[args.isa]
+            written = write_if_changed(args.o, assemble_file(module.Visitor))
+            return f'{"wrote" if written else "unchanged"} {args.o}'
+
+        print(reassemble(set()), file=sys.stderr)
+        try:
+            Watcher([args.file, MACHINE_PATH], args.interval).run(reassemble)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
-    formatted_program = format_bytes(program, 1, binary=args.binary, addresses=args.addresses)
+    formatted_program = assemble_file()
 
     if args.o:
-        if args.binary or args.addresses:
-            raise ValueError('--binary or --addresses are mutually exclusive with -o')
         with open(args.o, 'w') as file:
             file.write(formatted_program)
     else:
@@ -0,0 +1,124 @@
+"""Assemble many programs at once in a pool of warm worker processes"""
+
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from assembler import Visitor
+    from formatter import format_bytes
+    from isa import IsaProfile, PROFILES
+except ImportError:
+    from assembler.assembler import Visitor
+    from assembler.formatter import format_bytes
+    from assembler.isa import IsaProfile, PROFILES
+
+
+def expand_paths(patterns: 'list[str]') -> 'list[str]':
+    """Expand globs (including **) while keeping plain paths that do not exist, so they report an error"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches if matches else [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def warm_worker(frontend: 'str', path: 'str'):
+    """Parse one file up front so every worker starts with warm parser caches"""
+    try:
+        Visitor().parse(path, 2**16, frontend=frontend)
+    except Exception:
+        pass
+
+
+def output_paths(paths: 'list[str]', out_dir: 'str') -> 'list[str]':
+    """Mirror the inputs' directory layout below their common root so equal file names cannot collide"""
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    return [os.path.join(out_dir, os.path.splitext(os.path.relpath(os.path.abspath(p), root))[0] + '.hex') for p in paths]
+
+
+def assemble_file(path: 'str', output: 'str|None', ram_size: 'int|IsaProfile', frontend: 'str') -> 'dict':
+    entry = {
+        'source': path,
+        'output': output,
+        'size': None,
+        'error': None,
+        'time': None,
+    }
+    start = time.perf_counter()
+    try:
+        visitor = Visitor()
+        visitor.parse(path, ram_size, frontend=frontend)
+        program, size = visitor.get_program()
+        entry['size'] = size
+
+        if output is not None:
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            with open(output, 'w') as file:
+                file.write(format_bytes(program, 1) + '\n')
+    except Exception as e:
+        entry['error'] = f'{type(e).__name__}: {e}'
+    entry['time'] = time.perf_counter() - start
+    return entry
+
+
+def assemble_batch(paths: 'list[str]', out_dir: 'str|None'=None, ram_size: 'int|IsaProfile'=16, frontend: 'str'='antlr', jobs: 'int|None'=None) -> 'dict':
+    """Assemble every path, collecting per-file results instead of stopping at the first error"""
+    isa = ram_size if isinstance(ram_size, IsaProfile) else IsaProfile.for_ram_size(ram_size)
+    outputs = output_paths(paths, out_dir) if out_dir is not None else [None] * len(paths)
+
+    start = time.perf_counter()
+    if not paths:
+        entries = []
+    elif jobs == 1:
+        warm_worker(frontend, paths[0])
+        entries = [assemble_file(path, output, isa, frontend) for path, output in zip(paths, outputs)]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=warm_worker, initargs=(frontend, paths[0])) as pool:
+            n = len(paths)
+            entries = list(pool.map(assemble_file, paths, outputs, [isa] * n, [frontend] * n,
+                                    chunksize=max(1, n // (4 * (jobs or os.cpu_count() or 1)))))
+
+    return {
+        'frontend': frontend,
+        'isa': isa.name,
+        'ram_size': isa.ram_size,
+        'files': len(entries),
+        'errors': sum(e['error'] is not None for e in entries),
+        'time': time.perf_counter() - start,
+        'entries': entries,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Assemble many Eater programs in parallel')
+    parser.add_argument('files', type=str, nargs='+', help='assembly files or glob patterns')
+    parser.add_argument('-d', '--out-dir', type=str, required=True, help='directory for the generated hex files')
+    parser.add_argument('-m', '--manifest', type=str, help='manifest path (defaults to manifest.json in the output directory)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (defaults to the CPU count)')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='parser frontend')
+    parser.add_argument('-i', '--isa', type=str, default='eater16', choices=list(PROFILES), help='target ISA profile')
+
+    args = parser.parse_args()
+
+    manifest = assemble_batch(expand_paths(args.files), args.out_dir, PROFILES[args.isa], frontend=args.frontend, jobs=args.jobs)
+
+    manifest_path = args.manifest or os.path.join(args.out_dir, 'manifest.json')
+    # Workers only create directories for programs that assembled
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+    for entry in manifest['entries']:
+        if entry['error'] is not None:
+            print(f'{entry["source"]}: {entry["error"]}', file=sys.stderr)
+    print(f'{manifest["files"] - manifest["errors"]}/{manifest["files"]} assembled in {manifest["time"]:.3f} s')
+
+    sys.exit(1 if manifest['errors'] else 0)
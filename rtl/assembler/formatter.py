@@ -1,6 +1,172 @@
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from io import BytesIO
+
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
+
+FORMATS = ['readmemh', 'readmemb', 'bin', 'ihex']
+
+# Words per line of $readmemh/$readmemb output
+WORDS_PER_LINE = 8
+
+# Words formatted per write when streaming to a file
+CHUNK_WORDS = 8192
+
+BIN_DIGITS = [f'{i:08b}' for i in range(256)]
+
+
+def _typecode(width: 'int') -> 'str|None':
+    for code in 'BHILQ':
+        if array(code).itemsize == width:
+            return code
+    return None
+
+
+def to_bytes(data: 'list[int]', width: 'int', byteorder: 'str'='big') -> 'bytes':
+    """Pack each value into width bytes"""
+    if np is not None and isinstance(data, np.ndarray):
+        if width in (1, 2, 4, 8):
+            return data.astype(f'{">" if byteorder == "big" else "<"}u{width}').tobytes()
+        words = data.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :width]
+        return (words[:, ::-1] if byteorder == 'big' else words).tobytes()
+
+    code = _typecode(width)
+    if code is not None:
+        packed = array(code, data)
+        if byteorder != sys.byteorder:
+            packed.byteswap()
+        return packed.tobytes()
+    return b''.join(v.to_bytes(width, byteorder) for v in data)
+
+
+def iter_readmem(data: 'list[int]', width: 'int', binary: 'bool'=False):
+    """Yield $readmemh/$readmemb text in chunks, WORDS_PER_LINE words per line"""
+    line_bytes = WORDS_PER_LINE * width
+
+    for start in range(0, len(data), CHUNK_WORDS):
+        raw = to_bytes(data[start:start + CHUNK_WORDS], width)
+
+        if binary and np is not None:
+            bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8)).reshape(-1, width * 8)
+            text = np.full((bits.shape[0], width * 8 + 1), ord(' '), dtype=np.uint8)
+            text[:, :-1] = bits + ord('0')
+            text[WORDS_PER_LINE - 1::WORDS_PER_LINE, -1] = ord('\n')
+            text[-1, -1] = ord('\n')
+            yield text.tobytes().decode()
+        elif binary:
+            digits = [BIN_DIGITS[b] for b in raw]
+            words = digits if width == 1 else [''.join(digits[i:i + width]) for i in range(0, len(digits), width)]
+            lines = [' '.join(words[i:i + WORDS_PER_LINE]) for i in range(0, len(words), WORDS_PER_LINE)]
+            yield '\n'.join(lines) + '\n'
+        else:
+            # Every word formats to the same number of characters, so the
+            # separator ending each line sits at a fixed stride
+            text = bytearray(raw.hex(' ', width).upper().encode() + b'\n')
+            stride = line_bytes * 2 + WORDS_PER_LINE
+            text[stride - 1::stride] = b'\n' * len(range(stride - 1, len(text), stride))
+            yield text.decode()
+
+
+def iter_ihex(raw: 'bytes', record_bytes: 'int'=16):
+    """Yield Intel HEX records for a byte image, with extended linear address records past 64 KiB"""
+    upper = 0
+    for address in range(0, len(raw), record_bytes):
+        if address >> 16 != upper:
+            upper = address >> 16
+            record = bytes([2, 0, 0, 4, upper >> 8, upper & 0xFF])
+            yield f':{record.hex().upper()}{(-sum(record)) & 0xFF:02X}\n'
+
+        chunk = raw[address:address + record_bytes]
+        record = bytes([len(chunk), (address >> 8) & 0xFF, address & 0xFF, 0]) + chunk
+        yield f':{record.hex().upper()}{(-sum(record)) & 0xFF:02X}\n'
+    yield ':00000001FF\n'
+
+
+def write_bytes(file, data: 'list[int]', width: 'int', format: 'str'='readmemh'):
+    """
+    Stream data to a binary file handle as $readmemh or $readmemb text, a raw
+    little-endian image ('bin'), or Intel HEX of that same image ('ihex').
+    """
+    if format == 'readmemh' or format == 'readmemb':
+        for chunk in iter_readmem(data, width, binary=format == 'readmemb'):
+            file.write(chunk.encode())
+    elif format == 'bin':
+        for start in range(0, len(data), CHUNK_WORDS):
+            file.write(to_bytes(data[start:start + CHUNK_WORDS], width, 'little'))
+    elif format == 'ihex':
+        for record in iter_ihex(to_bytes(data, width, 'little')):
+            file.write(record.encode())
+    else:
+        raise ValueError(f'Unknown format "{format}" (expected one of {FORMATS})')
+
+
+def serialize(data: 'list[int]', width: 'int', format: 'str'='readmemh') -> 'bytes':
+    buffer = BytesIO()
+    write_bytes(buffer, data, width, format)
+    return buffer.getvalue()
+
+
+def write_if_changed(path: 'str', content: 'str|bytes') -> 'bool':
+    """
+    Atomically replace path with content, leaving the file (and its
+    timestamp) untouched when it already holds the same bytes.
+    """
+    data = content.encode() if isinstance(content, str) else content
+    try:
+        with open(path, 'rb') as file:
+            if file.read() == data:
+                return False
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return True
+
+
+def read_bin(path: 'str', width: 'int'):
+    """Memory-map a raw little-endian image written by write_bytes(..., format='bin')"""
+    if np is not None and width in (1, 2, 4, 8):
+        return np.memmap(path, dtype=f'<u{width}', mode='r')
+
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    code = _typecode(width)
+    if code is not None and sys.byteorder == 'little':
+        return memoryview(mapped).cast(code)
+    return [int.from_bytes(mapped[i:i + width], 'little') for i in range(0, len(mapped), width)]
+
+
+def read_readmem(path: 'str', binary: 'bool'=False) -> 'list[int]':
+    """Read back $readmemh/$readmemb text without address markers"""
+    with open(path, 'r') as file:
+        return [int(v, 2 if binary else 16) for v in file.read().split()]
+
 
 def format_bytes(data: 'list[int]', width: 'int', binary: 'bool'=False, addresses: 'bool'=False, address_width: 'int'=4) -> 'str':
 
+    if not addresses:
+        return ''.join(iter_readmem(data, width, binary=binary))[:-1]
+
     if binary:
         data_formatter = f'{{:0{width * 8}b}}'
         addr_formatter = f'{{:0{address_width}b}}'
@@ -8,13 +174,4 @@ def format_bytes(data: 'list[int]', width: 'int', binary: 'bool'=False, addresse
         data_formatter = f'{{:0{width * 2}X}}'
         addr_formatter = f'{{:0{address_width // 4}X}}'
 
-    lines = []
-
-    if addresses:
-        for i, value in enumerate(data):
-            lines.append(f'{addr_formatter.format(i)}: {data_formatter.format(value)}')
-    else:
-        for i in range(0, len(data), 8):
-            lines.append(' '.join([data_formatter.format(v) for v in data[i:i+8]]))
-    
-    return '\n'.join(lines)
+    return '\n'.join([f'{addr_formatter.format(i)}: {data_formatter.format(value)}' for i, value in enumerate(data)])
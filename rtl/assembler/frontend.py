@@ -0,0 +1,250 @@
+"""Dependency-free lexer and parser for the language described in eater.g4"""
+
+import re
+
+
+class Token:
+    __slots__ = ('type', 'text', 'line', 'column')
+
+    def __init__(self, type: 'str', text: 'str', line: 'int', column: 'int'):
+        self.type = type
+        self.text = text
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return repr(self.text) if self.type != 'EOF' else '<EOF>'
+
+
+class Lexer:
+    """
+    Mirrors the eater.g4 lexer rules. The alternatives are ordered so that
+    the first regex match is also the longest match ANTLR would pick, and
+    keywords are split from identifiers the same way ANTLR resolves ties.
+    """
+
+    KEYWORDS = {'let', 'const'}
+
+    PATTERN = re.compile(r'''
+        (?P<NEWLINE>\n)
+      | (?P<WHITESPACE>[ \t\r]+)
+      | (?P<COMMENT>//[^\r\n]*[\n\r])
+      | (?P<COMMENT_BLOCK>/\*.*?\*/)
+      | (?P<STRING>"(?:[^"\r\n]|\\")*")
+      | (?P<BIN>0b[01][01_]*)
+      | (?P<HEX>0x[A-Fa-f0-9][A-Fa-f0-9_]*)
+      | (?P<DEC>0|[1-9][0-9_]*)
+      | (?P<IDENTIFIER>[A-Za-z_][A-Za-z_0-9]*)
+      | (?P<LITERAL>[=,&:])
+    ''', re.VERBOSE | re.DOTALL)
+
+    SKIP = {'WHITESPACE', 'COMMENT', 'COMMENT_BLOCK'}
+
+    def __init__(self, source: 'str'):
+        self.source = source
+
+    def tokens(self) -> 'list[Token]':
+        tokens = []
+        line = 1
+        line_start = 0
+        position = 0
+        match = Lexer.PATTERN.match
+
+        while position < len(self.source):
+            m = match(self.source, position)
+            if m is None:
+                raise SyntaxError(f'line {line}:{position - line_start} token recognition error at: {self.source[position]!r}')
+
+            kind = m.lastgroup
+            text = m.group()
+            if kind not in Lexer.SKIP:
+                if kind == 'LITERAL' or (kind == 'IDENTIFIER' and text in Lexer.KEYWORDS):
+                    kind = text
+                tokens.append(Token(kind, text, line, position - line_start))
+
+            newlines = text.count('\n')
+            if newlines:
+                line += newlines
+                line_start = m.start() + text.rindex('\n') + 1
+            position = m.end()
+
+        tokens.append(Token('EOF', '', line, position - line_start))
+        return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser for eater.g4. Rather than a parse tree, it
+    produces one tuple per statement for `Visitor.visitStatements`:
+
+        ('let', identifier, value|None)
+        ('const', identifier, value)
+        ('label', identifier, None)
+        ('instruction', mnemonic, [(kind, value), ...])
+
+    where an argument kind is 'number', 'identifier' or 'address'. The source
+    line of each statement is kept alongside in `lines`. Unlike the ANTLR
+    runtime, which reports and recovers, syntax errors raise SyntaxError.
+    """
+
+    NUMBERS = {
+        'BIN': lambda text: int(text.replace('_', ''), 2),
+        'HEX': lambda text: int(text.replace('_', ''), 16),
+        'DEC': lambda text: int(text, 10),
+    }
+
+    def __init__(self, source: 'str'):
+        self.tokens = Lexer(source).tokens()
+        self.index = 0
+        self.lines: 'list[int]' = []
+
+    def peek(self, offset: 'int'=0) -> 'Token':
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def error(self, expected: 'str'):
+        token = self.peek()
+        raise SyntaxError(f'line {token.line}:{token.column} mismatched input {token} expecting {expected}')
+
+    def expect(self, type: 'str') -> 'Token':
+        token = self.peek()
+        if token.type != type:
+            self.error(type)
+        self.index += 1
+        return token
+
+    def parse(self) -> 'list[tuple]':
+        statements = []
+        while self.peek().type != 'EOF':
+            token = self.peek()
+            if token.type == 'NEWLINE':
+                self.index += 1
+                continue
+
+            if token.type == 'let':
+                statements.append(self.parse_let())
+            elif token.type == 'const':
+                statements.append(self.parse_const())
+            elif token.type == 'IDENTIFIER' and self.peek(1).type == ':':
+                self.index += 2
+                statements.append(('label', token.text, None))
+            elif token.type == 'IDENTIFIER':
+                statements.append(self.parse_instruction())
+            else:
+                self.error('{let, const, IDENTIFIER, NEWLINE}')
+            self.lines.append(token.line)
+
+            if self.peek().type == 'NEWLINE':
+                self.index += 1
+            elif self.peek().type != 'EOF':
+                self.error('{NEWLINE, <EOF>}')
+        return statements
+
+    def parse_number(self) -> 'int':
+        token = self.peek()
+        if token.type not in Parser.NUMBERS:
+            self.error('{BIN, HEX, DEC}')
+        self.index += 1
+        return Parser.NUMBERS[token.type](token.text)
+
+    def parse_let(self) -> 'tuple':
+        self.expect('let')
+        identifier = self.expect('IDENTIFIER').text
+        value = None
+        if self.peek().type == '=':
+            self.index += 1
+            value = self.parse_number()
+        return ('let', identifier, value)
+
+    def parse_const(self) -> 'tuple':
+        self.expect('const')
+        identifier = self.expect('IDENTIFIER').text
+        self.expect('=')
+        return ('const', identifier, self.parse_number())
+
+    def parse_argument(self) -> 'tuple':
+        token = self.peek()
+        if token.type in Parser.NUMBERS:
+            return ('number', self.parse_number())
+        if token.type == 'IDENTIFIER':
+            self.index += 1
+            return ('identifier', token.text)
+        if token.type == '&':
+            self.index += 1
+            return ('address', self.expect('IDENTIFIER').text)
+        self.error('{BIN, HEX, DEC, IDENTIFIER, &}')
+
+    def parse_instruction(self) -> 'tuple':
+        mnemonic = self.expect('IDENTIFIER').text
+        args = []
+        if self.peek().type not in ('NEWLINE', 'EOF'):
+            args.append(self.parse_argument())
+            while self.peek().type == ',':
+                self.index += 1
+                args.append(self.parse_argument())
+        return ('instruction', mnemonic, args)
+
+
+def parse_source(source: 'str') -> 'list[tuple]':
+    return Parser(source).parse()
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    import os
+    import subprocess
+    import sys
+    import time
+
+    from assembler import Visitor, Instruction
+
+    parser = argparse.ArgumentParser(description='Check the hand-written frontend against the ANTLR frontend')
+    parser.add_argument('files', type=str, nargs='*', help='assembly files (examples/*.asm by default)')
+    parser.add_argument('-n', '--repeat', type=int, default=20, help='parses per file for the timing comparison')
+
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', '*.asm')))
+
+    def describe(visitor: 'Visitor'):
+        statements = []
+        for s in visitor.statements:
+            if type(s) == Instruction:
+                arguments = [(a.identifier, a.number, a.address) for a in s.args]
+                statements.append((s.mnemonic, arguments, s.address))
+            else:
+                statements.append((s.identifier, s.address))
+        variables = [(v.identifier, v.initializer, v.const, v.address) for v in visitor.variables.values()]
+        labels = [(l.identifier, l.address) for l in visitor.labels.values()]
+        return statements, variables, labels, visitor.get_program()
+
+    timings = {frontend: 0.0 for frontend in Visitor.FRONTENDS}
+    mismatches = 0
+    for path in files:
+        results = {}
+        for frontend in Visitor.FRONTENDS:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                visitor = Visitor()
+                visitor.parse(path, 16, frontend=frontend)
+            timings[frontend] += (time.perf_counter() - start) / args.repeat
+            results[frontend] = describe(visitor)
+
+        match = results['antlr'] == results['fast']
+        mismatches += not match
+        print(f'{"ok" if match else "MISMATCH":8} {path}')
+
+    print()
+    for frontend in Visitor.FRONTENDS:
+        print(f'{frontend:6} {timings[frontend] / len(files) * 1e3:8.3f} ms per file')
+
+    imports = {
+        'antlr': 'import antlr4; from build import eaterLexer, eaterParser, eaterVisitor',
+        'fast': 'import frontend',
+    }
+    for frontend, statement in imports.items():
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        print(f'{frontend:6} {(time.perf_counter() - start) * 1e3:8.3f} ms interpreter startup and import')
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,72 @@
+"""Instruction set profiles describing RAM size and operand encoding"""
+
+from math import ceil
+
+try:
+    from machine import MachineCode
+except ModuleNotFoundError:
+    from assembler.machine import MachineCode
+
+
+class IsaProfile:
+    """
+    The 16 byte eater.v machine packs an instruction's operand into the low
+    nibble of its opcode byte. Larger RAMs need wider addresses, so their
+    operands follow the opcode byte as operand_bytes little-endian bytes.
+    """
+
+    def __init__(self, name: 'str', ram_size: 'int'):
+        if ram_size <= 0 or ram_size & (ram_size - 1):
+            raise ValueError(f'RAM size must be a power of 2 (got {ram_size})')
+
+        self.name = name
+        self.ram_size = ram_size
+        self.address_bits = max(ram_size.bit_length() - 1, 1)
+
+        if self.address_bits <= 8 - MachineCode.OPCODE_BITS:
+            self.operand_bytes = 0
+        else:
+            self.operand_bytes = ceil(self.address_bits / 8)
+
+    @classmethod
+    def for_ram_size(cls, ram_size: 'int') -> 'IsaProfile':
+        for profile in PROFILES.values():
+            if profile.ram_size == ram_size:
+                return profile
+        return cls(f'eater{ram_size}', ram_size)
+
+    @property
+    def operand_mask(self) -> 'int':
+        if self.operand_bytes == 0:
+            return 2**(8 - MachineCode.OPCODE_BITS) - 1
+        return 2**(8 * self.operand_bytes) - 1
+
+    def instruction_size(self, machine: 'MachineCode') -> 'int':
+        """Return the number of bytes an instruction occupies"""
+        if self.operand_bytes == 0:
+            arg_bits = machine.arg_bits if machine.arg_bits is not None else 0
+            return ceil((MachineCode.OPCODE_BITS + arg_bits) / 8)
+        return 1 + self.operand_bytes if machine.arg_type else 1
+
+    def encode(self, machine: 'MachineCode', args: 'list[int]') -> 'list[int]':
+        machine_bytes = [(machine.opcode & (2**MachineCode.OPCODE_BITS - 1)) << (8 - MachineCode.OPCODE_BITS)]
+        if not args:
+            return machine_bytes
+
+        if self.operand_bytes == 0:
+            machine_bytes[0] |= args[0] & self.operand_mask
+            machine_bytes.extend(arg & 0xFF for arg in args[1:])
+        else:
+            for arg in args:
+                machine_bytes.extend((arg & self.operand_mask).to_bytes(self.operand_bytes, 'little'))
+        return machine_bytes
+
+    def __str__(self):
+        return self.name
+
+
+PROFILES = {
+    'eater16': IsaProfile('eater16', 16),
+    'eater256': IsaProfile('eater256', 256),
+    'eater64k': IsaProfile('eater64k', 2**16),
+}
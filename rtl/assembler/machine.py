@@ -18,6 +18,13 @@ class Control:
     BI = 1 << 13
     SU = 1 << 14
     EO = 1 << 15
+    # Not in the original control word: ends the instruction by resetting
+    # the micro-step counter, so short instructions skip their padding steps.
+    # rom.RomBuilder sets it on each row's last step.
+    NX = 1 << 16
+    # With NX: the first fetch step of the next instruction was merged into
+    # this one, so the counter restarts at micro-step 1 instead of 0
+    NF = 1 << 17
 
 
 class MachineCode:
@@ -35,9 +42,10 @@ class MachineCode:
 
     class Flag:
         FLAG_BITS = 2
-        def __init__(self, flag: 'int'):
-            if flag <= 0 or (flag > MachineCode.Flag.FLAG_BITS or int(log2(flag)) != log2(flag)):
-                raise ValueError(f'Flag (provided {flag}) must be a power of 2 that fits within {MachineCode.Flag.FLAG_BITS} bits')
+        def __init__(self, flag: 'int', flag_bits: 'int|None'=None):
+            flag_bits = MachineCode.Flag.FLAG_BITS if flag_bits is None else flag_bits
+            if flag <= 0 or (flag >= 2**flag_bits or int(log2(flag)) != log2(flag)):
+                raise ValueError(f'Flag (provided {flag}) must be a power of 2 that fits within {flag_bits} bits')
             self.flag = flag
         
         def __eq__(self, other: 'MachineCode.Flag') -> 'bool':
@@ -47,20 +55,25 @@ class MachineCode:
     def total_bits(cls):
         return cls.OPCODE_BITS + cls.UINSTR_BITS + cls.Flag.FLAG_BITS
 
-    def __init__(self, opcode: 'int', uinstructions: 'list[int]|None'=None, flag: 'MachineCode.Flag | None'=None, invert_flag: 'bool'=False, mnemonic: 'str|None'=None, arg_type: 'list[int]|None'=None, arg_bits: 'list[int]|None'=None):
-        if opcode >= 2**MachineCode.OPCODE_BITS:
-            raise ValueError(f'Opcode must be less than {2**MachineCode.OPCODE_BITS}')
+    def __init__(self, opcode: 'int', uinstructions: 'list[int]|None'=None, flag: 'MachineCode.Flag | None'=None, invert_flag: 'bool'=False, mnemonic: 'str|None'=None, arg_type: 'list[int]|None'=None, arg_bits: 'list[int]|None'=None, opcode_bits: 'int|None'=None, uinstr_bits: 'int|None'=None):
+        # The widths default to the eater.v control store, but can be
+        # widened per instruction when experimenting with rom.RomBuilder
+        opcode_bits = MachineCode.OPCODE_BITS if opcode_bits is None else opcode_bits
+        uinstr_bits = MachineCode.UINSTR_BITS if uinstr_bits is None else uinstr_bits
+
+        if opcode >= 2**opcode_bits:
+            raise ValueError(f'Opcode must be less than {2**opcode_bits}')
 
         if uinstructions is None:
             uinstructions = []
         
         len_fetch = len(MachineCode.FETCH_CYCLE)
-        if len(uinstructions) >= 2**MachineCode.UINSTR_BITS - len_fetch:
+        if len(uinstructions) >= 2**uinstr_bits - len_fetch:
             raise ValueError(
-                f'Too many micro-instructions (expected < {2**MachineCode.UINSTR_BITS - len_fetch}, got {len(uinstructions)})')
+                f'Too many micro-instructions (expected < {2**uinstr_bits - len_fetch}, got {len(uinstructions)})')
         
         self.opcode = opcode
-        self.uinstructions = uinstructions + [0 for _ in range(2**MachineCode.UINSTR_BITS - len(uinstructions))]
+        self.uinstructions = uinstructions + [0 for _ in range(2**uinstr_bits - len(uinstructions))]
         self.flag = flag
         self.invert_flag = invert_flag
         self.mnemonic = mnemonic
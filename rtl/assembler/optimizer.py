@@ -0,0 +1,245 @@
+"""Peephole optimization of assembled statements"""
+
+import functools
+
+try:
+    from machine import Control, MachineCode
+    from rom import RomBuilder
+    from simulator import Simulator
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode
+    from assembler.rom import RomBuilder
+    from assembler.simulator import Simulator
+
+
+@functools.lru_cache(maxsize=None)
+def instruction_cycles(machine: 'MachineCode', taken: 'bool'=True) -> 'int':
+    """
+    Clocks an instruction takes in eater.v: two per micro-step (ready, then
+    asserted) through its row in the control store, up to the step marked
+    with Control.NX. A conditional jump that is not taken runs the NOP row.
+    A row that merged the next fetch's first step into its own last one is
+    credited with that step, so the cycles of a sequence still add up.
+    """
+    builder = RomBuilder()
+    row = builder.row(machine) if taken or machine.flag is None else builder.nop_row()
+    return builder.row_steps(row) * Simulator.CLOCKS_PER_STEP
+
+
+def is_instruction(statement) -> 'bool':
+    """Labels and instructions share the statement list; only instructions carry a machine code"""
+    return hasattr(statement, 'machine')
+
+
+def writes_flags(machine: 'MachineCode') -> 'bool':
+    return any(u & Control.FI for u in machine.uinstructions)
+
+
+def reads_flags(machine: 'MachineCode') -> 'bool':
+    return machine.flag is not None
+
+
+def is_jump(machine: 'MachineCode') -> 'bool':
+    return any(u & Control.J for u in machine.uinstructions)
+
+
+def same_argument(a, b) -> 'bool':
+    return (a.identifier, a.number, a.address) == (b.identifier, b.number, b.address)
+
+
+def describe(instruction) -> 'str':
+    return ' '.join([instruction.mnemonic] + [str(arg) for arg in instruction.args])
+
+
+class Program:
+    """
+    Control flow view of a statement list. Labels are kept in place since
+    they only mark addresses; anything that may run into the variable area or
+    jump to a non-label target is treated as reading every flag.
+    """
+
+    def __init__(self, statements: 'list', labels: 'dict', variables: 'dict'):
+        self.statements = statements
+        self.labels = labels
+        self.variables = variables
+
+    def instruction_at(self, i: 'int'):
+        """The first instruction at or after statement i, skipping labels"""
+        while i < len(self.statements):
+            if is_instruction(self.statements[i]):
+                return self.statements[i]
+            i += 1
+        return None
+
+    def labels_before(self, i: 'int') -> 'set[str]':
+        """Identifiers of the labels between statement i and the next instruction"""
+        names = set()
+        i += 1
+        while i < len(self.statements) and not is_instruction(self.statements[i]):
+            names.add(self.statements[i].identifier)
+            i += 1
+        return names
+
+    def successors(self, i: 'int') -> 'list':
+        """Instructions control can reach after statement i, with None standing for unknown code"""
+        machine = self.statements[i].machine
+        if machine.mnemonic == 'HLT':
+            return []
+
+        following = [self.instruction_at(i + 1)]
+        if not is_jump(machine):
+            return following
+
+        target = self.statements[i].args[0].identifier if self.statements[i].args else None
+        if target in self.labels:
+            taken = self.instruction_at(self.statements.index(self.labels[target]))
+        else:
+            taken = None
+        return [taken] if machine.flag is None else [taken] + following
+
+    def flags_live(self) -> 'dict[int, bool]':
+        """Map id(instruction) to whether its flag outputs may still be read"""
+        indices = [i for i, s in enumerate(self.statements) if is_instruction(s)]
+        successors = {id(self.statements[i]): self.successors(i) for i in indices}
+        live_in = {key: False for key in successors}
+
+        changed = True
+        while changed:
+            changed = False
+            for i in reversed(indices):
+                instruction = self.statements[i]
+                live_out = any(s is None or live_in[id(s)] for s in successors[id(instruction)])
+                live = reads_flags(instruction.machine) or (live_out and not writes_flags(instruction.machine))
+                if live != live_in[id(instruction)]:
+                    live_in[id(instruction)] = live
+                    changed = True
+
+        return {
+            key: any(s is None or live_in[id(s)] for s in succ)
+            for key, succ in successors.items()
+        }
+
+
+def previous_instruction(statements: 'list', i: 'int'):
+    """The instruction directly before statement i, or None if a label (or nothing) intervenes"""
+    if i > 0 and is_instruction(statements[i - 1]):
+        return statements[i - 1]
+    return None
+
+
+def next_instruction(statements: 'list', i: 'int'):
+    """The instruction directly after statement i, or None if a label (or nothing) intervenes"""
+    if i + 1 < len(statements) and is_instruction(statements[i + 1]):
+        return statements[i + 1]
+    return None
+
+
+def rule_store_load(program: 'Program', i: 'int', _) -> 'bool':
+    """lda x straight after sta x reloads the value A already holds"""
+    instruction = program.statements[i]
+    previous = previous_instruction(program.statements, i)
+    return (
+        instruction.mnemonic.upper() == 'LDA'
+        and previous is not None and previous.mnemonic.upper() == 'STA'
+        and previous.args and instruction.args and same_argument(previous.args[0], instruction.args[0])
+    )
+
+
+def rule_repeated_store(program: 'Program', i: 'int', _) -> 'bool':
+    """A second sta x writes the same value again"""
+    instruction = program.statements[i]
+    previous = previous_instruction(program.statements, i)
+    return (
+        instruction.mnemonic.upper() == 'STA'
+        and previous is not None and previous.mnemonic.upper() == 'STA'
+        and previous.args and instruction.args and same_argument(previous.args[0], instruction.args[0])
+    )
+
+
+def rule_dead_load(program: 'Program', i: 'int', _) -> 'bool':
+    """A load into A that the next instruction overwrites without reading"""
+    loads = ('LDA', 'LDI')
+    following = next_instruction(program.statements, i)
+    return (
+        program.statements[i].mnemonic.upper() in loads
+        and following is not None and following.mnemonic.upper() in loads
+    )
+
+
+def rule_jump_next(program: 'Program', i: 'int', _) -> 'bool':
+    """A jump (taken or not) to the instruction that follows anyway"""
+    instruction = program.statements[i]
+    if not is_jump(instruction.machine) or not instruction.args:
+        return False
+    return instruction.args[0].identifier in program.labels_before(i)
+
+
+def rule_identity_alu(program: 'Program', i: 'int', flags_live: 'dict[int, bool]') -> 'bool':
+    """adi 0/sbi 0 leave A unchanged, so they only matter for their flags"""
+    instruction = program.statements[i]
+    if instruction.mnemonic.upper() not in ('ADI', 'SBI') or flags_live[id(instruction)]:
+        return False
+    try:
+        return instruction.args[0].getValue(program.variables) == 0
+    except ValueError:
+        return False
+
+
+# (name, rule) pairs tried in order on every instruction. B is loaded by
+# every ALU instruction before it is read, so it is never live across
+# instructions and rules only need to preserve A, RAM and the flags.
+RULES = [
+    ('store-load', rule_store_load),
+    ('repeated-store', rule_repeated_store),
+    ('dead-load', rule_dead_load),
+    ('jump-next', rule_jump_next),
+    ('identity-alu', rule_identity_alu),
+]
+
+
+def optimize(statements: 'list', labels: 'dict', variables: 'dict', isa=None) -> 'dict':
+    """
+    Remove redundant instructions from statements in place and return a
+    report of what was removed along with the bytes and cycles saved.
+    Cycles are counted once per removed instruction, i.e. for a single
+    pass through every rewritten site.
+    """
+    report = {
+        'removed': [],
+        'bytes': 0,
+        'cycles': 0,
+    }
+
+    # Code that stores to a label rewrites itself, which the rules cannot reason about
+    if any(is_instruction(s) and s.mnemonic.upper() == 'STA' and s.args and s.args[0].identifier in labels for s in statements):
+        return report
+
+    if any(is_instruction(s) and s.machine is None for s in statements):
+        return report
+
+    program = Program(statements, labels, variables)
+    changed = True
+    while changed:
+        changed = False
+        # Removing an instruction never changes whether the remaining
+        # instructions' flags are read, so one analysis serves a whole pass
+        flags_live = program.flags_live()
+
+        i = 0
+        while i < len(statements):
+            instruction = statements[i]
+            if is_instruction(instruction):
+                for name, rule in RULES:
+                    if rule(program, i, flags_live):
+                        report['removed'].append((name, describe(instruction)))
+                        report['bytes'] += instruction.getSize(isa)
+                        report['cycles'] += instruction_cycles(instruction.machine)
+                        del statements[i]
+                        changed = True
+                        break
+                else:
+                    i += 1
+            else:
+                i += 1
+
+    return report
@@ -0,0 +1,158 @@
+"""Execution profiling for the Python eater.v model"""
+
+from collections import Counter
+
+try:
+    from machine import Control, MachineCode
+    from simulator import Simulator
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode
+    from assembler.simulator import Simulator
+
+
+# (name, bit) for every control signal, in control word order
+CONTROL_BITS = sorted(
+    [(name, bit) for name, bit in vars(Control).items() if name.isupper()],
+    key=lambda item: item[1],
+)
+
+
+class Profiler:
+    """
+    Attach to a Simulator (Simulator(rom, ram, profiler=Profiler(len(ram))))
+    to record, per micro-step:
+
+        hits      instructions fetched from each RAM address
+        cycles    clocks spent in the instruction fetched from each address
+        words     (micro-step, control word) pairs, for the Control histogram
+        edges     (from, to) instruction addresses where control went backwards
+
+    Simulator.run hands control to Profiler.run, which single-steps the
+    simulator, so none of this costs anything while no profiler is attached.
+    Counts accumulate over every run until clear() is called.
+    """
+
+    def __init__(self, ram_size: 'int'=16):
+        self.ram_size = ram_size
+        self.clear()
+
+    def clear(self):
+        self.hits = [0 for _ in range(self.ram_size)]
+        self.cycles = [0 for _ in range(self.ram_size)]
+        self.words: 'Counter[tuple[int, int]]' = Counter()
+        self.edges: 'Counter[tuple[int, int]]' = Counter()
+        self.current: 'int|None' = None
+
+    def run(self, simulator: 'Simulator', max_cycles: 'int|None'=None) -> 'list[int]':
+        steps = 0
+        max_steps = None if max_cycles is None else max_cycles // Simulator.CLOCKS_PER_STEP
+
+        # An instruction starts at micro-step 0, or at 1 after a word that
+        # already did its first fetch step (Control.NF)
+        starting = simulator.micro_step == 0
+        while not simulator.halted and (max_steps is None or steps < max_steps):
+            if starting:
+                if self.current is not None and simulator.pc <= self.current:
+                    self.edges[(self.current, simulator.pc)] += 1
+                self.current = simulator.pc
+                self.hits[simulator.pc] += 1
+
+            word = simulator.rom[simulator.address]
+            self.words[(simulator.micro_step, word)] += 1
+            if self.current is not None:
+                self.cycles[self.current] += Simulator.CLOCKS_PER_STEP
+
+            simulator.execute(Simulator.CLOCKS_PER_STEP)
+            steps += 1
+            starting = bool(word & Control.NX) or simulator.micro_step == 0
+
+        return simulator.outputs
+
+    def control_histogram(self) -> 'dict[str, list[int]]':
+        """Steps each control signal was asserted, indexed by micro-step"""
+        histogram = {name: [0 for _ in range(2**MachineCode.UINSTR_BITS)] for name, _ in CONTROL_BITS}
+        for (step, word), count in self.words.items():
+            for name, bit in CONTROL_BITS:
+                if word & bit:
+                    histogram[name][step] += count
+        return histogram
+
+    def hot_loops(self) -> 'list[dict]':
+        """
+        Backward jumps observed while running, as address ranges sorted by the
+        clocks spent inside them (nested loops are counted in each range).
+        """
+        loops = []
+        for (source, target), count in self.edges.items():
+            loops.append({
+                'start': target,
+                'end': source,
+                'iterations': count,
+                'cycles': sum(self.cycles[target:source + 1]),
+            })
+        return sorted(loops, key=lambda l: l['cycles'], reverse=True)
+
+    def line_report(self, statements: 'list', source: 'list[str]|None'=None) -> 'list[dict]':
+        """
+        Hits and cycles per source line, using the addresses that
+        Visitor.assignStatementAddresses gave each instruction.
+        """
+        lines = {}
+        for statement in statements:
+            if not hasattr(statement, 'machine') or statement.address is None:
+                continue
+            if statement.address >= self.ram_size:
+                continue
+            entry = lines.setdefault(statement.line, {
+                'line': statement.line,
+                'text': source[statement.line - 1].strip() if source and statement.line else None,
+                'address': statement.address,
+                'hits': 0,
+                'cycles': 0,
+            })
+            entry['hits'] += self.hits[statement.address]
+            entry['cycles'] += self.cycles[statement.address]
+        return list(lines.values())
+
+    def report(self, statements: 'list|None'=None, source: 'list[str]|None'=None) -> 'dict':
+        return {
+            'hits': self.hits,
+            'cycles': self.cycles,
+            'control': self.control_histogram(),
+            'loops': self.hot_loops(),
+            'lines': self.line_report(statements, source) if statements is not None else None,
+        }
+
+    def format_report(self, statements: 'list|None'=None, source: 'list[str]|None'=None) -> 'str':
+        total = sum(self.cycles) or 1
+        out = []
+
+        if statements is not None:
+            out.append(f'{"line":>6}{"addr":>6}{"hits":>10}{"cycles":>12}{"%":>7}  source')
+            for entry in self.line_report(statements, source):
+                line = '-' if entry['line'] is None else entry['line']
+                out.append(
+                    f'{line:>6}{entry["address"]:>6X}{entry["hits"]:>10}{entry["cycles"]:>12}'
+                    f'{100 * entry["cycles"] / total:>6.1f}%  {entry["text"] or ""}'
+                )
+        else:
+            out.append(f'{"addr":>6}{"hits":>10}{"cycles":>12}{"%":>7}')
+            for address, (hits, cycles) in enumerate(zip(self.hits, self.cycles)):
+                if hits:
+                    out.append(f'{address:>6X}{hits:>10}{cycles:>12}{100 * cycles / total:>6.1f}%')
+
+        loops = self.hot_loops()
+        if loops:
+            out.append('')
+            out.append(f'{"loop":>10}{"iterations":>12}{"cycles":>12}{"%":>7}')
+            for loop in loops:
+                span = f'{loop["start"]:X}-{loop["end"]:X}'
+                out.append(f'{span:>10}{loop["iterations"]:>12}{loop["cycles"]:>12}{100 * loop["cycles"] / total:>6.1f}%')
+
+        out.append('')
+        out.append(f'{"signal":>6}  ' + ' '.join(f'{f"step {i}":>8}' for i in range(2**MachineCode.UINSTR_BITS)))
+        for name, counts in self.control_histogram().items():
+            if any(counts):
+                out.append(f'{name:>6}  ' + ' '.join(f'{c:>8}' for c in counts))
+
+        return '\n'.join(out)
@@ -0,0 +1,230 @@
+"""Array-backed microcode ROM generation with configurable control store widths"""
+
+from array import array
+
+try:
+    from machine import Control, MachineCode, machine_code
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode, machine_code
+
+
+# State each control signal reads and writes within a micro-step. The bus
+# is written by the signals driving it and read by those latching from it.
+CONTROL_EFFECTS = {
+    Control.AO: ({'a'}, {'bus'}),
+    Control.AI: ({'bus'}, {'a'}),
+    Control.II: ({'bus'}, {'ir'}),
+    Control.IO: ({'ir'}, {'bus'}),
+    Control.RO: ({'mar', 'ram'}, {'bus'}),
+    Control.RI: ({'bus', 'mar'}, {'ram'}),
+    Control.MI: ({'bus'}, {'mar'}),
+    Control.HLT: (set(), {'halt'}),
+    Control.FI: ({'a', 'b', 'alu'}, {'flags'}),
+    Control.J: ({'bus'}, {'pc'}),
+    Control.CO: ({'pc'}, {'bus'}),
+    Control.CE: ({'pc'}, {'pc'}),
+    Control.OI: ({'bus'}, {'out'}),
+    Control.BI: ({'bus'}, {'b'}),
+    Control.SU: (set(), {'alu'}),
+    Control.EO: ({'a', 'b', 'alu'}, {'bus'}),
+    Control.NX: (set(), {'step'}),
+    Control.NF: (set(), {'step'}),
+}
+
+
+def effects(word: 'int') -> 'tuple[set[str], set[str]]':
+    """(reads, writes) of a control word"""
+    reads, writes = set(), set()
+    for bit, (bit_reads, bit_writes) in CONTROL_EFFECTS.items():
+        if word & bit:
+            reads |= bit_reads
+            writes |= bit_writes
+    return reads, writes
+
+
+def can_merge(first: 'int', second: 'int') -> 'bool':
+    """
+    Whether second can be asserted in the same micro-step as first without
+    either seeing different values: neither writes anything the other reads
+    or writes, which rules out sharing the bus. A halting step never reaches
+    the next one.
+    """
+    if first & Control.HLT:
+        return False
+    first_reads, first_writes = effects(first)
+    second_reads, second_writes = effects(second)
+    return not (first_writes & (second_reads | second_writes) or second_writes & first_reads)
+
+
+class RomBuilder:
+    """
+    Lays out the control store as {flags, opcode, micro-step} like eater.v's
+    instruction_address, but with the field widths held per builder rather
+    than taken from the MachineCode class constants.
+
+    Each opcode contributes one row of 2**uinstr_bits control words (the
+    fetch cycle followed by its micro-instructions) which is written with a
+    single slice assignment for every flag combination that satisfies its
+    condition. Every other combination keeps the fetch-only NOP row.
+
+    With end_marker, Control.NX is set on the last non-zero step of each
+    row, so eater.v starts the next instruction there instead of stepping
+    through the zero padding. Rows with nothing after the fetch (NOP, and
+    conditional jumps whose condition fails) end on the step after it.
+
+    With overlap_fetch as well, the first fetch step of the next instruction
+    is merged into that last step wherever can_merge allows, and Control.NF
+    tells eater.v to restart at micro-step 1. Every fetch step is the same
+    in every row, so the merged step works whatever comes next.
+    """
+
+    def __init__(self, opcode_bits: 'int'=MachineCode.OPCODE_BITS, uinstr_bits: 'int'=MachineCode.UINSTR_BITS,
+                 flag_bits: 'int'=MachineCode.Flag.FLAG_BITS, fetch_cycle: 'list[int]|None'=None, end_marker: 'bool'=True,
+                 overlap_fetch: 'bool'=True):
+        self.opcode_bits = opcode_bits
+        self.uinstr_bits = uinstr_bits
+        self.flag_bits = flag_bits
+        self.fetch_cycle = list(MachineCode.FETCH_CYCLE if fetch_cycle is None else fetch_cycle)
+        self.end_marker = end_marker
+        self.overlap_fetch = overlap_fetch and end_marker
+
+        if len(self.fetch_cycle) > self.steps:
+            raise ValueError(f'Fetch cycle ({len(self.fetch_cycle)} steps) does not fit in {self.steps} micro-steps')
+
+    @property
+    def steps(self) -> 'int':
+        return 2**self.uinstr_bits
+
+    @property
+    def total_bits(self) -> 'int':
+        return self.opcode_bits + self.uinstr_bits + self.flag_bits
+
+    @property
+    def size(self) -> 'int':
+        return 2**self.total_bits
+
+    def address(self, flags: 'int', opcode: 'int', step: 'int'=0) -> 'int':
+        return (flags << (self.uinstr_bits + self.opcode_bits)) | (opcode << self.uinstr_bits) | step
+
+    def row(self, instruction: 'MachineCode') -> 'list[int]':
+        """Control words for every micro-step of an instruction whose condition is met"""
+        body_steps = self.steps - len(self.fetch_cycle)
+        if any(instruction.uinstructions[body_steps:]):
+            raise ValueError(f'{instruction.mnemonic} does not fit in {self.steps} micro-steps')
+
+        body = list(instruction.uinstructions[:body_steps])
+        return self.mark_end(self.fetch_cycle + body + [0 for _ in range(body_steps - len(body))])
+
+    def mark_end(self, row: 'list[int]') -> 'list[int]':
+        # The fetch steps are read from the previous instruction's row (the
+        # new opcode is only latched by II), so the earliest an instruction
+        # can end is the first step after the fetch
+        if self.end_marker:
+            last = max([i for i, word in enumerate(row) if word] + [min(len(self.fetch_cycle), self.steps - 1)])
+            row[last] |= Control.NX
+            if self.overlap_fetch and can_merge(row[last], self.fetch_cycle[0]):
+                row[last] |= self.fetch_cycle[0] | Control.NF
+        return row
+
+    def nop_row(self) -> 'list[int]':
+        """Control words of NOP, and of conditional jumps whose condition fails"""
+        return self.mark_end(self.fetch_cycle + [0 for _ in range(self.steps - len(self.fetch_cycle))])
+
+    def row_steps(self, row: 'list[int]') -> 'int':
+        """
+        Micro-steps from the start of a row to its end, less the next
+        instruction's fetch step it has already done
+        """
+        for i, word in enumerate(row):
+            if word & (Control.NX | Control.HLT):
+                return i + 1 - (1 if word & Control.NF else 0)
+        return self.steps
+
+    def fetch_savings(self, instructions: 'list[MachineCode]'=machine_code) -> 'list[tuple[str, bool, int, int]]':
+        """
+        (mnemonic, taken, steps without overlap_fetch, steps with it) for each
+        instruction, with a second entry for conditional ones when not taken
+        """
+        serial = RomBuilder(self.opcode_bits, self.uinstr_bits, self.flag_bits, self.fetch_cycle, self.end_marker, overlap_fetch=False)
+        overlapped = RomBuilder(self.opcode_bits, self.uinstr_bits, self.flag_bits, self.fetch_cycle, self.end_marker, overlap_fetch=True)
+        savings = []
+        for instruction in instructions:
+            savings.append((instruction.mnemonic, True, serial.row_steps(serial.row(instruction)), overlapped.row_steps(overlapped.row(instruction))))
+            if instruction.flag is not None:
+                savings.append((instruction.mnemonic, False, serial.row_steps(serial.nop_row()), overlapped.row_steps(overlapped.nop_row())))
+        return savings
+
+    def condition(self, instruction: 'MachineCode', flags: 'int') -> 'bool':
+        if instruction.flag is None:
+            return True
+        if instruction.invert_flag:
+            return (instruction.flag.flag & flags) == 0
+        return (instruction.flag.flag & flags) > 0
+
+    def build(self, instructions: 'list[MachineCode]'=machine_code) -> 'array':
+        rows = {}
+        for instruction in instructions:
+            if instruction.opcode >= 2**self.opcode_bits:
+                raise ValueError(f'Opcode {instruction.opcode} of {instruction.mnemonic} does not fit in {self.opcode_bits} bits')
+            if instruction.flag is not None and instruction.flag.flag >= 2**self.flag_bits:
+                raise ValueError(f'Flag of {instruction.mnemonic} does not fit in {self.flag_bits} bits')
+            rows[instruction.opcode] = (instruction, self.row(instruction))
+
+        nop = self.nop_row()
+        widest = max([max(row) for _, row in rows.values()] + nop)
+        typecode = 'H' if widest < 2**16 else 'L' if array('L').itemsize >= 4 else 'Q'
+
+        rom = array(typecode, nop) * (2**(self.opcode_bits + self.flag_bits))
+
+        for opcode, (instruction, row) in rows.items():
+            taken = array(typecode, row)
+            for flags in range(2**self.flag_bits):
+                if self.condition(instruction, flags):
+                    start = self.address(flags, opcode)
+                    rom[start:start + self.steps] = taken
+
+        return rom
+
+
+class FactoredRom:
+    """
+    A control store split into its distinct rows of micro-steps and an
+    index ROM giving the row for each {flags, opcode}. Conditional jumps
+    whose condition fails share the NOP row, and the other opcodes repeat
+    one row for every flag combination, so only a handful of rows remain.
+
+        rom[builder.address(flags, opcode, step)] == rows[index[(flags << opcode_bits) | opcode]][step]
+    """
+
+    def __init__(self, builder: 'RomBuilder', rom: 'array', word_bits: 'int|None'=None):
+        self.builder = builder
+        self.word_bits = word_bits if word_bits is not None else max(max(rom).bit_length(), 1)
+
+        self.rows: 'list[tuple[int, ...]]' = []
+        self.index: 'list[int]' = []
+        numbers = {}
+        for start in range(0, len(rom), builder.steps):
+            row = tuple(rom[start:start + builder.steps])
+            if row not in numbers:
+                numbers[row] = len(self.rows)
+                self.rows.append(row)
+            self.index.append(numbers[row])
+
+        self.words = sorted(set(rom))
+
+    @property
+    def row_bits(self) -> 'int':
+        return max((len(self.rows) - 1).bit_length(), 1)
+
+    def stats(self) -> 'dict':
+        """Bits needed by the flat ROM and by the row and word level factorings"""
+        flat = self.builder.size * self.word_bits
+        rows = len(self.rows) * self.builder.steps * self.word_bits + len(self.index) * self.row_bits
+        words = len(self.words) * self.word_bits + self.builder.size * max((len(self.words) - 1).bit_length(), 1)
+        return {
+            'flat_bits': flat,
+            'rows': len(self.rows),
+            'row_factored_bits': rows,
+            'words': len(self.words),
+            'word_factored_bits': words,
+        }
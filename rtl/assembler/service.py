@@ -0,0 +1,250 @@
+"""In-memory assembly API and a Unix-socket daemon serving it as line-delimited JSON"""
+
+import json
+import os
+import re
+import socket
+import socketserver
+import tempfile
+
+try:
+    from assembler import Visitor
+    from isa import PROFILES
+except ImportError:
+    from assembler.assembler import Visitor
+    from assembler.isa import PROFILES
+
+
+def default_socket() -> 'str':
+    """
+    A per-user socket path: in $XDG_RUNTIME_DIR when set (private to the
+    user), otherwise in the temp directory with the uid in the name
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'eater-assembler.sock')
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f'eater-assembler-{user}.sock')
+
+
+DEFAULT_SOCKET = default_socket()
+
+# Position prefix of SyntaxErrors from both frontends ("line 3:7 ...")
+POSITION = re.compile(r'^line (\d+):(\d+) ')
+
+
+def error_dict(error: 'Exception') -> 'dict':
+    message = str(error.args[0]) if len(error.args) == 1 else str(error)
+    line = getattr(error, 'line', None)
+    column = None
+    match = POSITION.match(message)
+    if match:
+        line, column = int(match[1]), int(match[2])
+        message = message[match.end():]
+    return {'type': type(error).__name__, 'message': message, 'line': line, 'column': column}
+
+
+def assemble_source(source: 'str|bytes', isa: 'str'='eater16', frontend: 'str'='fast', optimize: 'bool'=False) -> 'dict':
+    """
+    Assemble source into a JSON-ready result:
+
+        ok          whether assembly succeeded
+        program     the full RAM image as a hex string
+        size        bytes used by instructions and variables
+        labels      {name: address}
+        variables   {name: {'address', 'value', 'const'}}
+        errors      [{'type', 'message', 'line', 'column'}]
+
+    Problems in the source are reported in errors rather than raised.
+    """
+    if isa not in PROFILES:
+        raise ValueError(f'Unknown ISA profile "{isa}" (expected one of {list(PROFILES)})')
+
+    visitor = Visitor()
+    try:
+        visitor.parse_source(source, PROFILES[isa], frontend=frontend, optimize=optimize)
+    except (SyntaxError, NameError, KeyError, ValueError, IndexError) as e:
+        return {'ok': False, 'program': None, 'size': None, 'labels': {}, 'variables': {}, 'errors': [error_dict(e)]}
+
+    program, size = visitor.get_program()
+    return {
+        'ok': True,
+        'program': bytes(program).hex(),
+        'size': size,
+        'labels': {name: label.address for name, label in visitor.labels.items()},
+        'variables': {
+            name: {'address': None if var.const else var.address, 'value': var.initializer, 'const': var.const}
+            for name, var in visitor.variables.items()
+        },
+        'errors': [],
+    }
+
+
+def handle_request(request: 'dict') -> 'dict':
+    """
+    One request object: {"source": ...} or {"path": ...}, plus optional
+    "isa", "frontend", "optimize" and an "id" echoed back in the response.
+    """
+    try:
+        if 'source' in request:
+            source = request['source']
+            if not isinstance(source, (str, bytes)):
+                raise TypeError(f'"source" must be a string (got {type(source).__name__})')
+        elif 'path' in request:
+            if not isinstance(request['path'], str):
+                raise TypeError(f'"path" must be a string (got {type(request["path"]).__name__})')
+            with open(request['path'], 'r', encoding='utf-8') as file:
+                source = file.read()
+        else:
+            raise ValueError('Request needs "source" or "path"')
+        for key in ('isa', 'frontend'):
+            if not isinstance(request.get(key, ''), str):
+                raise TypeError(f'"{key}" must be a string (got {type(request[key]).__name__})')
+
+        response = assemble_source(
+            source,
+            isa=request.get('isa', 'eater16'),
+            frontend=request.get('frontend', 'fast'),
+            optimize=bool(request.get('optimize', False)),
+        )
+    except Exception as e:
+        # Besides bad requests (OSError, ValueError, TypeError), anything else
+        # one request trips over is reported rather than dropping the connection
+        response = {'ok': False, 'errors': [error_dict(e)]}
+
+    if 'id' in request:
+        response['id'] = request['id']
+    return response
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON request per line and writes one JSON response per line"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('Request must be a JSON object')
+            except ValueError as e:
+                response = {'ok': False, 'errors': [error_dict(e)]}
+            else:
+                response = handle_request(request)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class AssemblerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Each connection gets a thread and may send any number of requests, so
+    a client that keeps its connection open pays no per-snippet startup.
+    """
+    daemon_threads = True
+
+    def __init__(self, path: 'str'=DEFAULT_SOCKET):
+        # A socket file left behind by a daemon that died would block bind()
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nothing is listening; anything else (EACCES on someone
+                # else's socket) is raised rather than unlinking it
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                raise OSError(f'An assembler service is already listening on {path}')
+            finally:
+                probe.close()
+        super().__init__(path, RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+class AssemblerClient:
+    """Keeps one connection to the daemon open across calls"""
+
+    def __init__(self, path: 'str'=DEFAULT_SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, request: 'dict') -> 'dict':
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError('Assembler service closed the connection')
+        return json.loads(line)
+
+    def assemble(self, source: 'str', **options) -> 'dict':
+        return self.request({'source': source, **options})
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from formatter import format_bytes, write_if_changed
+
+    parser = argparse.ArgumentParser(description='Assembler service over a Unix socket')
+    parser.add_argument('-s', '--socket', type=str, default=DEFAULT_SOCKET, help='socket path')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('serve', help='run the daemon')
+
+    client = commands.add_parser('assemble', help='assemble a file through a running daemon')
+    client.add_argument('file', type=str, help='input file')
+    client.add_argument('-o', type=str, help='output hex file')
+    client.add_argument('-f', '--frontend', type=str, default='fast', choices=Visitor.FRONTENDS, help='parser frontend')
+    client.add_argument('-i', '--isa', type=str, default='eater16', choices=list(PROFILES), help='target ISA profile')
+    client.add_argument('-O', '--optimize', action='store_true', help='apply peephole optimizations')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        with AssemblerServer(args.socket) as server:
+            print(f'listening on {args.socket}', file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        sys.exit(0)
+
+    with AssemblerClient(args.socket) as connection:
+        response = connection.request({
+            'path': os.path.abspath(args.file),
+            'isa': args.isa,
+            'frontend': args.frontend,
+            'optimize': args.optimize,
+        })
+
+    if not response['ok']:
+        for error in response['errors']:
+            position = f':{error["line"]}' if error['line'] is not None else ''
+            print(f'{args.file}{position}: {error["type"]}: {error["message"]}', file=sys.stderr)
+        sys.exit(1)
+
+    formatted_program = format_bytes(bytes.fromhex(response['program']), 1)
+    if args.o:
+        write_if_changed(args.o, formatted_program)
+    else:
+        print(formatted_program)
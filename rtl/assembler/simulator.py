@@ -0,0 +1,215 @@
+"""Cycle-accurate Python model of the eater.v datapath and control logic"""
+
+import time
+
+try:
+    from machine import Control, MachineCode, machine_code
+    from formatter import read_readmem
+    from rom import RomBuilder
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode, machine_code
+    from assembler.formatter import read_readmem
+    from assembler.rom import RomBuilder
+
+
+def build_rom(instructions: 'list[MachineCode]'=machine_code) -> 'list[int]':
+    """Linearize the control words of every instruction into a microcode ROM"""
+    return RomBuilder().build(instructions).tolist()
+
+
+class Simulator:
+    """
+    Steps the eater.v state machine one micro-instruction at a time.
+
+    Every micro-step takes two clocks in eater.v: one to fetch the
+    control word (instruction_ready low) and one to assert it. A word
+    with Control.NX ends the instruction, restarting at micro-step 0, or
+    at 1 with Control.NF when it already did the next fetch's first step.
+    """
+
+    CLOCKS_PER_STEP = 2
+
+    OPERAND_MASK = 0xF
+
+    def __init__(self, rom: 'list[int]', ram: 'list[int]', profiler=None):
+        if len(rom) != 2**MachineCode.total_bits():
+            raise ValueError(f'ROM must have {2**MachineCode.total_bits()} words (got {len(rom)})')
+        if len(ram) == 0 or len(ram) & (len(ram) - 1):
+            raise ValueError(f'RAM size must be a power of 2 (got {len(ram)})')
+
+        self.rom = list(rom)
+        self.initial_ram = list(ram)
+        self.address_mask = len(ram) - 1
+        # See profiler.Profiler; checked once per run() so it costs nothing when unset
+        self.profiler = profiler
+        self.reset()
+
+    def reset(self):
+        self.ram = list(self.initial_ram)
+        self.a = 0
+        self.b = 0
+        self.pc = 0
+        self.ir = 0
+        self.mar = 0
+        self.flags = 0
+        self.step_count = 0
+        self.micro_step = 0
+        self.halted = False
+        self.output = 0
+        self.outputs: 'list[int]' = []
+        self.elapsed = 0.0
+
+    @property
+    def cycles(self) -> 'int':
+        """Number of clocks elapsed since reset"""
+        return self.step_count * Simulator.CLOCKS_PER_STEP
+
+    @property
+    def cycles_per_second(self) -> 'float':
+        return self.cycles / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def address(self) -> 'int':
+        """Current microcode ROM address, {flag_zero, flag_carry, opcode, micro_instruction}"""
+        return (
+            (self.flags << (MachineCode.UINSTR_BITS + MachineCode.OPCODE_BITS))
+            | ((self.ir >> 4) << MachineCode.UINSTR_BITS)
+            | self.micro_step
+        )
+
+    def step(self) -> 'bool':
+        """Execute a single micro-step, returning False once halted"""
+        self.run(max_cycles=Simulator.CLOCKS_PER_STEP)
+        return not self.halted
+
+    def run(self, max_cycles: 'int|None'=None) -> 'list[int]':
+        """Run until HLT (or max_cycles clocks have elapsed) and return the OUT stream"""
+        if self.profiler is not None:
+            return self.profiler.run(self, max_cycles)
+        return self.execute(max_cycles)
+
+    def execute(self, max_cycles: 'int|None'=None) -> 'list[int]':
+        rom = self.rom
+        ram = self.ram
+        outputs = self.outputs
+        address_mask = self.address_mask
+        operand_mask = Simulator.OPERAND_MASK
+        step_mask = 2**MachineCode.UINSTR_BITS - 1
+        op_offset = MachineCode.UINSTR_BITS
+        flag_offset = MachineCode.UINSTR_BITS + MachineCode.OPCODE_BITS
+
+        a, b, pc, ir, mar = self.a, self.b, self.pc, self.ir, self.mar
+        flags, micro_step, output = self.flags, self.micro_step, self.output
+        halted = self.halted
+
+        steps = 0
+        max_steps = None if max_cycles is None else max_cycles // Simulator.CLOCKS_PER_STEP
+
+        start = time.perf_counter()
+        while not halted and (max_steps is None or steps < max_steps):
+            word = rom[(flags << flag_offset) | ((ir >> 4) << op_offset) | micro_step]
+            micro_step = (micro_step + 1) & step_mask
+            steps += 1
+
+            if not word:
+                continue
+
+            bus = 0
+            if word & Control.RO:
+                bus |= ram[mar]
+            if word & Control.IO:
+                bus |= ir & operand_mask
+            if word & Control.AO:
+                bus |= a
+            if word & Control.CO:
+                bus |= pc
+            if word & (Control.EO | Control.FI):
+                total = (a - b) & 0x1FF if word & Control.SU else a + b
+                if word & Control.EO:
+                    bus |= total & 0xFF
+
+            if word & Control.J:
+                pc = bus & address_mask
+            elif word & Control.CE:
+                pc = (pc + 1) & address_mask
+            if word & Control.FI:
+                flags = (((total & 0xFF) == 0) << 1) | (total >> 8)
+            if word & Control.RI:
+                ram[mar] = bus
+            if word & Control.MI:
+                mar = bus & address_mask
+            if word & Control.AI:
+                a = bus
+            if word & Control.BI:
+                b = bus
+            if word & Control.II:
+                ir = bus
+            if word & Control.OI:
+                output = bus
+                outputs.append(bus)
+            if word & Control.HLT:
+                halted = True
+            if word & Control.NX:
+                micro_step = 1 if word & Control.NF else 0
+        self.elapsed += time.perf_counter() - start
+
+        self.a, self.b, self.pc, self.ir, self.mar = a, b, pc, ir, mar
+        self.flags, self.micro_step, self.output = flags, micro_step, output
+        self.halted = halted
+        self.step_count += steps
+
+        return outputs
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Eater microcode simulator')
+    parser.add_argument('file', type=str, help='assembly file or $readmemh program hex')
+    parser.add_argument('-r', '--rom', type=str, help='instruction ROM hex (generated from machine.py by default)')
+    parser.add_argument('-c', '--max-cycles', type=int, default=2**20, help='clock limit for programs that never halt')
+    parser.add_argument('-p', '--profile', action='store_true', help='print an execution profile')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', help='assembler parser frontend')
+    parser.add_argument('--load', type=str, help='start from a state written by --save instead of reset')
+    parser.add_argument('--save', type=str, help='write the final state to this file')
+
+    args = parser.parse_args()
+
+    rom = read_readmem(args.rom) if args.rom else build_rom()
+
+    statements = None
+    if args.file.endswith('.hex'):
+        ram = read_readmem(args.file)
+    else:
+        from assembler import Visitor
+
+        visitor = Visitor()
+        visitor.parse(args.file, 16, frontend=args.frontend)
+        ram, _ = visitor.get_program()
+        statements = visitor.statements
+
+    profiler = None
+    if args.profile:
+        from profiler import Profiler
+        profiler = Profiler(len(ram))
+
+    simulator = Simulator(rom, ram, profiler=profiler)
+    if args.load:
+        from snapshot import load
+        load(args.load, simulator)
+    outputs = simulator.run(args.max_cycles)
+    if args.save:
+        from snapshot import save
+        save(args.save, simulator)
+
+    print(' '.join(str(v) for v in outputs))
+    status = 'halted' if simulator.halted else 'cycle limit reached'
+    print(f'{status} after {simulator.cycles} cycles ({simulator.cycles_per_second:,.0f} cycles/s)')
+
+    if profiler is not None:
+        source = None
+        if statements is not None:
+            with open(args.file, 'r') as file:
+                source = file.read().splitlines()
+        print()
+        print(profiler.format_report(statements, source))
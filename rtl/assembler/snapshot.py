@@ -0,0 +1,162 @@
+"""Packed snapshots of Simulator state, periodic checkpoints and reverse stepping"""
+
+import struct
+import zlib
+from collections import deque
+
+try:
+    from simulator import Simulator
+except ModuleNotFoundError:
+    from assembler.simulator import Simulator
+
+
+# a, b, pc, ir, mar, flags, micro_step, halted, output, step_count, len(outputs)
+STATE = struct.Struct('<BBHBHBBBBQI')
+
+# File header: magic, format version, CRC32 of the ROM the state was taken
+# with. Version 2 added the OUT history after the state.
+FILE_MAGIC = b'EATS'
+FILE_VERSION = 2
+FILE_HEADER = struct.Struct('<4sBI')
+
+
+def capture(simulator: 'Simulator') -> 'bytes':
+    """
+    The simulator's state packed into bytes: its registers, micro-step, step
+    count and the number of outputs so far, followed by RAM. The ROM and the
+    output history aren't included.
+    """
+    return STATE.pack(
+        simulator.a, simulator.b, simulator.pc, simulator.ir, simulator.mar,
+        simulator.flags, simulator.micro_step, simulator.halted, simulator.output,
+        simulator.step_count, len(simulator.outputs),
+    ) + bytes(simulator.ram)
+
+
+def restore(simulator: 'Simulator', snapshot: 'bytes'):
+    """
+    Put the simulator back in a captured state. Outputs after the snapshot
+    are dropped, so restoring one taken earlier in the same run rewinds the
+    OUT stream as well. A snapshot holds no output history, so restoring
+    one into a simulator with fewer outputs leaves them short; load() puts
+    back the history save() wrote.
+    """
+    ram = snapshot[STATE.size:]
+    if len(ram) != len(simulator.ram):
+        raise ValueError(f'Snapshot has {len(ram)} bytes of RAM (simulator has {len(simulator.ram)})')
+
+    (simulator.a, simulator.b, simulator.pc, simulator.ir, simulator.mar,
+     simulator.flags, simulator.micro_step, halted, simulator.output,
+     simulator.step_count, outputs) = STATE.unpack_from(snapshot)
+    simulator.halted = bool(halted)
+    # ram is replaced in place: execute() reads it through self.ram anyway
+    simulator.ram[:] = ram
+    del simulator.outputs[outputs:]
+
+
+def rom_checksum(rom: 'list[int]') -> 'int':
+    # Fixed width little-endian words, so files move between platforms
+    return zlib.crc32(struct.pack(f'<{len(rom)}I', *rom))
+
+
+def save(path: 'str', simulator: 'Simulator'):
+    """
+    Write the simulator's state and OUT history to path, tagged with its
+    ROM's checksum
+    """
+    with open(path, 'wb') as file:
+        file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, rom_checksum(simulator.rom)))
+        file.write(capture(simulator))
+        file.write(bytes(simulator.outputs))
+
+
+def load(path: 'str', simulator: 'Simulator'):
+    """Restore a state written by save(), refusing one taken with a different ROM"""
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    if len(data) < FILE_HEADER.size + STATE.size:
+        raise ValueError(f'{path} is too short to be a snapshot')
+    magic, version, checksum = FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC:
+        raise ValueError(f'{path} is not a snapshot')
+    if version != FILE_VERSION:
+        raise ValueError(f'{path} is snapshot version {version} (expected {FILE_VERSION})')
+    if checksum != rom_checksum(simulator.rom):
+        raise ValueError(f'{path} was taken with a different microcode ROM')
+
+    state = data[FILE_HEADER.size:FILE_HEADER.size + STATE.size + len(simulator.ram)]
+    outputs = data[FILE_HEADER.size + len(state):]
+    if len(outputs) != STATE.unpack_from(state)[-1]:
+        raise ValueError(f'{path} does not hold a snapshot of {len(simulator.ram)} bytes of RAM')
+
+    restore(simulator, state)
+    simulator.outputs[:] = outputs
+
+
+class Recorder:
+    """
+    Runs a Simulator while keeping a checkpoint every interval clocks in a
+    ring buffer of the last capacity snapshots, so memory stays bounded
+    however long the run. seek() restores the nearest checkpoint at or
+    before an earlier target and re-executes the remainder, which is never
+    more than interval clocks. Seeking forward just runs on.
+
+        recorder = Recorder(simulator, interval=1024)
+        recorder.run(100000)
+        recorder.step_back()     # one micro-step back
+        recorder.seek(5000)      # to clock 5000, if still in the buffer
+    """
+
+    def __init__(self, simulator: 'Simulator', interval: 'int'=1024, capacity: 'int'=256):
+        if interval < Simulator.CLOCKS_PER_STEP or interval % Simulator.CLOCKS_PER_STEP:
+            raise ValueError(f'Interval must be a positive multiple of {Simulator.CLOCKS_PER_STEP} clocks (got {interval})')
+        if capacity < 1:
+            raise ValueError(f'Capacity must be at least 1 (got {capacity})')
+
+        self.simulator = simulator
+        self.interval = interval
+        self.checkpoints: 'deque[tuple[int, bytes]]' = deque(maxlen=capacity)
+        self.checkpoint()
+
+    @property
+    def oldest(self) -> 'int':
+        """Earliest clock seek() can still reach"""
+        return self.checkpoints[0][0]
+
+    def checkpoint(self):
+        cycles = self.simulator.cycles
+        # After seeking back, the checkpoints from here on are of the old future
+        while self.checkpoints and self.checkpoints[-1][0] >= cycles:
+            self.checkpoints.pop()
+        self.checkpoints.append((cycles, capture(self.simulator)))
+
+    def run(self, max_cycles: 'int|None'=None) -> 'list[int]':
+        """Simulator.run, stopping at each interval boundary for a checkpoint"""
+        simulator = self.simulator
+        end = None if max_cycles is None else simulator.cycles + max_cycles
+        while not simulator.halted and (end is None or simulator.cycles < end):
+            boundary = (simulator.cycles // self.interval + 1) * self.interval
+            simulator.run(boundary - simulator.cycles if end is None else min(boundary, end) - simulator.cycles)
+            if simulator.cycles == boundary:
+                self.checkpoint()
+        return simulator.outputs
+
+    def seek(self, cycles: 'int') -> 'list[int]':
+        """Put the simulator in its state after the given number of clocks since reset"""
+        if cycles < self.oldest:
+            raise ValueError(f'Clock {cycles} is older than the oldest checkpoint ({self.oldest})')
+
+        simulator = self.simulator
+        target = cycles - cycles % Simulator.CLOCKS_PER_STEP
+        if target >= simulator.cycles:
+            return self.run(target - simulator.cycles)
+
+        start, snapshot = next((start, snapshot) for start, snapshot in reversed(self.checkpoints) if start <= target)
+        restore(simulator, snapshot)
+        # Re-executed without the profiler, which already saw these clocks
+        return simulator.execute(target - start)
+
+    def step_back(self, steps: 'int'=1) -> 'list[int]':
+        """Undo the last steps micro-steps"""
+        return self.seek(max(self.simulator.cycles - steps * Simulator.CLOCKS_PER_STEP, 0))
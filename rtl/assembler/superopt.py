@@ -0,0 +1,526 @@
+"""Exhaustive search for cheaper instruction sequences equivalent to a snippet"""
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from machine import Control, MachineCode, machine_dict
+    from frontend import Parser
+    from analyzer import instruction_cycles
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode, machine_dict
+    from assembler.frontend import Parser
+    from assembler.analyzer import instruction_cycles
+
+
+# Instructions the search draws from. Jumps and HLT end a basic block, NOP
+# never shortens anything and B is always loaded before it is read, so LDB
+# has no lasting effect.
+ALPHABET = ['LDA', 'STA', 'LDI', 'ADD', 'SUB', 'ADI', 'SBI', 'OUT']
+
+# Inputs checked when the space is too large to enumerate
+SAMPLED_STATES = 2**20
+
+# State columns; RAM follows, then one column per OUT
+A, B, FLAGS, RAM = 0, 1, 2, 3
+
+# Values every batch includes besides the random ones
+BOUNDARY = [0x00, 0x01, 0x0F, 0x10, 0x7F, 0x80, 0x81, 0xFE, 0xFF]
+
+
+class Snippet:
+    """
+    A straight-line piece of assembly. `let` variables become the RAM the
+    search may use (plus any scratch `temps`), `const`s are folded into
+    literals, and everything listed in `dead` is left out of the comparison
+    ('A', 'flags' or a variable name).
+    """
+
+    def __init__(self, source: 'str', temps: 'int'=0, dead: 'list[str]'=()):
+        self.variables: 'list[str]' = []
+        consts: 'dict[str, int]' = {}
+        self.instructions: 'list[tuple[str, int|None]]' = []
+
+        for kind, identifier, value in Parser(source).parse():
+            if kind == 'let':
+                self.variables.append(identifier)
+            elif kind == 'const':
+                consts[identifier] = value
+            elif kind == 'label':
+                raise ValueError(f'Snippets must be straight-line code (found label "{identifier}")')
+            else:
+                self.instructions.append(self.operation(identifier, value, consts))
+
+        self.program_variables = len(self.variables)
+        self.variables += [f'_t{i}' for i in range(temps)]
+
+        dead = set(dead)
+        unknown = dead - set(self.variables) - {'A', 'flags'}
+        if unknown:
+            raise NameError(f'Unknown dead locations {sorted(unknown)}')
+        self.live_a = 'A' not in dead
+        self.live_flags = 'flags' not in dead
+        self.live_ram = [i for i, v in enumerate(self.variables[:self.program_variables]) if v not in dead]
+        self.outputs = sum(m == 'OUT' for m, _ in self.instructions)
+
+    def operation(self, mnemonic: 'str', args: 'list[tuple]', consts: 'dict[str, int]') -> 'tuple':
+        mnemonic = mnemonic.upper()
+        machine = machine_dict.get(mnemonic)
+        if machine is None:
+            raise NameError(f'Unknown mnemonic "{mnemonic}"')
+        if any(u & (Control.J | Control.HLT) for u in machine.uinstructions):
+            raise ValueError(f'"{mnemonic}" cannot appear in a straight-line snippet')
+        if not machine.arg_type:
+            return (mnemonic, None)
+        if len(args) != len(machine.arg_type):
+            raise ValueError(f'Instruction "{mnemonic}" does not match expected arguments')
+
+        kind, value = args[0]
+        if machine.arg_type[0] == MachineCode.ADDRESS:
+            if kind != 'identifier' or value not in self.variables:
+                raise ValueError(f'"{mnemonic}" expects a let variable, not {value}')
+            return (mnemonic, self.variables.index(value))
+        if kind == 'identifier':
+            if value not in consts:
+                raise ValueError(f'"{value}" does not have a const compile time value')
+            value = consts[value]
+        return (mnemonic, value)
+
+    def alphabet(self) -> 'list[tuple]':
+        ops = []
+        for mnemonic in ALPHABET:
+            machine = machine_dict[mnemonic]
+            if mnemonic == 'OUT' and not self.outputs:
+                continue
+            if not machine.arg_type:
+                ops.append((mnemonic, None))
+            elif machine.arg_type[0] == MachineCode.ADDRESS:
+                ops.extend((mnemonic, i) for i in range(len(self.variables)))
+            else:
+                ops.extend((mnemonic, n) for n in range(2**machine.arg_bits))
+        return ops
+
+    def format(self, sequence: 'list[tuple]') -> 'str':
+        lines = []
+        for mnemonic, operand in sequence:
+            machine = machine_dict[mnemonic]
+            if operand is None:
+                lines.append(mnemonic.lower())
+            elif machine.arg_type[0] == MachineCode.ADDRESS:
+                lines.append(f'{mnemonic.lower()} {self.variables[operand]}')
+            else:
+                lines.append(f'{mnemonic.lower()} {operand}')
+        return '\n'.join(lines)
+
+    def columns(self) -> 'list[int]':
+        """State columns compared between the target and a candidate"""
+        columns = ([A] if self.live_a else []) + ([FLAGS] if self.live_flags else [])
+        columns += [RAM + i for i in self.live_ram]
+        return columns + list(range(RAM + len(self.variables), RAM + len(self.variables) + self.outputs))
+
+
+# (operation, ram_size) -> effects from compile_operation
+_compiled = {}
+
+
+def compile_operation(operation: 'tuple', ram_size: 'int') -> 'list[tuple]|None':
+    """
+    Symbolically run an instruction's micro-instructions, giving the
+    (column, expression) assignments it makes in terms of the state before
+    it ran. Expressions are ('col', c), ('const', n), ('or', ...),
+    ('sum', a, b, subtract), ('low', sum) and ('flags', sum). Returns None
+    when the RAM address depends on data, which only interpret handles.
+    """
+    mnemonic, operand = operation
+    regs = {A: ('col', A), B: ('col', B)}
+    ram = {}
+    flags = None
+    out = None
+    mar = None
+
+    for word in machine_dict[mnemonic].uinstructions:
+        if not word:
+            continue
+
+        sources = []
+        if word & (Control.RO | Control.RI) and mar is None:
+            return None
+        if word & Control.RO:
+            sources.append(ram.get(RAM + mar, ('col', RAM + mar)))
+        if word & Control.IO:
+            sources.append(('const', (operand or 0) & 0xF))
+        if word & Control.AO:
+            sources.append(regs[A])
+        if word & (Control.EO | Control.FI):
+            total = ('sum', regs[A], regs[B], bool(word & Control.SU))
+            if word & Control.EO:
+                sources.append(('low', total))
+        bus = sources[0] if len(sources) == 1 else ('or', *sources) if sources else ('const', 0)
+
+        if word & Control.FI:
+            flags = ('flags', total)
+        if word & Control.RI:
+            ram[RAM + mar] = bus
+        if word & Control.MI:
+            if bus[0] != 'const':
+                return None
+            mar = bus[1] % ram_size
+        if word & Control.AI:
+            regs[A] = bus
+        if word & Control.BI:
+            regs[B] = bus
+        if word & Control.OI:
+            out = bus
+
+    effects = [(column, expr) for column, expr in list(regs.items()) + list(ram.items()) if expr != ('col', column)]
+    if flags is not None:
+        effects.append((FLAGS, flags))
+    if out is not None:
+        effects.append(('out', out))
+    return effects
+
+
+def evaluate(state: 'np.ndarray', expr: 'tuple'):
+    kind = expr[0]
+    if kind == 'col':
+        return state[:, expr[1]]
+    if kind == 'const':
+        return expr[1]
+    if kind == 'or':
+        value = evaluate(state, expr[1])
+        for operand in expr[2:]:
+            value = value | evaluate(state, operand)
+        return value
+    if kind == 'sum':
+        a = np.asarray(evaluate(state, expr[1])).astype(np.int16)
+        b = np.asarray(evaluate(state, expr[2])).astype(np.int16)
+        return (a - b) & 0x1FF if expr[3] else a + b
+    total = evaluate(state, expr[1])
+    if kind == 'low':
+        return total & 0xFF
+    return (((total & 0xFF) == 0) << 1) | (total >> 8)
+
+
+def execute(state: 'np.ndarray', operation: 'tuple', outputs: 'int', ram_size: 'int') -> 'np.ndarray':
+    """Apply one instruction to every row of state, returning the new state"""
+    key = (operation, ram_size)
+    if key not in _compiled:
+        _compiled[key] = compile_operation(operation, ram_size)
+    effects = _compiled[key]
+    if effects is None:
+        return interpret(state, operation, outputs, ram_size)
+
+    values = [evaluate(state, expr) for _, expr in effects]
+    state = state.copy()
+    for (column, _), value in zip(effects, values):
+        state[:, RAM + ram_size + outputs if column == 'out' else column] = value
+    return state
+
+
+def interpret(state: 'np.ndarray', operation: 'tuple', outputs: 'int', ram_size: 'int') -> 'np.ndarray':
+    """
+    Run one instruction's micro-instructions (from machine_dict, without the
+    fetch cycle) over every row of state, returning the new state.
+    """
+    mnemonic, operand = operation
+    machine = machine_dict[mnemonic]
+    state = state.copy()
+    rows = np.arange(state.shape[0])
+    mar = None
+
+    for word in machine.uinstructions:
+        if not word:
+            continue
+
+        bus = np.zeros(state.shape[0], dtype=np.uint16)
+        if word & Control.RO:
+            bus |= state[rows, RAM + mar] if isinstance(mar, np.ndarray) else state[:, RAM + mar]
+        if word & Control.IO:
+            bus |= (operand or 0) & 0xF
+        if word & Control.AO:
+            bus |= state[:, A]
+        if word & (Control.EO | Control.FI):
+            a = state[:, A].astype(np.int16)
+            b = state[:, B].astype(np.int16)
+            total = (a - b) & 0x1FF if word & Control.SU else a + b
+            if word & Control.EO:
+                bus |= (total & 0xFF).astype(np.uint16)
+
+        if word & Control.FI:
+            state[:, FLAGS] = (((total & 0xFF) == 0) << 1) | (total >> 8)
+        if word & Control.RI:
+            if isinstance(mar, np.ndarray):
+                state[rows, RAM + mar] = bus
+            else:
+                state[:, RAM + mar] = bus
+        if word & Control.MI:
+            # Operands are variable indices, so the bus is nearly always the same on every row
+            mar = bus.astype(np.intp) % ram_size
+            if (mar == mar[0]).all():
+                mar = int(mar[0])
+        if word & Control.AI:
+            state[:, A] = bus
+        if word & Control.BI:
+            state[:, B] = bus
+        if word & Control.OI:
+            state[:, RAM + ram_size + outputs] = bus
+
+    return state
+
+
+def initial_states(snippet: 'Snippet', samples: 'int', seed: 'int'=0) -> 'np.ndarray':
+    """Random states plus every boundary value in A and in each variable"""
+    width = RAM + len(snippet.variables) + snippet.outputs
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 256, size=(samples, width), dtype=np.uint8)
+    states[:, FLAGS] &= 0b11
+
+    boundary = []
+    for column in [A] + [RAM + i for i in range(len(snippet.variables))]:
+        for value in BOUNDARY:
+            row = rng.integers(0, 256, size=width, dtype=np.uint8)
+            row[FLAGS] &= 0b11
+            row[column] = value
+            boundary.append(row)
+    states = np.vstack([states, np.array(boundary, dtype=np.uint8)])
+    states[:, RAM + len(snippet.variables):] = 0
+    return states
+
+
+def run_sequence(state: 'np.ndarray', sequence: 'list[tuple]', ram_size: 'int') -> 'np.ndarray':
+    outputs = 0
+    for operation in sequence:
+        state = execute(state, operation, outputs, ram_size)
+        outputs += operation[0] == 'OUT'
+    return state
+
+
+def reads(sequence: 'list[tuple]') -> 'tuple[bool, set[int]]':
+    """Whether A and which variables are read before the sequence writes them"""
+    written_a = False
+    written = set()
+    read_a = False
+    read = set()
+    for mnemonic, operand in sequence:
+        if mnemonic in ('STA', 'OUT', 'ADI', 'SBI', 'ADD', 'SUB') and not written_a:
+            read_a = True
+        if mnemonic in ('LDA', 'LDB', 'ADD', 'SUB') and operand not in written:
+            read.add(operand)
+        if mnemonic in ('LDA', 'LDI', 'ADI', 'SBI', 'ADD', 'SUB'):
+            written_a = True
+        if mnemonic == 'STA':
+            written.add(operand)
+    return read_a, read
+
+
+def exhaustive_check(snippet: 'Snippet', candidate: 'list[tuple]', limit: 'int', chunk: 'int'=2**18) -> 'str|None':
+    """
+    Compare candidate and target over every value of the inputs either of
+    them reads (and every flag setting). Returns 'exhaustive', 'sampled' when
+    the input space exceeds limit and SAMPLED_STATES random states were used
+    instead, or None when a counterexample turns up.
+    """
+    ram_size = len(snippet.variables)
+    read_a, read = reads(snippet.instructions)
+    cand_a, cand_read = reads(candidate)
+    inputs = ([A] if read_a or cand_a else []) + [RAM + v for v in sorted(read | cand_read)]
+    columns = snippet.columns()
+    width = RAM + ram_size + snippet.outputs
+
+    space = 4 * 256**len(inputs)
+    method = 'exhaustive' if space <= limit else 'sampled'
+    total = space if method == 'exhaustive' else SAMPLED_STATES
+
+    rng = np.random.default_rng(1)
+    for start in range(0, total, chunk):
+        count = min(chunk, total - start)
+        states = np.zeros((count, width), dtype=np.uint8)
+        if method == 'exhaustive':
+            index = np.arange(start, start + count, dtype=np.int64)
+            states[:, FLAGS] = index & 0b11
+            index >>= 2
+            for column in inputs:
+                states[:, column] = index & 0xFF
+                index >>= 8
+        else:
+            states[:, :RAM + ram_size] = rng.integers(0, 256, size=(count, RAM + ram_size), dtype=np.uint8)
+            states[:, FLAGS] &= 0b11
+
+        expected = run_sequence(states, snippet.instructions, ram_size)[:, columns]
+        actual = run_sequence(states, candidate, ram_size)[:, columns]
+        if not np.array_equal(expected, actual):
+            return None
+    return method
+
+
+# Search state shared by every worker process, set by init_worker
+_search = {}
+
+
+def init_worker(snippet: 'Snippet', samples: 'int', limit: 'int'):
+    states = initial_states(snippet, samples)
+    ram_size = len(snippet.variables)
+    columns = snippet.columns()
+    _search.update(
+        snippet=snippet,
+        ops=sorted(snippet.alphabet(), key=lambda op: instruction_cycles(machine_dict[op[0]])),
+        states=states,
+        expected=run_sequence(states, snippet.instructions, ram_size)[:, columns],
+        columns=columns,
+        key_columns=[c for c in range(states.shape[1]) if c != B],
+        costs={mnemonic: instruction_cycles(machine_dict[mnemonic]) for mnemonic in ALPHABET},
+        limit=limit,
+    )
+
+
+def sequence_cycles(sequence: 'list[tuple]') -> 'int':
+    return sum(instruction_cycles(machine_dict[m]) for m, _ in sequence)
+
+
+def search(first: 'tuple', length: 'int', bound: 'int') -> 'tuple|None':
+    """
+    Depth-first search for the cheapest sequence of the given length starting
+    with `first` that takes fewer than bound clocks. Each prefix's batch state
+    is computed once and extended by every operation, cheapest first;
+    prefixes that reach a batch state already seen in as few clocks and
+    operations are pruned. Returns (sequence, check, clocks).
+
+    Every instruction changes at most one of A (with the flags), a single
+    variable or a single OUT, so a prefix is also pruned when more of those
+    still differ from the target than there are instructions left, or when
+    even the cheapest instructions would reach the bound.
+    """
+    snippet = _search['snippet']
+    ops = _search['ops']
+    costs = _search['costs']
+    cheapest = min(costs.values())
+    ram_size = len(snippet.variables)
+    registers = int(snippet.live_a) + int(snippet.live_flags)
+    first_output = registers + len(snippet.live_ram)
+    seen = {}
+    best = {'found': None, 'bound': bound}
+
+    def visit(state, outputs, sequence, cycles):
+        depth = len(sequence)
+        mismatched = (state[:, _search['columns']] != _search['expected']).any(axis=0)
+        if mismatched[first_output:first_output + outputs].any():
+            return
+        needed = int(mismatched[registers:first_output].sum()) + snippet.outputs - outputs + bool(mismatched[:registers].any())
+        if needed > length - depth or cycles + (length - depth) * cheapest >= best['bound']:
+            return
+
+        if depth == length:
+            method = exhaustive_check(snippet, sequence, _search['limit'])
+            if method is not None:
+                best.update(found=(list(sequence), method, cycles), bound=cycles)
+            return
+
+        key = hash(state[:, _search['key_columns']].tobytes())
+        if any(c <= cycles and d <= depth for c, d in seen.get(key, ())):
+            return
+        seen.setdefault(key, []).append((cycles, depth))
+
+        for op in ops:
+            if op[0] == 'OUT' and outputs >= snippet.outputs:
+                continue
+            visit(execute(state, op, outputs, ram_size), outputs + (op[0] == 'OUT'), sequence + [op], cycles + costs[op[0]])
+
+    if first[0] == 'OUT' and not snippet.outputs:
+        return None
+    state = execute(_search['states'], first, 0, ram_size)
+    visit(state, int(first[0] == 'OUT'), [first], costs[first[0]])
+    return best['found']
+
+
+def superoptimize(snippet: 'Snippet', max_length: 'int|None'=None, samples: 'int'=64,
+                  limit: 'int'=2**26, jobs: 'int|None'=None) -> 'dict':
+    """
+    Find the cheapest sequence, in clocks, equivalent to snippet and cheaper
+    than it, with up to max_length instructions (the snippet's length by
+    default). Lengths are tried in increasing order, each bounded by the
+    cheapest sequence found so far, until even the cheapest instructions
+    could not beat it. The first operation of each candidate is fanned out
+    over a process pool.
+    """
+    max_length = len(snippet.instructions) if max_length is None else max_length
+    ops = snippet.alphabet()
+    cheapest = min(instruction_cycles(machine_dict[m]) for m in ALPHABET)
+
+    result = {
+        'target': snippet.format(snippet.instructions),
+        'target_cycles': sequence_cycles(snippet.instructions),
+        'best': None,
+        'best_cycles': None,
+        'verified': None,
+        'time': None,
+    }
+
+    start = time.perf_counter()
+    if jobs == 1:
+        init_worker(snippet, samples, limit)
+        mapper = lambda length, bound: map(search, ops, itertools.repeat(length), itertools.repeat(bound))
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(snippet, samples, limit))
+        mapper = lambda length, bound: pool.map(search, ops, itertools.repeat(length), itertools.repeat(bound),
+                                                chunksize=max(1, len(ops) // (4 * (jobs or os.cpu_count() or 1))))
+
+    bound = result['target_cycles']
+    try:
+        for length in range(1, max_length + 1):
+            if length * cheapest >= bound:
+                break
+            found = [f for f in mapper(length, bound) if f is not None]
+            if found:
+                # Ties go to the first in ALPHABET order
+                sequence, method, bound = min(found, key=lambda f: f[2])
+                result['best'] = snippet.format(sequence)
+                result['best_cycles'] = bound
+                result['verified'] = method
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    result['time'] = time.perf_counter() - start
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Superoptimizer for straight-line Eater snippets')
+    parser.add_argument('file', type=str, nargs='?', help='assembly file holding the target snippet')
+    parser.add_argument('-s', '--source', type=str, help='inline snippet, with ; separating lines')
+    parser.add_argument('-d', '--dead', type=str, nargs='*', default=[], help='locations whose final value does not matter (A, flags or variables)')
+    parser.add_argument('-t', '--temps', type=int, default=0, help='scratch variables the search may use')
+    parser.add_argument('-m', '--max-length', type=int, help='longest candidate to try (defaults to the length of the snippet)')
+    parser.add_argument('-n', '--samples', type=int, default=64, help='random states in the fast check')
+    parser.add_argument('-l', '--limit', type=int, default=2**26, help='largest input space checked exhaustively')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (defaults to the CPU count)')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+
+    args = parser.parse_args()
+
+    if args.source is not None:
+        source = args.source.replace(';', '\n')
+    elif args.file is not None:
+        with open(args.file, 'r') as file:
+            source = file.read()
+    else:
+        parser.error('expected a file or --source')
+
+    result = superoptimize(Snippet(source, args.temps, args.dead), args.max_length, args.samples, args.limit, args.jobs)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif result['best'] is None:
+        print(f'no cheaper equivalent found ({result["time"]:.2f} s)')
+    else:
+        print(result['best'])
+        print(f'\n{result["best_cycles"]} cycles instead of {result["target_cycles"]} '
+              f'({result["verified"]} check, {result["time"]:.2f} s)')
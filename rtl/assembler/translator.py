@@ -0,0 +1,516 @@
+"""Basic-block translation of eater programs into Python functions"""
+
+import math
+import time
+
+try:
+    from machine import Control, MachineCode
+    from optimizer import is_instruction
+    from simulator import Simulator
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode
+    from assembler.optimizer import is_instruction
+    from assembler.simulator import Simulator
+
+
+# Flags ORed into the program counter a block returns. The counter is at
+# most 8 bits (it is loaded from the bus), so these never collide with it.
+FETCHED = 1 << 8    # the next instruction's first fetch step is done (Control.NF)
+DIRTY = 1 << 9      # the block stored into the program
+HALTED = 1 << 10
+
+
+class Untranslatable(Exception):
+    """An instruction whose control words can't be specialized, left to the interpreter"""
+
+
+class InstructionCode:
+    """
+    Python statements for one instruction, made by symbolically stepping
+    its control words. Register values are ints when known at translation
+    time and expressions otherwise.
+    """
+
+    def __init__(self, env: 'dict', address_mask: 'int', code: 'set[int]', indent: 'str'):
+        self.env = env
+        self.address_mask = address_mask
+        self.code = code
+        self.indent = indent
+        self.lines: 'list[str]' = []
+        self.dirty = False
+        self.halted = False
+        self.temporaries = 0
+
+    def emit(self, line: 'str'):
+        self.lines.append(self.indent + line)
+
+    def assign(self, register: 'str', value: 'int|str'):
+        self.emit(f'{register} = {value}')
+        self.env[register] = value if isinstance(value, int) else register
+
+    def temporary(self, value: 'str') -> 'str':
+        name = f'v{self.temporaries}'
+        self.temporaries += 1
+        self.emit(f'{name} = {value}')
+        return name
+
+    def step(self, word: 'int'):
+        """Statements for one control word, in the order Simulator.execute applies them"""
+        env = self.env
+        mask = self.address_mask
+
+        parts = []
+        if word & Control.RO:
+            parts.append(f'ram[{env["mar"]}]')
+        if word & Control.IO:
+            ir = env['ir']
+            parts.append(ir & Simulator.OPERAND_MASK if isinstance(ir, int) else f'({ir} & {Simulator.OPERAND_MASK})')
+        if word & Control.AO:
+            parts.append(env['a'])
+        if word & Control.CO:
+            parts.append(env['pc'])
+
+        total = None
+        if word & (Control.EO | Control.FI):
+            a, b = env['a'], env['b']
+            if isinstance(a, int) and isinstance(b, int):
+                total = (a - b) & 0x1FF if word & Control.SU else a + b
+            else:
+                total = self.temporary(f'({a} - {b}) & 0x1FF' if word & Control.SU else f'{a} + {b}')
+            if word & Control.EO:
+                parts.append(total & 0xFF if isinstance(total, int) else f'({total} & 0xFF)')
+
+        known = 0
+        unknown = []
+        for part in parts:
+            if isinstance(part, int):
+                known |= part
+            else:
+                unknown.append(part)
+        bus = ' | '.join(unknown + ([str(known)] if known else [])) if unknown else known
+
+        consumers = sum(bool(word & bit) for bit in (Control.J, Control.RI, Control.MI, Control.AI, Control.BI, Control.II, Control.OI))
+        if isinstance(bus, str) and consumers > 1:
+            bus = self.temporary(bus)
+
+        def masked(value):
+            return value & mask if isinstance(value, int) else f'({value}) & {mask}'
+
+        if word & Control.J:
+            pc = masked(bus)
+            env['pc'] = pc if isinstance(pc, int) else self.temporary(pc)
+        elif word & Control.CE:
+            pc = env['pc']
+            env['pc'] = (pc + 1) & mask if isinstance(pc, int) else self.temporary(f'({pc} + 1) & {mask}')
+        if word & Control.FI:
+            if isinstance(total, int):
+                self.assign('f', (((total & 0xFF) == 0) << 1) | (total >> 8))
+            else:
+                self.assign('f', f'((({total} & 0xFF) == 0) << 1) | ({total} >> 8)')
+        if word & Control.RI:
+            mar = env['mar']
+            self.emit(f'ram[{mar}] = {bus}')
+            # Stores into the program leave the block so it can be retranslated
+            if not isinstance(mar, int) or mar in self.code:
+                self.dirty = True
+        if word & Control.MI:
+            mar = masked(bus)
+            env['mar'] = mar if isinstance(mar, int) else self.temporary(mar)
+        if word & Control.AI:
+            self.assign('a', bus)
+        if word & Control.BI:
+            self.assign('b', bus)
+        if word & Control.II:
+            env['ir'] = bus if isinstance(bus, int) else self.temporary(bus)
+        if word & Control.OI:
+            self.emit(f'out({bus})')
+        if word & Control.HLT:
+            self.halted = True
+
+
+class Translator:
+    """
+    Splits a program into basic blocks at labels, jump targets and the
+    instruction after every jump or HLT, then generates a Python function
+    per block from the control words in the ROM:
+
+        def block(a, b, f, ram, out) -> (pc, a, b, f, cycles)
+
+    The returned program counter carries FETCHED, DIRTY and HALTED, and
+    cycles is the block's precomputed cost along the path taken. Blocks
+    chain through a dispatch dict keyed by program counter. Addresses
+    missing from it, blocks whose bytes have been overwritten (by sta into
+    the program) and the last few clocks before max_cycles run on the
+    Simulator instead, one instruction at a time.
+
+    Only the 16 byte eater.v encoding (one byte per instruction, operand in
+    the low nibble) is supported, as that is all Simulator runs.
+    """
+
+    def __init__(self, ram: 'list[int]', code: 'list[int]', leaders: 'list[int]'=(), rom: 'list[int]|None'=None):
+        if len(ram) == 0 or len(ram) & (len(ram) - 1):
+            raise ValueError(f'RAM size must be a power of 2 (got {len(ram)})')
+        if len(ram) > 256:
+            raise ValueError(f'Program counter is 8 bits, so RAM is at most 256 bytes (got {len(ram)})')
+
+        self.rom = list(rom) if rom is not None else None
+        if self.rom is None:
+            try:
+                from simulator import build_rom
+            except ModuleNotFoundError:
+                from assembler.simulator import build_rom
+            self.rom = build_rom()
+
+        self.ram = list(ram)
+        self.address_mask = len(ram) - 1
+        self.code = set(address for address in code if 0 <= address < len(ram))
+        self.original = {address: self.ram[address] for address in self.code}
+
+        self.leaders = self.find_leaders(leaders)
+        self.source, self.blocks = self.generate()
+
+        namespace = {}
+        exec(compile(self.source, '<translated>', 'exec'), namespace)
+        self.functions = {start: namespace[f'block_{start}'] for start in self.blocks}
+        self.longest = max([max(costs) for costs in self.blocks.values()] + [0])
+
+    @classmethod
+    def from_visitor(cls, visitor, rom: 'list[int]|None'=None) -> 'Translator':
+        """Translate a parsed program (Visitor.parse) using its statements' resolved addresses"""
+        if visitor.isa.operand_bytes:
+            raise ValueError(f'Only one byte instructions can be translated (not {visitor.isa.name})')
+        program, _ = visitor.get_program()
+        code = [s.address for s in visitor.statements if is_instruction(s)]
+        labels = [label.address for label in visitor.labels.values() if label.address is not None]
+        return cls(list(program), code, labels, rom)
+
+    def row(self, flags: 'int', opcode: 'int') -> 'list[int]':
+        start = (flags << (MachineCode.UINSTR_BITS + MachineCode.OPCODE_BITS)) | (opcode << MachineCode.UINSTR_BITS)
+        return self.rom[start:start + 2**MachineCode.UINSTR_BITS]
+
+    def body(self, row: 'list[int]') -> 'tuple[list[int], int]':
+        """
+        The control words an instruction asserts after its fetch, and the
+        micro-steps it is charged (rom.RomBuilder.row_steps): up to and
+        including the word with NX or HLT, less one when the word with NX
+        already did the next fetch's first step.
+        """
+        fetch = len(MachineCode.FETCH_CYCLE)
+        for i, word in enumerate(row):
+            if word & (Control.NX | Control.HLT):
+                if i < fetch:
+                    raise Untranslatable('instruction ends inside the fetch cycle')
+                return row[fetch:i + 1], i + 1 - (1 if word & Control.NF else 0)
+        return row[fetch:], len(row)
+
+    def variants(self, byte: 'int') -> 'list[tuple[list[int], list[int], int]]':
+        """(flag values, body, steps) for each distinct row the opcode byte selects"""
+        opcode = byte >> (8 - MachineCode.OPCODE_BITS)
+        grouped = {}
+        for flags in range(2**MachineCode.Flag.FLAG_BITS):
+            body, steps = self.body(self.row(flags, opcode))
+            grouped.setdefault((tuple(body), steps), []).append(flags)
+
+        variants = [(flags, list(body), steps) for (body, steps), flags in grouped.items()]
+        if len(variants) > 1:
+            # The row is chosen again on every step, so flags written before
+            # the last one would switch rows part way through
+            for _, body, _ in variants:
+                if any(word & Control.FI for word in body[:-1]):
+                    raise Untranslatable('flags change before the instruction ends')
+        return variants
+
+    def targets(self, address: 'int') -> 'list[int]':
+        """Program counters an instruction can leave for"""
+        try:
+            variants = self.variants(self.ram[address])
+        except Untranslatable:
+            return []
+        targets = []
+        for _, body, _ in variants:
+            env = {'a': 'a', 'b': 'b', 'f': 'f', 'pc': (address + 1) & self.address_mask, 'mar': address, 'ir': self.ram[address]}
+            code = InstructionCode(env, self.address_mask, self.code, '')
+            for word in body:
+                code.step(word)
+            if not code.halted:
+                # A store into the program ends the block like a jump would
+                targets.append(env['pc'] | DIRTY if code.dirty and isinstance(env['pc'], int) else env['pc'])
+        return targets
+
+    def find_leaders(self, extra: 'list[int]') -> 'list[int]':
+        leaders = set(address for address in extra if address in self.code)
+        if self.code:
+            leaders.add(min(self.code))
+        for address in self.code:
+            targets = self.targets(address)
+            following = (address + 1) & self.address_mask
+            if targets != [following]:
+                leaders.add(following)
+                leaders.update(target for target in targets if isinstance(target, int))
+        return sorted(address for address in leaders if address in self.code)
+
+    def generate(self) -> 'tuple[str, dict[int, list[int]]]':
+        """Source of every block function, and the clocks each of its exits costs"""
+        lines = []
+        blocks = {}
+        leaders = set(self.leaders)
+        for start in self.leaders:
+            body = []
+            costs = []
+            # A block that can't translate its first instruction is left to the interpreter
+            if self.generate_block(start, leaders, body, costs):
+                lines += [f'def block_{start}(a, b, f, ram, out):'] + body + ['']
+                blocks[start] = costs
+        return '\n'.join(lines), blocks
+
+    def generate_block(self, start: 'int', leaders: 'set[int]', lines: 'list[str]', costs: 'list[int]') -> 'int':
+        """Append the block's statements to lines, returning how many instructions it covers"""
+        env = {'a': 'a', 'b': 'b', 'f': 'f'}
+        address = start
+        steps = 0
+        fetched = 0
+        indent = '    '
+        count = 0
+
+        def leave(pc, flags, steps, indent):
+            clocks = steps * Simulator.CLOCKS_PER_STEP
+            costs.append(clocks)
+            if isinstance(pc, int):
+                lines.append(f'{indent}return {pc | flags}, a, b, f, {clocks}')
+            else:
+                lines.append(f'{indent}return {pc} | {flags}, a, b, f, {clocks}')
+
+        while True:
+            byte = self.ram[address]
+            try:
+                variants = self.variants(byte)
+            except Untranslatable:
+                leave(address, fetched, steps, indent)
+                return count
+            count += 1
+
+            following = (address + 1) & self.address_mask
+            flag_var = env['f']
+            for i, (flags, body, body_steps) in enumerate(variants):
+                branch = indent
+                if len(variants) > 1 and i < len(variants) - 1:
+                    condition = ' or '.join(f'{flag_var} == {value}' for value in flags)
+                    lines.append(f'{indent}if {condition}:')
+                    branch = indent + '    '
+
+                state = dict(env, pc=following, mar=address, ir=byte)
+                code = InstructionCode(state, self.address_mask, self.code, branch)
+                # The fetch leaves PC, MAR and IR as set above; only the rest runs here
+                for word in body:
+                    code.step(word)
+                    if code.halted:
+                        break
+                lines.extend(code.lines)
+
+                total = steps + body_steps
+                next_fetched = FETCHED if body and body[-1] & Control.NF and not code.halted else 0
+                pc = state['pc']
+                if code.halted:
+                    leave(pc, HALTED, total, branch)
+                elif len(variants) > 1 or code.dirty or pc != following or following in leaders or following not in self.code:
+                    leave(pc, next_fetched | (DIRTY if code.dirty else 0), total, branch)
+                else:
+                    # Straight-line code continues with this instruction's state
+                    env = {key: state[key] for key in ('a', 'b', 'f')}
+                    steps = total
+                    fetched = next_fetched
+                    address = following
+                    break
+            else:
+                return count
+
+    def enabled(self, ram: 'list[int]') -> 'dict[int, callable]':
+        """Dispatch entries of the blocks whose bytes still match the translation"""
+        dispatch = {}
+        for start, function in self.functions.items():
+            address = start
+            clean = True
+            while True:
+                if ram[address] != self.original[address]:
+                    clean = False
+                    break
+                address = (address + 1) & self.address_mask
+                if address in self.functions or address not in self.code or address == start:
+                    break
+            if clean:
+                dispatch[start] = function
+                dispatch[start | FETCHED] = function
+        return dispatch
+
+    def run(self, simulator: 'Simulator', max_cycles: 'int|None'=None) -> 'list[int]':
+        """
+        Run simulator's program to HLT (or max_cycles clocks) through the
+        translated blocks, leaving the simulator in the state the
+        interpreter would have reached. Its IR and MAR are only kept up to
+        date where the interpreter takes over.
+        """
+        if len(simulator.ram) != len(self.ram):
+            raise ValueError(f'Translated for {len(self.ram)} bytes of RAM, not {len(simulator.ram)}')
+
+        if max_cycles is not None:
+            # Like Simulator.run, the limit counts whole micro-steps from now
+            max_cycles = simulator.cycles + max_cycles - max_cycles % Simulator.CLOCKS_PER_STEP
+
+        ram = simulator.ram
+        out = simulator.outputs.append
+        mask = self.address_mask
+        limit = math.inf if max_cycles is None else max_cycles - self.longest - Simulator.CLOCKS_PER_STEP
+
+        start = time.perf_counter()
+        # Translated code starts at an instruction boundary: micro-step 0,
+        # or 1 once the first fetch step has put PC in MAR
+        if simulator.micro_step > 1 or (simulator.micro_step == 1 and simulator.mar != simulator.pc):
+            self.interpret(simulator, max_cycles)
+        dispatch = self.enabled(ram)
+
+        # A block credits itself with the next instruction's fetch step when
+        # it did that step (FETCHED), where the interpreter counts it in the
+        # next instruction, so the count moves by one step at each handover
+        a, b, f, pc, cycles = self.load(simulator)
+        synced = True
+        halted = simulator.halted
+        stopped = halted or (max_cycles is not None and simulator.cycles >= max_cycles)
+
+        while not stopped:
+            function = dispatch.get(pc)
+            if function is not None and cycles <= limit:
+                pc, a, b, f, clocks = function(a, b, f, ram, out)
+                cycles += clocks
+                synced = False
+                continue
+
+            if pc & HALTED:
+                pc &= mask
+                halted = True
+                break
+            if pc & DIRTY:
+                pc &= ~DIRTY
+                dispatch = self.enabled(ram)
+                continue
+
+            self.store(simulator, a, b, f, pc, cycles)
+            if self.interpret(simulator, max_cycles):
+                dispatch = self.enabled(ram)
+            a, b, f, pc, cycles = self.load(simulator)
+            synced = True
+            stopped = simulator.halted or (max_cycles is not None and simulator.cycles >= max_cycles)
+
+        if not synced:
+            self.store(simulator, a, b, f, pc, cycles)
+            simulator.halted = halted
+        if simulator.outputs:
+            simulator.output = simulator.outputs[-1]
+        simulator.elapsed += time.perf_counter() - start
+        return simulator.outputs
+
+    @staticmethod
+    def load(simulator: 'Simulator') -> 'tuple[int, int, int, int, int]':
+        """(a, b, flags, pc, cycles) of a simulator at an instruction boundary, as blocks see them"""
+        pc, cycles = simulator.pc, simulator.cycles
+        if simulator.micro_step == 1:
+            pc |= FETCHED
+            cycles -= Simulator.CLOCKS_PER_STEP
+        return simulator.a, simulator.b, simulator.flags, pc, cycles
+
+    def store(self, simulator: 'Simulator', a: 'int', b: 'int', f: 'int', pc: 'int', cycles: 'int'):
+        fetched = pc & FETCHED
+        pc &= self.address_mask
+        simulator.a, simulator.b, simulator.flags, simulator.pc = a, b, f, pc
+        simulator.micro_step = 1 if fetched else 0
+        if fetched:
+            simulator.mar = pc
+            cycles += Simulator.CLOCKS_PER_STEP
+        simulator.step_count = cycles // Simulator.CLOCKS_PER_STEP
+
+    @staticmethod
+    def interpret(simulator: 'Simulator', max_cycles: 'int|None') -> 'bool':
+        """Step the interpreter to the end of the current instruction, returning whether it stored to RAM"""
+        stored = False
+        while not simulator.halted and (max_cycles is None or simulator.cycles < max_cycles):
+            word = simulator.rom[simulator.address]
+            simulator.execute(Simulator.CLOCKS_PER_STEP)
+            stored |= bool(word & Control.RI)
+            if word & Control.NX or simulator.micro_step == 0:
+                break
+        return stored
+
+
+def check(translator: 'Translator', ram: 'list[int]', max_cycles: 'int') -> 'list[str]':
+    """
+    Run ram for max_cycles clocks on the microcode interpreter and through
+    the translation, returning the state that differs between the two
+    """
+    reference = Simulator(translator.rom, ram)
+    reference.run(max_cycles)
+    translated = Simulator(translator.rom, ram)
+    translator.run(translated, max_cycles)
+
+    fields = ['a', 'b', 'flags', 'pc', 'ram', 'outputs', 'halted', 'cycles']
+    if not reference.halted:
+        fields.append('micro_step')
+    return [
+        f'{field}: {getattr(reference, field)} != {getattr(translated, field)}'
+        for field in fields if getattr(reference, field) != getattr(translated, field)
+    ]
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    import sys
+    from assembler import Visitor
+
+    parser = argparse.ArgumentParser(description='Check translated programs against the microcode interpreter')
+    parser.add_argument('files', type=str, nargs='*', help='assembly files')
+    parser.add_argument('-c', '--max-cycles', type=int, default=100000, help='clock limit per run')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='parser frontend')
+    parser.add_argument('--fuzz', type=int, default=0, help='also check this many random RAM images, every byte treated as code')
+    parser.add_argument('--seed', type=int, default=0, help='seed for --fuzz')
+    parser.add_argument('--source', action='store_true', help='print the generated Python')
+
+    args = parser.parse_args()
+
+    failures = 0
+
+    def report(name: 'str', translator: 'Translator', ram: 'list[int]'):
+        global failures
+        # Several limits, so runs are also cut off part way through blocks
+        for limit in sorted({args.max_cycles, args.max_cycles // 3 + 1, 101}):
+            differences = check(translator, ram, limit)
+            if differences:
+                failures += 1
+                print(f'{name} ({limit} clocks): ' + '; '.join(differences), file=sys.stderr)
+                return False
+        return True
+
+    for path in args.files:
+        visitor = Visitor()
+        visitor.parse(path, 16, frontend=args.frontend)
+        translator = Translator.from_visitor(visitor)
+        if args.source:
+            print(translator.source)
+        ram = list(visitor.get_program()[0])
+        if not report(path, translator, ram):
+            continue
+
+        interpreted = Simulator(translator.rom, ram)
+        interpreted.run(args.max_cycles)
+        translated = Simulator(translator.rom, ram)
+        translator.run(translated, args.max_cycles)
+        speedup = translated.cycles_per_second / interpreted.cycles_per_second if interpreted.cycles_per_second else 0
+        print(f'{path}: {len(translator.blocks)} blocks, {translated.cycles_per_second:,.0f} cycles/s ({speedup:.1f}x)')
+
+    rng = random.Random(args.seed)
+    for i in range(args.fuzz):
+        ram = [rng.randrange(256) for _ in range(16)]
+        translator = Translator(ram, range(16))
+        report(f'random image {i} ({bytes(ram).hex()})', translator, ram)
+    if args.fuzz:
+        print(f'{args.fuzz} random images checked')
+
+    sys.exit(1 if failures else 0)
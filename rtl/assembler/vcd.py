@@ -0,0 +1,378 @@
+"""Streaming VCD reader with a seek index, and an eater.v execution log built on it"""
+
+import bisect
+import json
+import os
+
+try:
+    from machine import Control, MachineCode
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode
+
+
+# Bytes of value changes between index checkpoints
+CHECKPOINT_BYTES = 1 << 20
+
+# Bump when the on-disk index layout changes
+INDEX_VERSION = 1
+
+
+def to_int(value: 'str|None') -> 'int|None':
+    """Integer value of a VCD bit string, or None if any bit is x or z"""
+    try:
+        return int(value, 2)
+    except (TypeError, ValueError):
+        return None
+
+
+class Signal:
+    __slots__ = ('name', 'id', 'width')
+
+    def __init__(self, name: 'str', id: 'str', width: 'int'):
+        self.name = name
+        self.id = id
+        self.width = width
+
+
+class VcdReader:
+    """
+    Reads a VCD file without loading it. Opening it scans the header, and
+    the first time-based query makes one pass over the body to build a
+    sparse index: every checkpoint_bytes, the current time, byte offset and
+    value of every signal. The index is saved next to the trace
+    (trace.vcd.idx) and reused while the trace's size and mtime still
+    match, so later queries seek to the nearest checkpoint at or before
+    the window instead of rescanning from the start.
+
+    Values are kept as VCD bit strings ('0101', 'x'); see to_int.
+    """
+
+    def __init__(self, path: 'str', checkpoint_bytes: 'int'=CHECKPOINT_BYTES, index_path: 'str|None'=None):
+        self.path = path
+        self.checkpoint_bytes = checkpoint_bytes
+        self.index_path = index_path if index_path is not None else path + '.idx'
+
+        self.timescale: 'str|None' = None
+        self.signals: 'dict[str, Signal]' = {}
+        self.body_offset = 0
+        self.read_header()
+
+        self.index: 'list[tuple[int, int, dict[str, str]]]|None' = None
+        self.times: 'list[int]' = []
+        self.end_time: 'int|None' = None
+
+    def read_header(self):
+        scope = []
+        tokens = []
+        with open(self.path, 'rb') as file:
+            for line in file:
+                self.body_offset += len(line)
+                tokens.extend(line.decode().split())
+                if not tokens or tokens[-1] != '$end':
+                    continue
+
+                keyword = tokens[0]
+                if keyword == '$scope':
+                    scope.append(tokens[2])
+                elif keyword == '$upscope':
+                    scope.pop()
+                elif keyword == '$var':
+                    # $var wire 16 $ control_o [15:0] $end
+                    width, id, reference = int(tokens[2]), tokens[3], tokens[4]
+                    name = '.'.join(scope + [reference])
+                    self.signals[name] = Signal(name, id, width)
+                elif keyword == '$timescale':
+                    self.timescale = ' '.join(tokens[1:-1])
+                elif keyword == '$enddefinitions':
+                    return
+                tokens = []
+        raise ValueError(f'{self.path} has no $enddefinitions')
+
+    def find(self, name: 'str') -> 'Signal':
+        """
+        Look a signal up by full name (TOP.eater.a_o) or by a dotted suffix
+        (a_o, eater.a_o). Ties on a suffix go to the shallowest scope, as
+        Verilator traces each port both on TOP and in the module.
+        """
+        if name in self.signals:
+            return self.signals[name]
+        matches = [s for s in self.signals.values() if s.name.endswith('.' + name)]
+        if not matches:
+            raise KeyError(f'No signal "{name}" in {self.path}')
+        return min(matches, key=lambda s: s.name.count('.'))
+
+    def stamp(self) -> 'list[int]':
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def load_index(self) -> 'bool':
+        try:
+            with open(self.index_path, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('stamp') != self.stamp() or data.get('checkpoint_bytes') != self.checkpoint_bytes:
+            return False
+        self.index = [tuple(entry) for entry in data['index']]
+        self.end_time = data['end_time']
+        return True
+
+    def save_index(self):
+        data = {
+            'version': INDEX_VERSION,
+            'stamp': self.stamp(),
+            'checkpoint_bytes': self.checkpoint_bytes,
+            'end_time': self.end_time,
+            'index': self.index,
+        }
+        try:
+            with open(self.index_path, 'w') as file:
+                json.dump(data, file)
+        except OSError:
+            # A read-only trace directory only costs a rescan next time
+            pass
+
+    def build_index(self, save: 'bool'=True):
+        if self.index is None and not (save and self.load_index()):
+            self.index = []
+            last = None
+            for time, offset, values in self.scan(self.body_offset, {}, checkpoints=True):
+                if last is None or offset - last >= self.checkpoint_bytes:
+                    self.index.append((time, offset, dict(values)))
+                    last = offset
+                self.end_time = time
+            if save:
+                self.save_index()
+        self.times = [entry[0] for entry in self.index]
+
+    def scan(self, offset: 'int', values: 'dict[str, str]', checkpoints: 'bool'=False):
+        """
+        Parse the body from offset, updating values in place, and yield
+        (time, offset, values) once each timestamp's changes are applied.
+        With checkpoints, the state is also yielded on reaching each '#'
+        line before its changes, with that line's offset, which is what the
+        index needs to resume from.
+        """
+        time = 0
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            pending = False
+            for line in file:
+                if line[:1] == b'#':
+                    if pending:
+                        yield time, offset, values
+                    time = int(line[1:])
+                    if checkpoints:
+                        yield time, offset, values
+                    pending = not checkpoints
+                    offset += len(line)
+                    continue
+                offset += len(line)
+
+                head = line[:1]
+                if head and head in b'01xzXZ':
+                    values[line[1:].strip().decode()] = head.decode().lower()
+                elif head in (b'b', b'B', b'r', b'R'):
+                    value, id = line[1:].split()
+                    values[id.decode()] = value.decode().lower()
+            if pending:
+                yield time, offset, values
+
+    def seek(self, start: 'int') -> 'tuple[int, dict[str, str]]':
+        """(byte offset, values) to resume scanning from so that start is covered"""
+        if self.index is None:
+            self.build_index()
+        i = bisect.bisect_right(self.times, start) - 1
+        if i < 0:
+            return self.body_offset, {}
+        _, offset, values = self.index[i]
+        return offset, dict(values)
+
+    def samples(self, start: 'int'=0, end: 'int|None'=None, names: 'list[str]|None'=None):
+        """
+        Yield (time, {name: value}) for every timestamp in [start, end]
+        where one of names changed, starting with the state at start.
+        """
+        signals = [self.find(name) for name in names] if names is not None else list(self.signals.values())
+        offset, values = self.seek(start)
+        label = lambda state: {signal.name: value for signal, value in zip(signals, state)}
+
+        state = tuple(values.get(signal.id) for signal in signals)
+        previous = None
+        for time, _, values in self.scan(offset, values):
+            if end is not None and time > end:
+                break
+            current = tuple(values.get(signal.id) for signal in signals)
+            if time < start:
+                state = current
+                continue
+            if previous is None and time > start:
+                yield start, label(state)
+                previous = state
+            if current != previous:
+                yield time, label(current)
+                previous = current
+
+        if previous is None and (end is None or start <= end):
+            yield start, label(state)
+
+    def changes(self, start: 'int'=0, end: 'int|None'=None, names: 'list[str]|None'=None):
+        """Yield (time, name, value) for each change of names in [start, end]"""
+        previous = {}
+        for time, values in self.samples(start, end, names):
+            for name, value in values.items():
+                if previous.get(name) != value:
+                    yield time, name, value
+            previous = values
+
+    def value_at(self, time: 'int', names: 'list[str]|None'=None) -> 'dict[str, str]':
+        for _, values in self.samples(time, time, names):
+            return values
+        return {}
+
+
+# (name, bit) for every control signal, in control word order
+CONTROL_BITS = sorted(
+    [(name, bit) for name, bit in vars(Control).items() if name.isupper()],
+    key=lambda item: item[1],
+)
+
+# Signals read for the execution log. The micro-step counter and its
+# ready flag are internal to eater.v; Verilator's --trace includes them.
+EATER_SIGNALS = {
+    'clock': 'clk_i',
+    'control': 'control_o',
+    'pc': 'program_counter_o',
+    'a': 'a_o',
+    'b': 'b_o',
+    'flags': 'flags_o',
+    'step': 'micro_instruction',
+    'ready': 'instruction_ready',
+}
+
+
+def control_names(word: 'int|None') -> 'list[str]':
+    if word is None:
+        return ['?']
+    return [name for name, bit in CONTROL_BITS if word & bit]
+
+
+def execution_log(reader: 'VcdReader', start: 'int'=0, end: 'int|None'=None, statements: 'list|None'=None):
+    """
+    Yield one entry per instruction executed in [start, end]:
+
+        time        trace time of the instruction's first micro-step
+        address     program counter when it was fetched
+        first_step  micro-step it started on
+        steps       control signal names asserted in each micro-step
+        clocks      clocks from its first micro-step to the next instruction's
+        a, b, flags registers once it has finished
+        mnemonic, line   from statements, when given
+
+    Steps are sampled on each rising clock_i where instruction_ready is
+    high, which is when eater.v asserts the word on control_o. A new
+    instruction starts when the micro-step goes back (to 0, or to 1 when
+    its first fetch step was merged into the one before). The final entry
+    of a window that ends mid-instruction is yielded as it stands.
+    """
+    signals = {key: reader.find(name).name for key, name in EATER_SIGNALS.items()}
+
+    by_address = {}
+    for statement in statements or []:
+        if hasattr(statement, 'machine') and statement.address is not None:
+            by_address[statement.address] = statement
+
+    entry = None
+    clocks = 0
+    previous_clock = None
+    previous_step = None
+    for time, values in reader.samples(start, end, list(signals.values())):
+        clock = values[signals['clock']]
+        rising = clock == '1' and previous_clock == '0'
+        previous_clock = clock
+        if not rising:
+            continue
+
+        clocks += 1
+        value = lambda key: to_int(values[signals[key]])
+        if entry is not None:
+            entry['a'], entry['b'], entry['flags'] = value('a'), value('b'), value('flags')
+            entry['clocks'] = clocks
+
+        if value('ready') != 1:
+            continue
+
+        step = value('step')
+        starting = step == 0 if previous_step is None else step is not None and step <= previous_step
+        previous_step = step
+        if starting:
+            if entry is not None:
+                yield entry
+            address = value('pc')
+            entry = {
+                'time': time,
+                'address': address,
+                'first_step': step,
+                'steps': [],
+                'clocks': 0,
+                'a': value('a'),
+                'b': value('b'),
+                'flags': value('flags'),
+            }
+            statement = by_address.get(address)
+            if statement is not None:
+                entry['mnemonic'] = statement.mnemonic
+                entry['line'] = statement.line
+            clocks = 0
+
+        if entry is not None:
+            entry['steps'].append(control_names(value('control')))
+
+    if entry is not None:
+        yield entry
+
+
+def format_entry(entry: 'dict') -> 'str':
+    steps = ' | '.join(' '.join(names) if names else '-' for names in entry['steps'][len(MachineCode.FETCH_CYCLE) - entry.get('first_step', 0):])
+    fmt = lambda v, spec: '--' if v is None else format(v, spec)
+    source = f'{entry.get("mnemonic", ""):<4}' + (f' (line {entry["line"]})' if entry.get('line') else '')
+    return (
+        f'{entry["time"]:>14} {fmt(entry["address"], "X"):>4}  {source:<16}'
+        f'A={fmt(entry["a"], "02X")} B={fmt(entry["b"], "02X")} F={fmt(entry["flags"], "02b")}  {steps}'
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Read eater.v VCD traces')
+    parser.add_argument('file', type=str, help='VCD file (sim/build/trace.vcd)')
+    parser.add_argument('-s', '--start', type=int, default=0, help='window start time')
+    parser.add_argument('-e', '--end', type=int, help='window end time')
+    parser.add_argument('-p', '--program', type=str, help='assembly file to label instructions with')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', help='assembler parser frontend')
+    parser.add_argument('-i', '--isa', type=str, default='eater16', help='ISA profile the program was assembled for')
+    parser.add_argument('-l', '--list', action='store_true', help='list the traced signals')
+    parser.add_argument('-c', '--changes', nargs='+', metavar='SIGNAL', help='print value changes of these signals instead of the execution log')
+    parser.add_argument('--checkpoint-bytes', type=int, default=CHECKPOINT_BYTES, help='trace bytes between index checkpoints')
+
+    args = parser.parse_args()
+
+    reader = VcdReader(args.file, args.checkpoint_bytes)
+
+    if args.list:
+        for signal in reader.signals.values():
+            print(f'{signal.name} [{signal.width}]')
+    elif args.changes:
+        for time, name, value in reader.changes(args.start, args.end, args.changes):
+            print(f'{time:>14} {name} {value}')
+    else:
+        statements = None
+        if args.program:
+            from assembler import Visitor
+            from isa import PROFILES
+            visitor = Visitor()
+            visitor.parse(args.program, PROFILES[args.isa], frontend=args.frontend)
+            statements = visitor.statements
+        for entry in execution_log(reader, args.start, args.end, statements):
+            print(format_entry(entry))
@@ -0,0 +1,299 @@
+"""NumPy model of eater.v that steps many machine instances in lockstep"""
+
+import time
+import numpy as np
+
+try:
+    from machine import Control, MachineCode
+except ModuleNotFoundError:
+    from assembler.machine import Control, MachineCode
+
+
+def sweep_rams(ram: 'list[int]', sweeps: 'dict[int: list[int]]') -> 'np.ndarray':
+    """
+    Build one RAM image per combination of the swept values.
+
+    `sweeps` maps a RAM address (e.g. a `let` variable) to the values
+    it should take; the cartesian product of all sweeps is returned
+    with the first address varying slowest.
+    """
+    base = np.asarray(ram, dtype=np.uint8)
+    if not sweeps:
+        return base[np.newaxis, :].copy()
+
+    grids = np.meshgrid(*[np.asarray(v, dtype=np.uint8) for v in sweeps.values()], indexing='ij')
+    rams = np.repeat(base[np.newaxis, :], grids[0].size, axis=0)
+    for address, grid in zip(sweeps.keys(), grids):
+        rams[:, address] = grid.ravel()
+    return rams
+
+
+class VectorSimulator:
+    """
+    Batched equivalent of `Simulator`: every register, the flags and the RAM
+    are arrays with one row per instance. Each step gathers the control word
+    of every instance from the ROM and only evaluates the `Control` bits that
+    are asserted somewhere in the batch. Rows are dropped from the working set
+    as soon as they halt, so the remaining ones keep stepping in lockstep.
+
+    Instances restart their micro-step counter on Control.NX, so each one
+    keeps its own. While they all sit on the same step (the common case for
+    a batch running one program) the step is tracked as a single number and
+    the ROM is read one column at a time; once they diverge every row is
+    gathered from the flat ROM at its own {flags, opcode, step} address.
+    """
+
+    CLOCKS_PER_STEP = 2
+
+    OPERAND_MASK = 0xF
+
+    def __init__(self, rom: 'list[int]', rams: 'np.ndarray', output_capacity: 'int'=16):
+        rams = np.asarray(rams, dtype=np.uint8)
+        if rams.ndim != 2:
+            raise ValueError(f'Expected a 2D array of RAM images (got {rams.ndim} dimensions)')
+        ram_size = rams.shape[1]
+        if ram_size == 0 or ram_size & (ram_size - 1):
+            raise ValueError(f'RAM size must be a power of 2 (got {ram_size})')
+        if len(rom) != 2**MachineCode.total_bits():
+            raise ValueError(f'ROM must have {2**MachineCode.total_bits()} words (got {len(rom)})')
+
+        # Column s holds micro-step s of every {flags, opcode} pair. Columns
+        # that are identical for every pair (the fetch cycle and the zero
+        # padding) never need a gather.
+        self.rom = np.asarray(rom, dtype=np.uint32)
+        self.step_columns = self.rom.reshape(-1, 2**MachineCode.UINSTR_BITS).T.copy()
+        self.constant_steps = [int(c[0]) if (c == c[0]).all() else None for c in self.step_columns]
+
+        self.initial_rams = rams
+        self.address_mask = ram_size - 1
+        self.output_capacity = output_capacity
+        self.reset()
+
+    @property
+    def instances(self) -> 'int':
+        return self.initial_rams.shape[0]
+
+    def reset(self):
+        n = self.instances
+        self.ram = self.initial_rams.copy()
+        self.a = np.zeros(n, dtype=np.uint8)
+        self.b = np.zeros(n, dtype=np.uint8)
+        self.pc = np.zeros(n, dtype=np.uint8)
+        self.ir = np.zeros(n, dtype=np.uint8)
+        self.mar = np.zeros(n, dtype=np.uint8)
+        self.flags = np.zeros(n, dtype=np.uint16)
+        self.micro_step = np.zeros(n, dtype=np.uint8)
+        self.halted = np.zeros(n, dtype=bool)
+        self.step_counts = np.zeros(n, dtype=np.int64)
+        self.outputs = np.zeros((n, self.output_capacity), dtype=np.uint8)
+        self.output_counts = np.zeros(n, dtype=np.int64)
+        self.steps = 0
+        self.elapsed = 0.0
+
+    @property
+    def cycles(self) -> 'np.ndarray':
+        """Clocks elapsed per instance, frozen at the step each one halted"""
+        return np.where(self.halted, self.step_counts, self.steps) * VectorSimulator.CLOCKS_PER_STEP
+
+    @property
+    def cycles_per_second(self) -> 'float':
+        """Aggregate simulated clocks per second over all instances"""
+        return self.cycles.sum() / self.elapsed if self.elapsed > 0 else 0.0
+
+    def get_outputs(self, instance: 'int') -> 'list[int]':
+        return self.outputs[instance, :self.output_counts[instance]].tolist()
+
+    def _append_output(self, rows: 'np.ndarray', values: 'np.ndarray'):
+        counts = self.output_counts[rows]
+        if counts.size and counts.max() >= self.outputs.shape[1]:
+            grown = np.zeros((self.instances, 2 * self.outputs.shape[1]), dtype=np.uint8)
+            grown[:, :self.outputs.shape[1]] = self.outputs
+            self.outputs = grown
+        self.outputs[rows, counts] = values
+        self.output_counts[rows] += 1
+
+    def run(self, max_cycles: 'int') -> 'np.ndarray':
+        """Step every instance until all have halted or max_cycles clocks have elapsed"""
+        max_steps = max_cycles // VectorSimulator.CLOCKS_PER_STEP
+
+        start = time.perf_counter()
+        while self.steps < max_steps:
+            active = np.flatnonzero(~self.halted)
+            if not active.size:
+                break
+            self._run_rows(active, max_steps)
+        self.elapsed += time.perf_counter() - start
+
+        return self.cycles
+
+    def _run_rows(self, active: 'np.ndarray', max_steps: 'int'):
+        """
+        Step the given rows on compacted copies of their state, returning
+        as soon as any of them halts so the caller can drop those rows.
+        """
+        step_mask = 2**MachineCode.UINSTR_BITS - 1
+        address_mask = self.address_mask
+        flat_rom = self.rom
+        step_columns = self.step_columns
+        constant_steps = self.constant_steps
+
+        count = active.size
+        rows = np.arange(count)
+        a, b, pc, ir, mar = self.a[active], self.b[active], self.pc[active], self.ir[active], self.mar[active]
+        flags, ram = self.flags[active], self.ram[active]
+        halted = np.zeros(count, dtype=bool)
+        opcode_index = None
+
+        # The step every row is on, or None once they diverge
+        micro_step = self.micro_step[active]
+        shared = int(micro_step[0]) if (micro_step == micro_step[0]).all() else None
+
+        while self.steps < max_steps and not halted.any():
+            self.steps += 1
+
+            word = constant_steps[shared] if shared is not None else None
+            if word is not None:
+                asserted = word
+                uniform = True
+            else:
+                # The {flags, opcode} index only changes on FI and II
+                if opcode_index is None:
+                    opcode_index = (flags.astype(np.intp) << MachineCode.OPCODE_BITS) | (ir >> 4)
+                if shared is not None:
+                    word = step_columns[shared][opcode_index]
+                else:
+                    word = flat_rom[(opcode_index << MachineCode.UINSTR_BITS) | micro_step]
+
+                # Instances running in lockstep usually share the same control
+                # word, in which case no per-row masking is needed at all
+                asserted = int(np.bitwise_or.reduce(word))
+                uniform = asserted == int(np.bitwise_and.reduce(word))
+
+            if shared is not None and (uniform or not asserted & Control.NX):
+                if asserted & Control.NX:
+                    shared = 1 if asserted & Control.NF else 0
+                else:
+                    shared = (shared + 1) & step_mask
+            else:
+                if shared is not None:
+                    micro_step = np.full(count, shared, dtype=np.uint8)
+                micro_step = (micro_step + 1) & step_mask
+                if asserted & Control.NX:
+                    np.copyto(micro_step, 0, where=(word & Control.NX).astype(bool))
+                if asserted & Control.NF:
+                    np.copyto(micro_step, 1, where=(word & Control.NF).astype(bool))
+                shared = int(micro_step[0]) if (micro_step == micro_step[0]).all() else None
+
+            if not asserted:
+                continue
+
+            def mask(control):
+                return True if uniform else (word & control).astype(bool)
+
+            def select(control, value):
+                selected = value if uniform else np.where(mask(control), value, 0)
+                return selected.astype(np.uint8, copy=False)
+
+            bus = np.zeros(count, dtype=np.uint8)
+            if asserted & Control.RO:
+                bus |= select(Control.RO, ram[rows, mar])
+            if asserted & Control.IO:
+                bus |= select(Control.IO, ir & VectorSimulator.OPERAND_MASK)
+            if asserted & Control.AO:
+                bus |= select(Control.AO, a)
+            if asserted & Control.CO:
+                bus |= select(Control.CO, pc)
+            if asserted & (Control.EO | Control.FI):
+                wide_a = a.astype(np.int16)
+                wide_b = b.astype(np.int16)
+                if uniform:
+                    total = (wide_a - wide_b) & 0x1FF if asserted & Control.SU else wide_a + wide_b
+                else:
+                    total = np.where(mask(Control.SU), (wide_a - wide_b) & 0x1FF, wide_a + wide_b)
+                if asserted & Control.EO:
+                    bus |= select(Control.EO, total & 0xFF)
+
+            # A jump always takes priority over incrementing the counter
+            if asserted & Control.CE:
+                np.copyto(pc, (pc + 1) & address_mask, where=mask(Control.CE))
+            if asserted & Control.J:
+                np.copyto(pc, bus & address_mask, where=mask(Control.J))
+            if asserted & Control.FI:
+                new_flags = (((total & 0xFF) == 0).astype(np.uint16) << 1) | (total >> 8).astype(np.uint16)
+                np.copyto(flags, new_flags, where=mask(Control.FI))
+                opcode_index = None
+            if asserted & Control.RI:
+                write = rows if uniform else np.flatnonzero(mask(Control.RI))
+                ram[write, mar[write]] = bus[write]
+            if asserted & Control.MI:
+                np.copyto(mar, bus & address_mask, where=mask(Control.MI))
+            if asserted & Control.AI:
+                np.copyto(a, bus, where=mask(Control.AI))
+            if asserted & Control.BI:
+                np.copyto(b, bus, where=mask(Control.BI))
+            if asserted & Control.II:
+                np.copyto(ir, bus, where=mask(Control.II))
+                opcode_index = None
+            if asserted & Control.OI:
+                out = rows if uniform else np.flatnonzero(mask(Control.OI))
+                self._append_output(active[out], bus[out])
+            if asserted & Control.HLT:
+                halt = rows if uniform else np.flatnonzero(mask(Control.HLT))
+                self.step_counts[active[halt]] = self.steps
+                halted[halt] = True
+
+        self.a[active], self.b[active], self.pc[active], self.ir[active], self.mar[active] = a, b, pc, ir, mar
+        self.flags[active], self.ram[active] = flags, ram
+        self.micro_step[active] = shared if shared is not None else micro_step
+        self.halted[active] = halted
+
+
+if __name__ == '__main__':
+    import argparse
+
+    try:
+        from simulator import Simulator, build_rom
+    except ModuleNotFoundError:
+        from assembler.simulator import Simulator, build_rom
+
+    parser = argparse.ArgumentParser(description='Run an eater program over a sweep of initial variable values')
+    parser.add_argument('file', type=str, help='assembly file')
+    parser.add_argument('-s', '--sweep', type=str, action='append', default=[],
+                        help='variable sweep as name=start:stop (e.g. a=0:256), may be repeated')
+    parser.add_argument('-c', '--max-cycles', type=int, default=2**16, help='clock limit per instance')
+    parser.add_argument('--samples', type=int, default=64, help='instances to replay on the scalar simulator')
+
+    args = parser.parse_args()
+
+    from assembler import Visitor
+
+    visitor = Visitor()
+    visitor.parse(args.file, 16)
+    ram, _ = visitor.get_program()
+
+    sweeps = {}
+    for sweep in args.sweep:
+        name, bounds = sweep.split('=')
+        lower, upper = bounds.split(':')
+        sweeps[visitor.variables[name].getAddress()] = range(int(lower), int(upper))
+
+    rom = build_rom()
+    simulator = VectorSimulator(rom, sweep_rams(ram, sweeps))
+    cycles = simulator.run(args.max_cycles)
+
+    halted = int(simulator.halted.sum())
+    print(f'{simulator.instances} instances, {halted} halted, cycles min {cycles.min()} max {cycles.max()}')
+    print(f'vector: {simulator.cycles_per_second:,.0f} cycles/s')
+
+    scalar_cycles = 0
+    scalar_elapsed = 0.0
+    for instance in np.linspace(0, simulator.instances - 1, min(args.samples, simulator.instances)).astype(int):
+        scalar = Simulator(rom, simulator.initial_rams[instance].tolist())
+        scalar.run(args.max_cycles)
+        if scalar.outputs != simulator.get_outputs(instance) or scalar.cycles != cycles[instance]:
+            raise AssertionError(f'Instance {instance} diverges from the scalar simulator')
+        scalar_cycles += scalar.cycles
+        scalar_elapsed += scalar.elapsed
+
+    scalar_rate = scalar_cycles / scalar_elapsed
+    print(f'scalar: {scalar_rate:,.0f} cycles/s ({simulator.cycles_per_second / scalar_rate:.0f}x speedup)')
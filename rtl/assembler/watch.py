@@ -0,0 +1,86 @@
+"""Polling file watcher for regenerating programs and LUTs in a warm process"""
+
+import importlib
+import os
+import sys
+import time
+
+
+MACHINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'machine.py')
+
+# machine.py and the modules that bind names out of it, in import order
+MACHINE_MODULES = ['machine', 'isa', 'rom', 'simulator', 'optimizer', 'frontend', 'assembler']
+
+
+def reload_machine(*extra: 'str'):
+    """
+    Reload machine.py and everything that copied its tables at import time,
+    then the extra modules (named as in sys.modules) in the order given.
+    Both the flat and the assembler.* spellings are reloaded if imported.
+    """
+    for name in MACHINE_MODULES:
+        for qualified in (name, 'assembler.' + name):
+            module = sys.modules.get(qualified)
+            # 'assembler' is the package itself when running from rtl/
+            if module is not None and not hasattr(module, '__path__'):
+                importlib.reload(module)
+
+    for name in extra:
+        if name in sys.modules:
+            importlib.reload(sys.modules[name])
+
+
+class Watcher:
+    """
+    Polls (mtime, size, inode) of each path every interval seconds. Editors
+    that save by renaming a new file over the old one change the inode, so
+    they are caught as well. A path that briefly disappears mid-save is
+    skipped until it comes back.
+    """
+
+    def __init__(self, paths: 'list[str]', interval: 'float'=0.01):
+        self.paths = list(dict.fromkeys(os.path.abspath(path) for path in paths))
+        self.interval = interval
+        self.stamps = {path: self.stamp(path) for path in self.paths}
+
+    @staticmethod
+    def stamp(path: 'str') -> 'tuple[int, int, int]|None':
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def poll(self) -> 'set[str]':
+        changed = set()
+        for path in self.paths:
+            stamp = self.stamp(path)
+            if stamp != self.stamps[path]:
+                self.stamps[path] = stamp
+                if stamp is not None:
+                    changed.add(path)
+        return changed
+
+    def run(self, on_change: 'callable', log=sys.stderr):
+        """
+        Call on_change(changed_paths) after every change until interrupted,
+        reporting how long it took and how long after the save it finished.
+        Exceptions are reported and the watch carries on, so a typo in the
+        source doesn't end the session.
+        """
+        print(f'watching {", ".join(os.path.relpath(path) for path in self.paths)}', file=log)
+        while True:
+            changed = self.poll()
+            if changed:
+                saved = max(self.stamps[path][0] for path in changed) / 1e9
+                start = time.perf_counter()
+                names = ', '.join(sorted(os.path.basename(path) for path in changed))
+                try:
+                    result = on_change(changed)
+                except Exception as e:
+                    print(f'{names}: {type(e).__name__}: {e}', file=log)
+                else:
+                    elapsed = (time.perf_counter() - start) * 1e3
+                    since_save = max(time.time() - saved, 0) * 1e3
+                    print(f'{names}: {result} in {elapsed:.1f} ms ({since_save:.1f} ms after save)', file=log)
+            time.sleep(self.interval)
@@ -0,0 +1,256 @@
+"""Benchmarks for the assembler, LUT generators, timing report parser and CLI start-up"""
+
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from assembler.assembler import Visitor
+from assembler.formatter import format_bytes
+from assembler.isa import IsaProfile
+from hex_gen import gen_instructions, gen_output
+from pretty_timing import Path
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = os.path.join(ROOT, 'assembler', 'examples')
+
+PROGRAM_SIZES = [10, 100, 1000, 10000]
+REPORT_SIZES = [100, 1000, 10000]
+
+# Scripts whose start-up (interpreter plus imports, up to argparse) is timed
+CLIS = [
+    'assembler/assembler.py',
+    'assembler/batch.py',
+    'assembler/simulator.py',
+    'assembler/analyzer.py',
+    'hex_gen.py',
+    'pretty_timing.py',
+    'timing_store.py',
+]
+
+# Bump when benchmarks change in a way that makes old results incomparable
+BENCH_VERSION = 1
+
+
+def synthetic_program(instructions: 'int', seed: 'int'=0) -> 'tuple[str, IsaProfile]':
+    """
+    A program of the given number of instructions mixing every operand
+    kind, with a label every eight instructions for the jumps to target,
+    and the smallest ISA profile it fits in.
+    """
+    rng = random.Random(seed)
+    variables = [f'v{i}' for i in range(8)]
+    lines = [f'let {name} = {rng.randrange(256)}' for name in variables]
+    labels = max(instructions // 8, 1)
+
+    for i in range(instructions - 1):
+        if i % 8 == 0:
+            lines.append(f'l{i // 8}:')
+        kind = rng.randrange(6)
+        if kind == 0:
+            lines.append(f'    {rng.choice(["lda", "add", "sub", "sta", "ldb"])} {rng.choice(variables)}')
+        elif kind == 1:
+            lines.append(f'    {rng.choice(["adi", "sbi", "ldi"])} {rng.randrange(16)}')
+        elif kind == 2:
+            lines.append(f'    {rng.choice(["j", "jc", "jz", "jnc", "jnz"])} l{rng.randrange(labels)}')
+        elif kind == 3:
+            lines.append('    out')
+        else:
+            lines.append(f'    lda {rng.choice(variables)}')
+    lines.append('    hlt')
+
+    ram_size = 16
+    while True:
+        isa = IsaProfile.for_ram_size(ram_size)
+        size = 1 + isa.operand_bytes
+        if instructions * size + len(variables) <= ram_size:
+            return '\n'.join(lines) + '\n', isa
+        ram_size *= 2
+
+
+def synthetic_report(paths: 'int', seed: 'int'=0) -> 'dict':
+    """A nextpnr --report with the given number of critical paths of 3 to 21 hops"""
+    rng = random.Random(seed)
+    cells = ['eater.a_reg_SB_DFFE_Q', 'eater.bus_SB_LUT4_O', 'eater.ram.0.0_RAM', 'eater.sum_SB_CARRY_CO', 'eater.ctrl_SB_LUT4_O_1']
+
+    def endpoint():
+        return {'cell': rng.choice(cells) + str(rng.randrange(40)), 'port': 'O', 'loc': [rng.randint(1, 24), rng.randint(1, 30)]}
+
+    critical_paths = []
+    for _ in range(paths):
+        hops = []
+        for i in range(rng.randint(3, 21)):
+            if i % 2 == 0:
+                hops.append({'type': 'logic' if i else 'clk-to-q', 'from': endpoint(), 'to': endpoint(), 'delay': round(rng.uniform(0.3, 2.0), 3)})
+            else:
+                hops.append({'type': 'routing', 'net': f'eater.net_{rng.randrange(300)}', 'from': endpoint(), 'to': endpoint(), 'delay': round(rng.uniform(0.5, 4.0), 3)})
+        critical_paths.append({'from': 'posedge clk_i', 'to': 'posedge clk_i', 'path': hops})
+
+    return {
+        'utilization': {'ICESTORM_LC': {'available': 7680, 'used': 300}},
+        'fmax': {'clk_i': {'achieved': 50.0, 'constraint': 48.0}},
+        'critical_paths': critical_paths,
+    }
+
+
+def measure(function: 'callable', repeat: 'int'=5) -> 'dict':
+    """
+    Seconds per call. timeit's autorange picks a loop count that runs for
+    at least 0.2 s, then that loop is repeated and the best and median
+    kept; comparisons use the best, being the least noisy.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    runs = [timer.timeit(number) / number for _ in range(repeat)]
+    return {'best': min(runs), 'median': statistics.median(runs), 'loops': number}
+
+
+def measure_startup(script: 'str', repeat: 'int'=5) -> 'dict':
+    """Wall time of 'python script --help', less that of a bare interpreter"""
+    def wall(command: 'list[str]') -> 'list[float]':
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=os.path.dirname(os.path.join(ROOT, script)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            runs.append(time.perf_counter() - start)
+        return runs
+
+    bare = min(wall([sys.executable, '-c', 'pass']))
+    runs = [run - bare for run in wall([sys.executable, os.path.join(ROOT, script), '--help'])]
+    return {'best': min(runs), 'median': statistics.median(runs), 'loops': 1}
+
+
+def benchmarks(workdir: 'str'):
+    """Yield (name, callable returning a measurement) for every benchmark"""
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, '*.asm'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        for frontend in Visitor.FRONTENDS:
+            yield f'parse/{frontend}/{name}', lambda path=path, frontend=frontend: measure(
+                lambda: Visitor().parse(path, 16, frontend=frontend)
+            )
+
+    for size in PROGRAM_SIZES:
+        source, isa = synthetic_program(size)
+        path = os.path.join(workdir, f'synthetic_{size}.asm')
+        with open(path, 'w') as file:
+            file.write(source)
+        for frontend in Visitor.FRONTENDS:
+            yield f'parse/{frontend}/synthetic_{size}', lambda path=path, isa=isa, frontend=frontend: measure(
+                lambda: Visitor().parse(path, isa, frontend=frontend)
+            )
+
+    yield 'lut/gen_instructions', lambda: measure(gen_instructions)
+    yield 'lut/gen_output', lambda: measure(gen_output)
+    instructions, output = gen_instructions(), gen_output()
+    yield 'lut/format_instructions', lambda: measure(lambda: format_bytes(instructions, 3))
+    yield 'lut/format_output', lambda: measure(lambda: format_bytes(output, 1))
+
+    for size in REPORT_SIZES:
+        path = os.path.join(workdir, f'report_{size}.json')
+        with open(path, 'w') as file:
+            json.dump(synthetic_report(size), file)
+        yield f'timing/from_json/{size}', lambda path=path: measure(lambda: Path.from_json(path), repeat=3)
+
+    for script in CLIS:
+        yield f'startup/{script}', lambda script=script: measure_startup(script)
+
+
+def run(pattern: 'str|None'=None, log=sys.stderr) -> 'dict':
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, benchmark in benchmarks(workdir):
+            if pattern is not None and pattern not in name:
+                continue
+            try:
+                results[name] = benchmark()
+            except ModuleNotFoundError as e:
+                # The ANTLR frontend is optional
+                print(f'{name}: skipped ({e})', file=log)
+                continue
+            print(f'{name}: {format_seconds(results[name]["best"])}', file=log)
+
+    return {
+        'version': BENCH_VERSION,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(baseline: 'dict', current: 'dict', threshold: 'float'=0.25) -> 'list[tuple[str, float, float, float, bool]]':
+    """
+    (name, baseline best, current best, ratio, regressed) for every
+    benchmark in both runs, where regressed means slower by more than
+    threshold (0.25 = 25%).
+    """
+    if baseline.get('version') != current.get('version'):
+        raise ValueError(f'Benchmark versions differ ({baseline.get("version")} vs {current.get("version")})')
+
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['best'], result['best']
+        ratio = new / old if old > 0 else float('inf')
+        rows.append((name, old, new, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def format_seconds(seconds: 'float') -> 'str':
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if abs(seconds) >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def format_comparison(rows: 'list[tuple]') -> 'str':
+    width = max([len('benchmark')] + [len(row[0]) for row in rows])
+    lines = [f'{"benchmark":<{width}}{"baseline":>12}{"current":>12}{"ratio":>8}']
+    for name, old, new, ratio, regressed in rows:
+        lines.append(f'{name:<{width}}{format_seconds(old):>12}{format_seconds(new):>12}{ratio:>8.2f}{"  REGRESSION" if regressed else ""}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the assembler, LUT generators and timing tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runner = commands.add_parser('run', help='run the benchmarks')
+    runner.add_argument('-o', type=str, default='bench.json', help='results file')
+    runner.add_argument('-k', '--filter', type=str, help='only run benchmarks whose name contains this')
+    runner.add_argument('-b', '--baseline', type=str, help='compare against this results file afterwards')
+    runner.add_argument('-t', '--threshold', type=float, default=0.25, help='slowdown counted as a regression (0.1 = 10%%)')
+
+    comparer = commands.add_parser('compare', help='compare two results files')
+    comparer.add_argument('baseline', type=str, help='baseline results')
+    comparer.add_argument('current', type=str, help='current results')
+    comparer.add_argument('-t', '--threshold', type=float, default=0.25, help='slowdown counted as a regression (0.1 = 10%%)')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        current = run(args.filter)
+        with open(args.o, 'w') as file:
+            json.dump(current, file, indent=2)
+        baseline_path = args.baseline
+    else:
+        with open(args.current) as file:
+            current = json.load(file)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        rows = compare(baseline, current, args.threshold)
+        print(format_comparison(rows))
+        sys.exit(1 if any(row[4] for row in rows) else 0)
@@ -63,6 +63,8 @@ module eater #(
     wire c_counter_out;        // ~CO
     wire c_jump;               // ~J
     wire c_flags_in;           // ~FI
+    wire c_next;               // NX
+    wire c_next_fetched;       // NF
 
     wire [7:0] bus;
 
@@ -146,9 +148,24 @@ module eater #(
     // boolean expression, so the width warning is turned off.
     // yosys can have issues with synthesizing ROMs if the
     // module doesn't have a valid path in its file.
+`ifdef SIM
+    // The simulator can load a program at run time with +program=<hex>,
+    // so one verilated model serves every program
+    reg [8*1024-1:0] program_path;
+
+    // verilator lint_off WIDTH
+    initial begin
+        if ($value$plusargs("program=%s", program_path))
+            $readmemh(program_path, ram);
+        else if (PROGRAM_HEX)
+            $readmemh(PROGRAM_HEX, ram);
+    end
+    // verilator lint_on WIDTH
+`else
     // verilator lint_off WIDTH
     initial if (PROGRAM_HEX) $readmemh(PROGRAM_HEX, ram);
     // verilator lint_on WIDTH
+`endif
 
     always @(posedge clk_i) begin
         if (c_memory_in)
@@ -224,9 +241,19 @@ module eater #(
             instruction_reg <= bus;
     end
         
+    reg  [17:0] instruction_out;
+
+`ifdef FACTORED_CONTROL
+    // The control store split into its distinct rows and a {flags, opcode}
+    // index, generated by `python3 hex_gen.py control` (see makefile).
+    // It provides control_row, control_rows and CONTROL_ROW_BITS.
+    `include "control_store.vh"
+
+    always @(posedge clk_i)
+        instruction_out <= control_rows[{control_row, micro_instruction}];
+`else
     wire [8:0]  instruction_address;
-    reg  [15:0] instruction_memory [(2**9)-1:0];
-    reg  [15:0] instruction_out;
+    reg  [17:0] instruction_memory [(2**9)-1:0];
 
     always @(posedge clk_i)
         instruction_out <= instruction_memory[instruction_address];
@@ -236,6 +263,7 @@ module eater #(
     // verilator lint_on WIDTH
 
     assign instruction_address = {flag_zero, flag_carry, opcode, micro_instruction};
+`endif
 
     reg instruction_ready;
 
@@ -246,8 +274,11 @@ module eater #(
         end else if (instruction_ready == 0) begin
             instruction_ready <= 1'b1;
         end else begin
+            // NX marks the last micro-step of an instruction, so the
+            // next fetch starts without stepping through the padding.
+            // With NF that step also did the first fetch step (CO|MI).
             instruction_ready <= 1'b0;
-            micro_instruction <= micro_instruction + 1'b1;
+            micro_instruction <= c_next ? {2'b0, c_next_fetched} : micro_instruction + 1'b1;
         end
     end
 
@@ -261,9 +292,25 @@ module eater #(
             halt <= 1'b1;
     end
 
+`ifdef SIM
+    // With +headless the simulator has no display, so every value
+    // latched by OUT is printed and the run ends once halted.
+    reg headless;
+    initial headless = $test$plusargs("headless");
+
+    always @(posedge clk_i) begin
+        if (headless & c_output_in)
+            $display("out %0d", bus);
+        if (headless & halt)
+            $finish;
+    end
+`endif
+
     // In Verilog, vectors like this can be manipulated
     // like regular variables, which is really nice.
     assign {
+        c_next_fetched,
+        c_next,
         c_sum_out,
         c_subtract,
         c_b_in,
@@ -280,9 +327,9 @@ module eater #(
         c_instruction_in,
         c_a_in,
         c_a_out
-    } = instruction_ready ? instruction_out : 16'b0;
+    } = instruction_ready ? instruction_out : 18'b0;
 
-    assign control_o = instruction_out;
+    assign control_o = instruction_out[15:0];
 
     ///////////////////////////////
     // Bus Management
@@ -0,0 +1,112 @@
+"""Content-addressed on-disk cache for generated hex LUTs"""
+
+import hashlib
+import json
+import os
+from assembler import rom
+from assembler.formatter import write_if_changed
+from assembler.machine import Control, MachineCode, machine_code
+
+# Bump when a generator changes its output for the same inputs
+CACHE_VERSION = 2
+
+
+def machine_fingerprint(instructions: 'list[MachineCode]'=machine_code) -> 'dict':
+    """Everything in the machine description that influences generated LUTs"""
+    return {
+        'opcode_bits': MachineCode.OPCODE_BITS,
+        'uinstr_bits': MachineCode.UINSTR_BITS,
+        'flag_bits': MachineCode.Flag.FLAG_BITS,
+        'fetch': MachineCode.FETCH_CYCLE,
+        'instructions': [
+            [
+                mc.opcode,
+                mc.mnemonic,
+                mc.flag.flag if mc.flag is not None else None,
+                mc.invert_flag,
+                mc.arg_type,
+                mc.arg_bits,
+                mc.uinstructions,
+            ]
+            for mc in instructions
+        ],
+        'controls': {name: bit for name, bit in vars(Control).items() if name.isupper()},
+        'rom': rom_fingerprint(),
+    }
+
+
+def rom_fingerprint() -> 'dict':
+    """
+    The default RomBuilder configuration and a hash of rom.py, so changes to
+    the control store layout (end markers, fetch merging) miss the cache
+    """
+    builder = rom.RomBuilder()
+    with open(rom.__file__, 'rb') as file:
+        source = hashlib.sha256(file.read()).hexdigest()
+    return {
+        'end_marker': builder.end_marker,
+        'overlap_fetch': builder.overlap_fetch,
+        'source': source,
+    }
+
+
+def cache_key(lut: 'str', params: 'dict', source_path: 'str|None'=None) -> 'str':
+    """Hash the LUT type, generator parameters, machine table and source file contents"""
+    digest = hashlib.sha256()
+    header = {
+        'version': CACHE_VERSION,
+        'lut': lut,
+        'params': params,
+        'machine': machine_fingerprint(),
+    }
+    digest.update(json.dumps(header, sort_keys=True).encode())
+    if source_path is not None:
+        with open(source_path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class HexCache:
+    """
+    One file per key in a flat directory. Hits refresh the entry's
+    timestamp and the least recently used entries are evicted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, directory: 'str', max_bytes: 'int'=16 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: 'str') -> 'str':
+        return os.path.join(self.directory, key + '.hex')
+
+    def get(self, key: 'str') -> 'bytes|None':
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return content
+
+    def put(self, key: 'str', content: 'bytes'):
+        write_if_changed(self.path(key), content)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.hex'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(path)
+            total -= size
@@ -2,9 +2,14 @@
 
 import sys
 from decimal import Decimal
-from assembler.machine import MachineCode, machine_code
-from assembler.formatter import format_bytes
+from assembler.machine import machine_code
+from assembler.formatter import FORMATS, format_bytes, serialize
 from assembler.assembler import Visitor
+from assembler.isa import PROFILES
+from assembler.rom import FactoredRom, RomBuilder
+from assembler.simulator import Simulator
+from assembler.watch import MACHINE_PATH
+from hex_cache import HexCache, cache_key, write_if_changed
 
 
 def decimal_to_segments(value: 'int|None') -> 'int':
@@ -44,20 +49,64 @@ def gen_output(**_) -> 'list[int]':
 
 
 def gen_instructions(**_) -> 'list[int]':
-
-    instruction_dict = {}
-
-    for instruction in machine_code:
-        instruction_dict.update(instruction.fill_addresses())
-
-    return [instruction_dict[i] for i in range(2**MachineCode.total_bits())]
+    return RomBuilder().build(machine_code)
+
+
+def gen_control_store(**_) -> 'str':
+    """
+    Verilog for eater.v's FACTORED_CONTROL build: the index as a case
+    statement on {flags, opcode}, small enough to become LUTs, and the
+    distinct rows as a memory addressed by {control_row, micro_instruction}.
+    """
+    builder = RomBuilder()
+    factored = FactoredRom(builder, builder.build(machine_code))
+    stats = factored.stats()
+    key_bits = builder.flag_bits + builder.opcode_bits
+    row_bits = factored.row_bits
+
+    lines = [
+        '// Generated by hex_gen.py from assembler/machine.py, do not edit',
+        f'// {stats["rows"]} distinct rows replace the {builder.size}-word control store '
+        f'({stats["row_factored_bits"]} of {stats["flat_bits"]} bits)',
+        '',
+        f'localparam CONTROL_ROW_BITS = {row_bits};',
+        '',
+        'reg [CONTROL_ROW_BITS-1:0] control_row;',
+        '',
+        'always @(*) begin',
+        '    case ({flag_zero, flag_carry, opcode})',
+    ]
+    for key, row in enumerate(factored.index):
+        lines.append(f"        {key_bits}'h{key:02X}: control_row = {row_bits}'d{row};")
+    digits = (factored.word_bits + 3) // 4
+    lines += [
+        f"        default: control_row = {row_bits}'d0;",
+        '    endcase',
+        'end',
+        '',
+        f'reg [{factored.word_bits - 1}:0] control_rows [(2**(CONTROL_ROW_BITS+{builder.uinstr_bits}))-1:0];',
+        '',
+        'integer control_init;',
+        'initial begin',
+        '    for (control_init = 0; control_init < 2**(CONTROL_ROW_BITS+' + str(builder.uinstr_bits) + '); control_init = control_init + 1)',
+        f"        control_rows[control_init] = {factored.word_bits}'h0;",
+    ]
+    for number, row in enumerate(factored.rows):
+        for step, word in enumerate(row):
+            if word:
+                lines.append(f"    control_rows[{number * builder.steps + step}] = {factored.word_bits}'h{word:0{digits}X};")
+    lines += ['end', '']
+    return '\n'.join(lines)
 
 
 def gen_program(**kwargs) -> 'list[int]':
     path = kwargs.pop('path')
+    frontend = kwargs.pop('frontend', 'antlr')
+    isa = kwargs.pop('isa', 'eater16')
+    optimize = kwargs.pop('optimize', False)
 
     visitor = Visitor()
-    visitor.parse(path, 16)
+    visitor.parse(path, PROFILES[isa], frontend=frontend, optimize=optimize)
     return visitor.program
 
 
@@ -66,26 +115,118 @@ def gen_lut(generator: 'callable', width: 'int') -> 'str':
 
 
 lut_methods = {
-    'instructions': (gen_instructions, 2),
+    'instructions': (gen_instructions, 3),
     'output': (gen_output, 1),
     'program': (gen_program, 1),
 }
 
+# Generators of Verilog source rather than LUT data
+text_methods = {
+    'control': gen_control_store,
+}
+
+# Files besides this one (and the program source) that each LUT is generated from
+lut_dependencies = {
+    'control': [MACHINE_PATH],
+    'instructions': [MACHINE_PATH],
+    'output': [],
+    'program': [MACHINE_PATH],
+}
+
+
+def build_lut(lut: 'str', path: 'str|None'=None, frontend: 'str'='antlr', isa: 'str'='eater16',
+              optimize: 'bool'=False, format: 'str'='readmemh', cache: 'HexCache|None'=None) -> 'bytes':
+    if lut in text_methods:
+        return text_methods[lut]().encode()
+
+    generator, width = lut_methods[lut]
+
+    if cache is not None:
+        params = {'width': width, 'frontend': frontend, 'isa': isa, 'optimize': optimize, 'format': format}
+        key = cache_key(lut, params, path if lut == 'program' else None)
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+    content = serialize(generator(path=path, frontend=frontend, isa=isa, optimize=optimize), width, format)
+    if cache is not None:
+        cache.put(key, content)
+    return content
+
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser(description='hex LUT generation tool')
-    parser.add_argument('LUT', type=str, help='LUT type', choices=['instructions', 'output', 'program'])
+    parser.add_argument('LUT', type=str, help='LUT type', choices=['instructions', 'output', 'program', 'control'])
     parser.add_argument('-o', type=str, help='output file')
     parser.add_argument('-p', '--program', type=str, help='assembly file for program LUT generation')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='assembler parser frontend')
+    parser.add_argument('-i', '--isa', type=str, default='eater16', choices=list(PROFILES), help='ISA profile for program LUT generation')
+    parser.add_argument('-O', '--optimize', action='store_true', help='apply peephole optimizations to the program')
+    parser.add_argument('-F', '--format', type=str, default='readmemh', choices=FORMATS, help='output file format')
+    parser.add_argument('-c', '--cache-dir', type=str, help='directory for the content-addressed LUT cache')
+    parser.add_argument('--cache-size', type=int, default=16 * 2**20, help='cache size limit in bytes')
+    parser.add_argument('-w', '--watch', action='store_true', help='stay running and regenerate the LUT whenever its sources change')
+    parser.add_argument('-s', '--stats', action='store_true', help='report the control store size, what factoring saves and the cycles saved by fetch overlap')
+    parser.add_argument('--interval', type=float, default=0.01, help='watch polling interval in seconds')
 
     args = parser.parse_args()
 
-    lut_tuple = lut_methods[args.LUT]
-    lut = format_bytes(lut_tuple[0](path=args.program), lut_tuple[1])
-
+    if args.stats:
+        builder = RomBuilder()
+        stats = FactoredRom(builder, builder.build(machine_code)).stats()
+        print(f'flat control store: {stats["flat_bits"]} bits', file=sys.stderr)
+        for level, count, bits in (('row', 'rows', 'row_factored_bits'), ('word', 'words', 'word_factored_bits')):
+            saved = stats['flat_bits'] - stats[bits]
+            print(
+                f'{level} factored: {stats[count]} distinct {count}, {stats[bits]} bits '
+                f'({saved} saved, {100 * saved / stats["flat_bits"]:.1f}%)',
+                file=sys.stderr,
+            )
+        print('fetch overlap (clocks per instruction):', file=sys.stderr)
+        for mnemonic, taken, serial, overlapped in builder.fetch_savings(machine_code):
+            name = mnemonic if taken else f'{mnemonic} (not taken)'
+            saved = (serial - overlapped) * Simulator.CLOCKS_PER_STEP
+            print(
+                f'    {name:<16}{serial * Simulator.CLOCKS_PER_STEP:>3} -> {overlapped * Simulator.CLOCKS_PER_STEP}'
+                + (f' ({saved} saved)' if saved else ''),
+                file=sys.stderr,
+            )
+
+    cache = HexCache(args.cache_dir, args.cache_size) if args.cache_dir else None
+    options = dict(path=args.program, frontend=args.frontend, isa=args.isa, optimize=args.optimize, format=args.format, cache=cache)
+
+    if args.watch:
+        import importlib
+        import os
+        from assembler.watch import Watcher, reload_machine
+
+        if not args.o:
+            parser.error('--watch needs an output file (-o)')
+
+        # A module copy of this file, so edits to it (or machine.py) can be reloaded
+        module = importlib.import_module('hex_gen')
+        paths = [module.__file__] + lut_dependencies[args.LUT] + ([args.program] if args.LUT == 'program' else [])
+
+        def regenerate(changed: 'set[str]') -> 'str':
+            global module
+            if changed & {MACHINE_PATH, os.path.abspath(module.__file__)}:
+                reload_machine('hex_cache', 'hex_gen')
+                module = sys.modules['hex_gen']
+            written = write_if_changed(args.o, module.build_lut(args.LUT, **options))
+            return f'{"wrote" if written else "unchanged"} {args.o}'
+
+        print(regenerate(set()), file=sys.stderr)
+        try:
+            Watcher(paths, args.interval).run(regenerate)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    lut = build_lut(args.LUT, **options)
+
+    # Leaving an unchanged file alone keeps make from rebuilding everything downstream
     if args.o:
-        with open(args.o, 'w') as file:
-            file.write(lut + '\n')
+        write_if_changed(args.o, lut)
     else:
-        print(lut)
+        sys.stdout.buffer.write(lut)
@@ -1,6 +1,96 @@
+import heapq
 import json
+from array import array
+
+# Characters read from the report at a time while streaming
+CHUNK_SIZE = 1 << 16
+
+
+class ReportReader:
+    """
+    Incremental reader for the top-level values of a large JSON report. Only
+    the value being decoded and a read buffer are ever held in memory.
+    """
+
+    def __init__(self, file, chunk_size: 'int'=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self, size: 'int|None'=None):
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            raise ValueError('Unexpected end of report')
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def skip(self, characters: 'str'=' \t\r\n') -> 'str':
+        """Advance past any of characters and return the next character"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in characters:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self.fill()
+
+    def seek(self, key: 'str'):
+        """
+        Move to the value stored under key. Occurrences of the key as a string
+        value (e.g. a net called "critical_paths") are skipped since they are
+        not followed by a colon.
+        """
+        marker = json.dumps(key)
+        while True:
+            found = self.buffer.find(marker, self.pos)
+            if found < 0:
+                self.pos = max(self.pos, len(self.buffer) - len(marker))
+                self.fill()
+                continue
+            self.pos = found + len(marker)
+            if self.skip() == ':':
+                self.pos += 1
+                self.skip()
+                return
+
+    def decode(self):
+        size = self.chunk_size
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                # Incomplete value; read progressively more so large ones aren't reparsed too often
+                self.fill(size)
+                size *= 2
+
+
+def iter_array(file, key: 'str', chunk_size: 'int'=CHUNK_SIZE):
+    """Yield the elements of the array stored under `key` one at a time"""
+    reader = ReportReader(file, chunk_size)
+    reader.seek(key)
+    if reader.skip() != '[':
+        raise ValueError(f'"{key}" is not an array')
+    reader.pos += 1
+
+    while reader.skip(' \t\r\n,') != ']':
+        yield reader.decode()
+
+
+def read_value(filepath: 'str', key: 'str', default=None):
+    """Decode the value stored under `key`, or return default if the report has none"""
+    with open(filepath, 'r') as file:
+        reader = ReportReader(file)
+        try:
+            reader.seek(key)
+        except ValueError:
+            return default
+        return reader.decode()
+
 
 class Node:
+    __slots__ = ('src', 'dest', 'net', 'type', 'delay')
 
     def __init__(self, src: 'dict', dest: 'dict', type: 'str', delay: 'float', net: 'str'=None):
         self.src = src
@@ -11,6 +101,7 @@ class Node:
 
 
 class Connection:
+    __slots__ = ('logic_node', 'net_node')
 
     columns = ["coord", "src_block", "dest_block", "logic", "net", "signal"]
     @classmethod
@@ -27,15 +118,20 @@ class Connection:
         self.logic_node = logic_node
         self.net_node = net_node
 
+    def get_cells(self) -> 'tuple[str, ...]':
+        """The formatted values of one table row, in `columns` order"""
+        net_node = self.net_node
+        return (
+            f'{self.logic_node.src["loc"][0]}, {self.logic_node.src["loc"][1]}',
+            Connection.get_block(self.logic_node.src["cell"]),
+            Connection.get_block(net_node.dest["cell"]) if net_node is not None else '',
+            f'{self.logic_node.delay:.1f}',
+            f'{net_node.delay:.1f}' if net_node is not None else '',
+            net_node.net if net_node is not None else self.logic_node.dest["cell"],
+        )
+
     def get_row(self):
-        return {
-            "coord": f'{self.logic_node.src["loc"][0]}, {self.logic_node.src["loc"][1]}',
-            "src_block": Connection.get_block(self.logic_node.src["cell"]),
-            "dest_block": Connection.get_block(self.net_node.dest["cell"]) if self.net_node is not None else '',
-            "logic": f'{self.logic_node.delay:.1f}',
-            "net": f'{self.net_node.delay:.1f}' if self.net_node is not None else '',
-            "signal": self.net_node.net if self.net_node is not None else self.logic_node.dest["cell"],
-        }
+        return dict(zip(Connection.columns, self.get_cells()))
 
     def get_logic_delay(self):
         return self.logic_node.delay
@@ -50,13 +146,22 @@ class Connection:
 
 
 class Path:
+    __slots__ = ('src', 'dest', 'connections', 'logic_delay', 'net_delay')
 
     @classmethod
-    def from_json(cls, filepath):
+    def iter_json(cls, filepath):
+        """Stream the critical paths of a report without loading the whole file"""
         with open(filepath, 'r') as file:
-            data = json.load(file)
+            for p in iter_array(file, "critical_paths"):
+                yield Path(p["from"], p["to"], p["path"])
 
-        return [Path(p["from"], p["to"], p["path"]) for p in data["critical_paths"]]
+    @classmethod
+    def from_json(cls, filepath, top: 'int|None'=None):
+        """Every critical path in report order, or only the `top` slowest (slowest first)"""
+        paths = cls.iter_json(filepath)
+        if top is None:
+            return list(paths)
+        return heapq.nlargest(top, paths, key=lambda p: p.get_total_delay())
 
     def __init__(self, src: 'str', dest: 'str', path_dict: 'list[dict]'):
         self.src = src
@@ -69,67 +174,199 @@ class Path:
                 net_node = Node(path_dict[i+1]["from"], path_dict[i+1]["to"], path_dict[i+1]["type"], path_dict[i+1]["delay"], net=path_dict[i+1]["net"])
             self.connections.append(Connection(logic_node, net_node))
 
-        column_names = [p[0] for p in self.connections[0].get_row().items()]
-        self.column_widths = {n: 0 for n in column_names}
-        self.get_column_widths()
-
-    def get_column_widths(self):
-        for connection in self.connections:
-            row = connection.get_row()
-            for key, item in row.items():
-                if len(item) > self.column_widths[key]:
-                    self.column_widths[key] = len(item)
-        for key in self.column_widths:
-            if len(key) > self.column_widths[key]:
-                self.column_widths[key] = len(key)
+        self.logic_delay = sum(map(lambda c: c.get_logic_delay(), self.connections))
+        self.net_delay = sum(map(lambda c: c.get_net_delay(), self.connections))
 
-    def format_cell(self, value, column_name):
-        return value + " " + " " * (self.column_widths[column_name] - len(value))
+    def get_total_delay(self):
+        return self.logic_delay + self.net_delay
 
     def get_path_string(self):
-        logic_delay = sum(map(lambda c: c.get_logic_delay(), self.connections))
-        net_delay = sum(map(lambda c: c.get_net_delay(), self.connections))
-        total_delay = logic_delay + net_delay
-
-        rows = []
-        rows.append([self.format_cell(key, key) for key, _ in self.column_widths.items()])
-        rows.append(['-'*width + ' ' for _, width in self.column_widths.items()])
-        for conn in self.connections:
-            rows.append([self.format_cell(row, col) for col, row in conn.get_row().items()])
-
-        rows.append(['-'*width + ' ' for _, width in self.column_widths.items()])
-        rown_items = {"logic": f'{logic_delay:.1f}', "net": f'{net_delay:.1f}', "signal": f'{total_delay:.1f}'}
-
-        rown = []
-        for col, width in self.column_widths.items():
-            value = rown_items.get(col, '')
-            rown.append(self.format_cell(value, col))
-        rows.append(rown)
+        # Each row is formatted once and the widths are taken from those same strings
+        rows = [conn.get_cells() for conn in self.connections]
+        widths = [len(name) for name in Connection.columns]
+        for row in rows:
+            widths = [max(width, len(value)) for width, value in zip(widths, row)]
+
+        rule = ''.join('-'*width + ' ' for width in widths)
+        totals = {"logic": f'{self.logic_delay:.1f}', "net": f'{self.net_delay:.1f}', "signal": f'{self.get_total_delay():.1f}'}
+
+        lines = [f'{self.src} -> {self.dest}']
+        lines.append(''.join(name.ljust(width) + ' ' for name, width in zip(Connection.columns, widths)))
+        lines.append(rule)
+        lines.extend(''.join(value.ljust(width) + ' ' for value, width in zip(row, widths)) for row in rows)
+        lines.append(rule)
+        lines.append(''.join(totals.get(name, '').ljust(width) + ' ' for name, width in zip(Connection.columns, widths)))
+
+        return '\n'.join(lines)
+
+
+def load_numpy():
+    """numpy if it is installed, imported on first use so only -a pays for it"""
+    try:
+        import numpy
+    except ModuleNotFoundError:
+        return None
+    return numpy
+
+
+class TimingIndex:
+    """
+    Columnar index over the connections of many paths. Every connection is
+    one entry in each column; nets, block types and tile coordinates are
+    interned so they are stored as small integer ids:
+
+        path      index of the path the connection belongs to
+        net       id into `nets`, or -1 for the final connection of a path
+        block     id into `blocks` (Connection.get_block of the source cell)
+        tile      id into `tiles`, the (x, y) location of the source cell
+        logic     logic delay (ns)
+        net_delay routing delay (ns)
+    """
+
+    def __init__(self):
+        self.nets: 'list[str]' = []
+        self.blocks: 'list[str]' = []
+        self.tiles: 'list[tuple[int, int]]' = []
+        self._ids = ({}, {}, {})
+
+        self.path = array('l')
+        self.net = array('l')
+        self.block = array('l')
+        self.tile = array('l')
+        self.logic = array('d')
+        self.net_delay = array('d')
+        self.paths = 0
 
-        output_string = f'{self.src} -> {self.dest}' + '\n'
-        output_string += '\n'.join([''.join(row) for row in rows])
-
-        return output_string
+    @classmethod
+    def from_json(cls, filepath):
+        index = cls()
+        for path in Path.iter_json(filepath):
+            index.add(path)
+        return index
+
+    def _intern(self, table: 'int', values: 'list', key) -> 'int':
+        ids = self._ids[table]
+        id = ids.get(key)
+        if id is None:
+            id = ids[key] = len(values)
+            values.append(key)
+        return id
+
+    def add(self, path: 'Path'):
+        for conn in path.connections:
+            src = conn.logic_node.src
+            net_node = conn.net_node
+            self.path.append(self.paths)
+            self.net.append(self._intern(0, self.nets, net_node.net) if net_node is not None else -1)
+            self.block.append(self._intern(1, self.blocks, Connection.get_block(src["cell"])))
+            self.tile.append(self._intern(2, self.tiles, (src["loc"][0], src["loc"][1])))
+            self.logic.append(conn.logic_node.delay)
+            self.net_delay.append(net_node.delay if net_node is not None else 0.0)
+        self.paths += 1
+
+    def _sums(self, ids: 'array', size: 'int', weights: 'array|None') -> 'list':
+        np = load_numpy()
+        if np is not None:
+            keys = np.frombuffer(ids, dtype=np.int64 if ids.itemsize == 8 else np.int32)
+            values = None if weights is None else np.frombuffer(weights, dtype=np.float64)
+            return np.bincount(keys, weights=values, minlength=size).tolist()
+        totals = [0 for _ in range(size)]
+        if weights is None:
+            for key in ids:
+                totals[key] += 1
+        else:
+            for key, value in zip(ids, weights):
+                totals[key] += value
+        return totals
+
+    def block_delays(self) -> 'list[tuple[str, int, float, float]]':
+        """(block type, connections, logic delay, net delay), slowest first"""
+        size = len(self.blocks)
+        counts = self._sums(self.block, size, None)
+        logic = self._sums(self.block, size, self.logic)
+        net = self._sums(self.block, size, self.net_delay)
+        rows = [(self.blocks[i], int(counts[i]), logic[i], net[i]) for i in range(size)]
+        return sorted(rows, key=lambda r: r[2] + r[3], reverse=True)
+
+    def top_nets(self, n: 'int'=10) -> 'list[tuple[str, int, float]]':
+        """(net, critical paths it appears on, total routing delay) for the n most common nets"""
+        np = load_numpy()
+        if np is not None:
+            nets = np.frombuffer(self.net, dtype=np.int64 if self.net.itemsize == 8 else np.int32)
+            paths = np.frombuffer(self.path, dtype=np.int64 if self.path.itemsize == 8 else np.int32)
+            routed = nets >= 0
+            # One key per (net, path) pair, so each net counts once per path
+            pairs = np.unique(nets[routed].astype(np.int64) * max(self.paths, 1) + paths[routed])
+            counts = np.bincount(pairs // max(self.paths, 1), minlength=len(self.nets)).tolist()
+            delays = np.bincount(nets[routed], weights=np.frombuffer(self.net_delay)[routed], minlength=len(self.nets)).tolist()
+        else:
+            counts = [0 for _ in self.nets]
+            delays = [0.0 for _ in self.nets]
+            for net, path in set(zip(self.net, self.path)):
+                if net >= 0:
+                    counts[net] += 1
+            for net, delay in zip(self.net, self.net_delay):
+                if net >= 0:
+                    delays[net] += delay
+        order = heapq.nlargest(n, range(len(self.nets)), key=lambda i: (counts[i], delays[i]))
+        return [(self.nets[i], int(counts[i]), delays[i]) for i in order]
+
+    def hotspots(self, n: 'int'=10) -> 'list[tuple[tuple[int, int], int, float]]':
+        """(tile, connections, total delay) for the n tiles carrying the most delay"""
+        size = len(self.tiles)
+        counts = self._sums(self.tile, size, None)
+        logic = self._sums(self.tile, size, self.logic)
+        net = self._sums(self.tile, size, self.net_delay)
+        order = heapq.nlargest(n, range(size), key=lambda i: logic[i] + net[i])
+        return [(self.tiles[i], int(counts[i]), logic[i] + net[i]) for i in order]
+
+    def get_report_string(self, n: 'int'=10) -> 'str':
+        lines = [f'{self.paths} paths, {len(self.logic)} connections', '']
+
+        lines.append(f'{"block":<8}{"conns":>8}{"logic":>10}{"net":>10}{"net %":>8}')
+        for block, count, logic, net in self.block_delays():
+            total = logic + net
+            lines.append(f'{block or "-":<8}{count:>8}{logic:>10.1f}{net:>10.1f}{100 * net / total if total else 0:>7.1f}%')
+
+        lines.append('')
+        nets = self.top_nets(n)
+        width = max([len("net")] + [len(net) for net, _, _ in nets])
+        lines.append(f'{"net":<{width}}{"paths":>8}{"delay":>10}')
+        for net, count, delay in nets:
+            lines.append(f'{net:<{width}}{count:>8}{delay:>10.1f}')
+
+        lines.append('')
+        lines.append(f'{"tile":<10}{"conns":>8}{"delay":>10}')
+        for (x, y), count, delay in self.hotspots(n):
+            lines.append(f'{f"{x}, {y}":<10}{count:>8}{delay:>10.1f}')
+
+        return '\n'.join(lines)
 
 if __name__ == '__main__':
 
     import argparse
+    import sys
 
     parser = argparse.ArgumentParser(description='Present nextpnr timing analysis in a readable format')
     parser.add_argument('file', help="report JSON file")
     parser.add_argument('-o', help="output file name", default=None, type=str, dest="outfile")
+    parser.add_argument('-n', '--top', help="only show the N slowest paths", default=None, type=int)
+    parser.add_argument('-a', '--aggregate', help="report delay by block type, net and tile across all paths", action='store_true')
 
     args = parser.parse_args()
 
-    paths = Path.from_json(args.file)
-
-    output = '\n\n'.join([p.get_path_string() for p in paths])
-
-    if args.outfile is not None:
-        with open(args.outfile, 'w') as file:
-            file.write(output)
-    else:
-        print(output)
-
-
-
+    paths = Path.iter_json(args.file) if args.top is None else Path.from_json(args.file, args.top)
+
+    file = open(args.outfile, 'w') if args.outfile is not None else sys.stdout
+    try:
+        if args.aggregate:
+            index = TimingIndex.from_json(args.file)
+            file.write(index.get_report_string(args.top or 10))
+        else:
+            for i, path in enumerate(paths):
+                file.write(('\n\n' if i else '') + path.get_path_string())
+        if args.outfile is None:
+            file.write('\n')
+    finally:
+        if args.outfile is not None:
+            file.close()
@@ -1,11 +1,15 @@
-
 #include <cstdio>
+#include <cstdlib>
+#include <memory>
+#include <string>
 
 #include "Veater.h"
 #include "verilated.h"
 #include "verilated_vcd_c.h"
 
+#ifndef NO_DISPLAY
 #include "eater_display.h"
+#endif
 
 #define CLOCK_FREQUENCY 8
 
@@ -14,6 +18,9 @@
 #define CLOCK_NS CLOCK_SECS * 1e9
 #define CLOCK_PS CLOCK_SECS * 1e12
 
+// Clocks a headless run may take before it is reported as not halting
+#define DEFAULT_MAX_CYCLES 1000000
+
 void tick(Veater* tb, VerilatedVcdC *tfp, unsigned logicStep)
 {
 
@@ -35,24 +42,53 @@ void tick(Veater* tb, VerilatedVcdC *tfp, unsigned logicStep)
     #endif
 }
 
+// Value of a +name=value plusarg, or fallback if it wasn't given
+uint64_t plusarg_value(const char* name, uint64_t fallback)
+{
+    std::string prefix = std::string("+") + name + "=";
+    std::string match = Verilated::commandArgsPlusMatch(name);
+    if (match.rfind(prefix, 0) != 0)
+        return fallback;
+    return std::strtoull(match.c_str() + prefix.size(), nullptr, 0);
+}
+
 int main(int argc, char** argv)
 {
     Verilated::commandArgs(argc, argv);
     Verilated::traceEverOn(true);
 
+    // +headless runs without a display until the program halts (or
+    // +max-cycles=N clocks pass), with eater.v printing every OUT.
+    // +program=<hex> picks the program at run time in either mode.
+    bool headless = std::string(Verilated::commandArgsPlusMatch("headless")) == "+headless";
+    uint64_t max_cycles = plusarg_value("max-cycles", DEFAULT_MAX_CYCLES);
+
+    #ifdef NO_DISPLAY
+        // eater.v only prints OUT values and $finishes on HLT under +headless
+        if (!headless)
+        {
+            std::fprintf(stderr, "%s: built without a display, run it with +headless\n", argv[0]);
+            return 1;
+        }
+    #endif
+
     Veater *tb = new Veater;
     VerilatedVcdC* tfp = new VerilatedVcdC;
 
-    EaterDisplay<600, 300, 5> display(
-        CLOCK_FREQUENCY,
-        tb->seven_seg_o,
-        tb->seven_seg_com_o,
-        tb->program_counter_o,
-        tb->flags_o,
-        tb->control_o,
-        tb->a_o,
-        tb->b_o
-    );
+    #ifndef NO_DISPLAY
+        std::unique_ptr<EaterDisplay<600, 300, 5>> display;
+        if (!headless)
+            display = std::make_unique<EaterDisplay<600, 300, 5>>(
+                CLOCK_FREQUENCY,
+                tb->seven_seg_o,
+                tb->seven_seg_com_o,
+                tb->program_counter_o,
+                tb->flags_o,
+                tb->control_o,
+                tb->a_o,
+                tb->b_o
+            );
+    #endif
 
     uint32_t logicStep = 0;
 
@@ -66,10 +102,26 @@ int main(int argc, char** argv)
     tb->reset_i = 0;
     tick(tb, tfp, ++logicStep);
 
-    for (int i = 0; i < 65536; i++)
+    if (headless)
+    {
+        uint64_t cycles = 0;
+        while (!Verilated::gotFinish() && cycles < max_cycles)
+        {
+            tick(tb, tfp, ++logicStep);
+            cycles++;
+        }
+        std::printf("cycles %llu\n", (unsigned long long) cycles);
+        std::printf("%s\n", Verilated::gotFinish() ? "halted" : "timeout");
+    }
+    else
     {
-        tick(tb, tfp, ++logicStep);
-        display.Process();
+        for (int i = 0; i < 65536; i++)
+        {
+            tick(tb, tfp, ++logicStep);
+            #ifndef NO_DISPLAY
+                display->Process();
+            #endif
+        }
     }
 
     tb->final();
@@ -0,0 +1,131 @@
+"""Run a directory of programs through one headless build of the Verilator model"""
+
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from assembler.batch import assemble_batch, expand_paths
+from assembler.isa import PROFILES
+from assembler.simulator import Simulator, build_rom
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SIM_DIR = os.path.join(ROOT, 'sim')
+MODEL = os.path.join(SIM_DIR, 'build', 'headless', 'eater')
+
+# eater.v has 16 bytes of RAM
+ISA = PROFILES['eater16']
+
+
+def build_model(log=None) -> 'str':
+    """Verilate and compile the headless model (make is a no-op once it is built)"""
+    subprocess.run(['make', '-C', SIM_DIR, 'headless'], check=True, stdout=log, stderr=log)
+    return MODEL
+
+
+def parse_run(stdout: 'str') -> 'dict':
+    """OUT values, cycle count and halt status from the model's output"""
+    result = {'outputs': [], 'cycles': None, 'halted': False}
+    for line in stdout.splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'out':
+            result['outputs'].append(int(value))
+        elif key == 'cycles':
+            result['cycles'] = int(value)
+        elif key == 'halted':
+            result['halted'] = True
+    return result
+
+
+def run_program(model: 'str', hex_path: 'str', max_cycles: 'int') -> 'dict':
+    # The model opens the instruction and output LUTs relative to sim/
+    command = [model, '+headless', f'+program={os.path.abspath(hex_path)}', f'+max-cycles={max_cycles}']
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=SIM_DIR, capture_output=True, text=True, check=False)
+    result = parse_run(completed.stdout)
+    result['time'] = time.perf_counter() - start
+    if completed.returncode != 0:
+        result['error'] = completed.stderr.strip() or f'exited with {completed.returncode}'
+    return result
+
+
+def reference_outputs(hex_path: 'str', max_cycles: 'int') -> 'list[int]':
+    """OUT values of the Python model over the same number of clocks"""
+    with open(hex_path) as file:
+        ram = [int(word, 16) for word in file.read().split()]
+    simulator = Simulator(build_rom(), ram)
+    return simulator.run(max_cycles)
+
+
+def run_batch(paths: 'list[str]', model: 'str', max_cycles: 'int'=1000000, frontend: 'str'='antlr',
+              jobs: 'int|None'=None, check: 'bool'=False) -> 'list[dict]':
+    """
+    Assemble every path and run it on the model, jobs programs at a time.
+    With check, each program's outputs are compared with the Python model's.
+    """
+    entries = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        manifest = assemble_batch(paths, out_dir, ISA, frontend=frontend, jobs=jobs)
+
+        runnable = [entry for entry in manifest['entries'] if entry['error'] is None]
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            runs = list(pool.map(lambda entry: run_program(model, entry['output'], max_cycles), runnable))
+
+        results = dict(zip([entry['source'] for entry in runnable], runs))
+        for entry in manifest['entries']:
+            result = {'source': entry['source'], 'error': entry['error']}
+            if entry['source'] in results:
+                result.update(results[entry['source']])
+                if check and result.get('error') is None:
+                    expected = reference_outputs(entry['output'], max_cycles)
+                    # A run cut short by max_cycles can stop a few outputs apart
+                    length = len(result['outputs']) if result['halted'] else min(len(expected), len(result['outputs']))
+                    result['matches'] = result['outputs'][:length] == expected[:length] and (
+                        not result['halted'] or len(expected) == len(result['outputs']))
+            entries.append(result)
+
+    return entries
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    from assembler.assembler import Visitor
+
+    parser = argparse.ArgumentParser(description='Run programs through the headless Verilator model')
+    parser.add_argument('files', type=str, nargs='+', help='assembly files, directories or glob patterns')
+    parser.add_argument('-c', '--max-cycles', type=int, default=1000000, help='clock limit per program')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='programs run at once (defaults to the CPU count)')
+    parser.add_argument('-f', '--frontend', type=str, default='antlr', choices=Visitor.FRONTENDS, help='parser frontend')
+    parser.add_argument('--check', action='store_true', help='compare outputs with the Python model')
+    parser.add_argument('--no-build', action='store_true', help='use the existing model instead of running make')
+
+    args = parser.parse_args()
+
+    patterns = [os.path.join(path, '**', '*.asm') if os.path.isdir(path) else path for path in args.files]
+    paths = expand_paths(patterns)
+
+    model = MODEL if args.no_build else build_model(log=sys.stderr)
+    if not os.path.exists(model):
+        parser.error(f'{model} does not exist (run make -C sim headless)')
+
+    start = time.perf_counter()
+    entries = run_batch(paths, model, args.max_cycles, args.frontend, args.jobs, args.check)
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for entry in entries:
+        if entry['error'] is not None:
+            failed += 1
+            print(f'{entry["source"]}: {entry["error"]}', file=sys.stderr)
+            continue
+        status = 'halted' if entry['halted'] else 'timeout'
+        check = '' if 'matches' not in entry else ('  ok' if entry['matches'] else '  MISMATCH')
+        failed += entry.get('matches') is False
+        outputs = ' '.join(str(value) for value in entry['outputs'][:16])
+        print(f'{entry["source"]}: {status} after {entry["cycles"]} cycles, {len(entry["outputs"])} outputs [{outputs}]{check}')
+    print(f'{len(entries) - failed}/{len(entries)} programs passed in {elapsed:.3f} s')
+
+    sys.exit(1 if failed else 0)
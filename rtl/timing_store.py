@@ -0,0 +1,282 @@
+"""SQLite history of nextpnr timing and utilization reports"""
+
+import os
+import sqlite3
+import subprocess
+import time
+
+from pretty_timing import Path, read_value
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id          INTEGER PRIMARY KEY,
+    timestamp   REAL NOT NULL,
+    label       TEXT,
+    target_freq REAL,
+    fmax        REAL,
+    report      TEXT
+);
+CREATE TABLE IF NOT EXISTS clocks (
+    build_id    INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    clock       TEXT NOT NULL,
+    achieved    REAL,
+    target      REAL
+);
+CREATE TABLE IF NOT EXISTS utilization (
+    build_id    INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    resource    TEXT NOT NULL,
+    used        INTEGER,
+    available   INTEGER
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id          INTEGER PRIMARY KEY,
+    build_id    INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+    rank        INTEGER NOT NULL,
+    key         TEXT NOT NULL,
+    src         TEXT,
+    dest        TEXT,
+    logic_delay REAL,
+    net_delay   REAL,
+    delay       REAL
+);
+CREATE TABLE IF NOT EXISTS hops (
+    path_id     INTEGER NOT NULL REFERENCES paths(id) ON DELETE CASCADE,
+    position    INTEGER NOT NULL,
+    cell        TEXT,
+    x           INTEGER,
+    y           INTEGER,
+    net         TEXT,
+    logic_delay REAL,
+    net_delay   REAL
+);
+CREATE INDEX IF NOT EXISTS builds_timestamp ON builds(timestamp);
+CREATE INDEX IF NOT EXISTS clocks_build ON clocks(build_id);
+CREATE INDEX IF NOT EXISTS utilization_build ON utilization(build_id);
+CREATE UNIQUE INDEX IF NOT EXISTS paths_build_rank ON paths(build_id, rank);
+CREATE INDEX IF NOT EXISTS paths_key ON paths(key, build_id);
+CREATE INDEX IF NOT EXISTS hops_path ON hops(path_id, position);
+"""
+
+
+def path_key(path: 'Path') -> 'str':
+    """
+    Identify a path across builds by its start and end cells, since the
+    report's from/to fields only name clock edges.
+    """
+    first = path.connections[0].logic_node.src["cell"]
+    last = path.connections[-1]
+    end = last.net_node.dest["cell"] if last.net_node is not None else last.logic_node.dest["cell"]
+    return f'{path.src}:{first} -> {path.dest}:{end}'
+
+
+def git_label() -> 'str|None':
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None if result.returncode == 0 else None
+
+
+class TimingStore:
+    """
+    Each ingested report becomes one row of `builds` holding the achieved
+    Fmax (the slowest clock) and target frequency, plus its per-clock Fmax,
+    utilization and worst paths with every hop.
+    """
+
+    def __init__(self, path: 'str'):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, report: 'str', target_freq: 'float|None'=None, label: 'str|None'=None,
+               timestamp: 'float|None'=None, top: 'int'=50) -> 'int':
+        """Store a report and return its build id"""
+        clocks = read_value(report, 'fmax', {})
+        utilization = read_value(report, 'utilization', {})
+        paths = Path.from_json(report, top)
+
+        achieved = [c.get('achieved') for c in clocks.values() if c.get('achieved') is not None]
+        if target_freq is None:
+            targets = [c.get('constraint') for c in clocks.values() if c.get('constraint') is not None]
+            target_freq = max(targets) if targets else None
+
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO builds (timestamp, label, target_freq, fmax, report) VALUES (?, ?, ?, ?, ?)',
+                (timestamp if timestamp is not None else os.path.getmtime(report), label, target_freq,
+                 min(achieved) if achieved else None, os.path.abspath(report)),
+            )
+            build = cursor.lastrowid
+
+            self.connection.executemany(
+                'INSERT INTO clocks (build_id, clock, achieved, target) VALUES (?, ?, ?, ?)',
+                [(build, name, c.get('achieved'), c.get('constraint')) for name, c in clocks.items()],
+            )
+            self.connection.executemany(
+                'INSERT INTO utilization (build_id, resource, used, available) VALUES (?, ?, ?, ?)',
+                [(build, name, u.get('used'), u.get('available')) for name, u in utilization.items()],
+            )
+
+            for rank, path in enumerate(paths):
+                cursor = self.connection.execute(
+                    'INSERT INTO paths (build_id, rank, key, src, dest, logic_delay, net_delay, delay) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (build, rank, path_key(path), path.src, path.dest, path.logic_delay, path.net_delay, path.get_total_delay()),
+                )
+                self.connection.executemany(
+                    'INSERT INTO hops (path_id, position, cell, x, y, net, logic_delay, net_delay) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        (cursor.lastrowid, i, c.logic_node.src["cell"], c.logic_node.src["loc"][0], c.logic_node.src["loc"][1],
+                         c.net_node.net if c.net_node is not None else None, c.get_logic_delay(), c.get_net_delay())
+                        for i, c in enumerate(path.connections)
+                    ],
+                )
+        return build
+
+    def resolve(self, reference: 'str|int') -> 'int':
+        """
+        Turn a build reference into an id: a positive id, or 0/-1/-2... for the
+        latest, the one before it and so on.
+        """
+        reference = int(reference)
+        if reference > 0:
+            row = self.connection.execute('SELECT id FROM builds WHERE id = ?', (reference,)).fetchone()
+        else:
+            row = self.connection.execute(
+                'SELECT id FROM builds ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?', (-reference,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f'No build {reference}')
+        return row[0]
+
+    def builds(self, limit: 'int'=20) -> 'list[tuple]':
+        """(id, timestamp, label, target_freq, fmax) for the most recent builds"""
+        return self.connection.execute(
+            'SELECT id, timestamp, label, target_freq, fmax FROM builds ORDER BY timestamp DESC, id DESC LIMIT ?', (limit,)
+        ).fetchall()
+
+    def build(self, build: 'int') -> 'tuple':
+        return self.connection.execute(
+            'SELECT id, timestamp, label, target_freq, fmax FROM builds WHERE id = ?', (build,)
+        ).fetchone()
+
+    def hops(self, path_id: 'int') -> 'list[tuple]':
+        return self.connection.execute(
+            'SELECT cell, x, y, net, logic_delay, net_delay FROM hops WHERE path_id = ? ORDER BY position', (path_id,)
+        ).fetchall()
+
+    def diff(self, old: 'int', new: 'int', threshold: 'float'=0.5) -> 'dict':
+        """
+        Compare two builds path by path. A path regresses when its delay grew
+        by more than threshold ns. Paths only present in one build are listed
+        separately, since they fell into or out of that build's worst set.
+        """
+        rows = self.connection.execute(
+            '''
+            SELECT o.key, o.delay, n.delay
+            FROM paths o JOIN paths n ON n.key = o.key AND n.build_id = ?
+            WHERE o.build_id = ?
+            ORDER BY n.delay - o.delay DESC
+            ''',
+            (new, old),
+        ).fetchall()
+        only = lambda a, b: [
+            (key, delay) for key, delay in self.connection.execute(
+                'SELECT key, delay FROM paths p WHERE build_id = ? AND NOT EXISTS '
+                '(SELECT 1 FROM paths q WHERE q.build_id = ? AND q.key = p.key) ORDER BY delay DESC',
+                (a, b),
+            )
+        ]
+
+        return {
+            'old': self.build(old),
+            'new': self.build(new),
+            'paths': [(key, a, b, b - a, b - a > threshold) for key, a, b in rows],
+            'added': only(new, old),
+            'removed': only(old, new),
+        }
+
+
+def format_diff(diff: 'dict', fmax_threshold: 'float'=1.0) -> 'tuple[str, bool]':
+    """The diff as a table, and whether anything regressed"""
+    old, new = diff['old'], diff['new']
+    lines = []
+    regressed = False
+
+    fmax_delta = None
+    if old[4] is not None and new[4] is not None:
+        fmax_delta = new[4] - old[4]
+        regressed |= -fmax_delta > fmax_threshold
+    describe = lambda b: f'#{b[0]} {b[2] or ""} {time.strftime("%Y-%m-%d %H:%M", time.localtime(b[1]))}'.replace('  ', ' ')
+    lines.append(f'{describe(old)} -> {describe(new)}')
+    if fmax_delta is not None:
+        flag = '  REGRESSION' if -fmax_delta > fmax_threshold else ''
+        lines.append(f'fmax {old[4]:.2f} -> {new[4]:.2f} MHz ({fmax_delta:+.2f}){flag}')
+
+    if diff['paths']:
+        width = max(len('path'), max(len(p[0]) for p in diff['paths']))
+        lines.append('')
+        lines.append(f'{"path":<{width}}{"old":>9}{"new":>9}{"delta":>9}')
+        for key, a, b, delta, flagged in diff['paths']:
+            regressed |= flagged
+            lines.append(f'{key:<{width}}{a:>9.2f}{b:>9.2f}{delta:>+9.2f}{"  REGRESSION" if flagged else ""}')
+
+    for title, entries in (('new worst paths', diff['added']), ('no longer among the worst', diff['removed'])):
+        if entries:
+            lines.append('')
+            lines.append(f'{title}:')
+            lines.extend(f'  {key} ({delay:.2f} ns)' for key, delay in entries)
+
+    return '\n'.join(lines), regressed
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Timing and utilization history of nextpnr builds')
+    parser.add_argument('-d', '--db', type=str, default='timing.db', help='SQLite database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='store a nextpnr report')
+    ingest.add_argument('report', type=str, help='report JSON file')
+    ingest.add_argument('-f', '--freq', type=float, help='target frequency in MHz (TARGET_FREQ)')
+    ingest.add_argument('-l', '--label', type=str, help='build label (git describe by default)')
+    ingest.add_argument('-n', '--top', type=int, default=50, help='worst paths to keep')
+
+    listing = commands.add_parser('list', help='show recent builds')
+    listing.add_argument('-n', '--limit', type=int, default=20, help='builds to show')
+
+    compare = commands.add_parser('diff', help='compare two builds path by path')
+    compare.add_argument('old', type=str, nargs='?', default='-1', help='build id, or -1, -2... counting back from the latest')
+    compare.add_argument('new', type=str, nargs='?', default='0', help='build id, or 0 for the latest')
+    compare.add_argument('-t', '--threshold', type=float, default=0.5, help='path delay increase (ns) counted as a regression')
+    compare.add_argument('-F', '--fmax-threshold', type=float, default=1.0, help='Fmax decrease (MHz) counted as a regression')
+
+    args = parser.parse_args()
+
+    store = TimingStore(args.db)
+    try:
+        if args.command == 'ingest':
+            build = store.ingest(args.report, args.freq, args.label or git_label(), top=args.top)
+            print(f'stored build #{build}')
+        elif args.command == 'list':
+            for id, timestamp, label, target, fmax in store.builds(args.limit):
+                when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+                target = f'{target:.1f}' if target is not None else '-'
+                fmax = f'{fmax:.2f}' if fmax is not None else '-'
+                print(f'#{id:<6}{when}  {target:>7} MHz target  {fmax:>8} MHz  {label or ""}')
+        else:
+            try:
+                old, new = store.resolve(args.old), store.resolve(args.new)
+            except KeyError as e:
+                parser.error(e.args[0])
+            text, regressed = format_diff(store.diff(old, new, args.threshold), args.fmax_threshold)
+            print(text)
+            sys.exit(1 if regressed else 0)
+    finally:
+        store.close()